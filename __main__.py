@@ -1,5 +1,7 @@
+import sys
 import argparse
 import microtaxa
+from microtaxa.codec_names import CODECS, PARALLEL_GZIP
 
 
 __VERSION__ = '1.0.2-beta'
@@ -96,6 +98,31 @@ OPTIONAL = [
             'help': 'hard clip <int> bp from 5\' end of read 2 (default: %(default)s)',
         }
     },
+    {
+        'keys': ['--exact-match'],
+        'properties': {
+            'action': 'store_true',
+            'help': 'assign reads identical to a reference sequence at 100%% identity by hashing, only align the rest with glsearch; ties are among identical references only, not the longer references containing the read that glsearch also reports at 100%%',
+        }
+    },
+    {
+        'keys': ['--forward-primer'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'default': None,
+            'help': 'with --exact-match, hash the reference amplicon region after this primer (IUPAC codes allowed) (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--reverse-primer'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'default': None,
+            'help': 'with --exact-match, hash the reference amplicon region before the reverse complement of this primer (default: %(default)s)',
+        }
+    },
     {
         'keys': ['--colormap'],
         'properties': {
@@ -128,6 +155,185 @@ OPTIONAL = [
             'help': 'number of CPU threads (default: %(default)s)',
         }
     },
+    {
+        'keys': ['--glsearch-threads-per-worker'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': 4,
+            'help': 'queries are split into shards aligned by concurrent glsearch36 workers, each with this many threads (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--kmer-prefilter-top-k'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': 0,
+            'help': 'align each query shard only against the top <int> references per query by shared k-mers, 0 for exhaustive search (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--kmer-prefilter-validation-size'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': 0,
+            'help': 'also search the first <int> queries exhaustively and report how often the prefiltered best hit differs (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--intermediate-codec'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'choices': CODECS,
+            'default': PARALLEL_GZIP,
+            'help': 'compression of intermediate fastq files in the workdir, "none" trades disk space for speed; with --trimmer trim_galore, gzip-fast and parallel-gzip do not apply to its output, which trim_galore gzips itself (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--trimmer'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'choices': ['trim_galore', 'numpy'],
+            'default': 'trim_galore',
+            'help': 'read trimmer, "numpy" is built in, applies the same rules without FastQC reports (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--read-merger'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'choices': ['pear', 'numpy'],
+            'default': 'pear',
+            'help': 'paired-end read merger, "numpy" is built in and needs no PEAR installation (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--validate-read-merger'],
+        'properties': {
+            'action': 'store_true',
+            'help': 'also merge reads with the other merger and report the agreement to <outdir>/read-merger-validation',
+        }
+    },
+    {
+        'keys': ['--boxplot-max-p-value'],
+        'properties': {
+            'type': float,
+            'required': False,
+            'default': None,
+            'help': 'only draw boxplots of taxa with P value <= <float> (default: all taxa)',
+        }
+    },
+    {
+        'keys': ['--boxplot-adjusted-p-value'],
+        'properties': {
+            'action': 'store_true',
+            'help': 'apply --boxplot-max-p-value to Benjamini-Hochberg adjusted P values',
+        }
+    },
+    {
+        'keys': ['--boxplot-top-n'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': None,
+            'help': 'only draw boxplots of the <int> taxa with the smallest P values of each group pair (default: all taxa)',
+        }
+    },
+    {
+        'keys': ['--boxplot-pdf'],
+        'properties': {
+            'action': 'store_true',
+            'help': 'draw the boxplots of each group pair as pages of one PDF instead of one PNG per taxon',
+        }
+    },
+    {
+        'keys': ['--heatmap-large-matrix'],
+        'properties': {
+            'action': 'store_true',
+            'help': 'draw heatmap cells as one rasterized image without borders, for thousands of taxa',
+        }
+    },
+    {
+        'keys': ['--heatmap-top-n'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': None,
+            'help': 'only plot the top <int> taxa in heatmaps, ranked by --heatmap-rank-by, plus the "Others" row of unassigned reads (default: all taxa)',
+        }
+    },
+    {
+        'keys': ['--heatmap-rank-by'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'choices': ['mean', 'prevalence'],
+            'default': 'mean',
+            'help': 'rank taxa for --heatmap-top-n by mean relative abundance or by the number of samples present (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--heatmap-count-transform'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'choices': ['log-pseudocount', 'relative-abundance', 'cpm', 'clr', 'vst'],
+            'default': 'log-pseudocount',
+            'help': 'transform of the count heatmap: log10(count + 1), fraction or counts per million reads of each sample, centered log-ratio, or log2(CPM + 1) (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--rarefaction-depth'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': None,
+            'help': 'rarefy every sample to <int> reads after aggregation, samples with fewer reads are dropped (default: no rarefaction)',
+        }
+    },
+    {
+        'keys': ['--rarefaction-draws'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': 1,
+            'help': 'number of rarefied count tables written, the first one is analyzed (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--rarefaction-seed'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': 0,
+            'help': 'random seed of rarefaction (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--output-formats'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'nargs': '+',
+            'choices': ['parquet', 'hdf5', 'biom'],
+            'default': [],
+            'help': 'also write count and percent identity tables as Parquet (needs pyarrow), HDF5 or BIOM 2.1 (need h5py), with integer taxon codes in taxonomy.csv (default: CSV only)',
+        }
+    },
+    {
+        'keys': ['--resume'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'default': None,
+            'help': 'path to the workdir of a crashed run, only missing or stale stages are re-run (default: %(default)s)',
+        }
+    },
     {
         'keys': ['-d', '--debug'],
         'properties': {
@@ -152,6 +358,38 @@ OPTIONAL = [
     },
 ]
 
+BUILD_INDEX_COMMAND = 'build-index'
+BUILD_INDEX_PROG = f'python microtaxa {BUILD_INDEX_COMMAND}'
+BUILD_INDEX_DESCRIPTION = 'Build a memory-mapped index of the reference fasta once, later runs look up taxon labels without parsing the fasta'
+BUILD_INDEX_REQUIRED = [
+    {
+        'keys': ['-r', '--ref-fa'],
+        'properties': {
+            'type': str,
+            'required': True,
+            'help': 'path to the reference fasta file, e.g. SILVA database',
+        }
+    },
+]
+BUILD_INDEX_OPTIONAL = [
+    {
+        'keys': ['--index-root'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'default': None,
+            'help': 'directory of indices keyed by reference checksum, runs find indices in "<ref-fa>.index" (default: <ref-fa>.index)',
+        }
+    },
+    {
+        'keys': ['-h', '--help'],
+        'properties': {
+            'action': 'help',
+            'help': 'show this help message',
+        }
+    },
+]
+
 
 class EntryPoint:
 
@@ -198,8 +436,61 @@ class EntryPoint:
             publication_figure=args.publication_figure,
             outdir=args.outdir,
             threads=args.threads,
-            debug=args.debug)
+            debug=args.debug,
+            resume=args.resume,
+            exact_match=args.exact_match,
+            forward_primer=args.forward_primer,
+            reverse_primer=args.reverse_primer,
+            glsearch_threads_per_worker=args.glsearch_threads_per_worker,
+            kmer_prefilter_top_k=args.kmer_prefilter_top_k,
+            kmer_prefilter_validation_size=args.kmer_prefilter_validation_size,
+            intermediate_codec=args.intermediate_codec,
+            read_merger=args.read_merger,
+            validate_read_merger=args.validate_read_merger,
+            trimmer=args.trimmer,
+            boxplot_max_p_value=args.boxplot_max_p_value,
+            boxplot_adjusted_p_value=args.boxplot_adjusted_p_value,
+            boxplot_top_n=args.boxplot_top_n,
+            boxplot_pdf=args.boxplot_pdf,
+            heatmap_large_matrix=args.heatmap_large_matrix,
+            heatmap_top_n=args.heatmap_top_n,
+            heatmap_rank_by=args.heatmap_rank_by,
+            heatmap_count_transform=args.heatmap_count_transform,
+            rarefaction_depth=args.rarefaction_depth,
+            rarefaction_draws=args.rarefaction_draws,
+            rarefaction_seed=args.rarefaction_seed,
+            output_formats=args.output_formats)
+
+
+class BuildIndexEntryPoint(EntryPoint):
+
+    def set_parser(self):
+        self.parser = argparse.ArgumentParser(
+            prog=BUILD_INDEX_PROG,
+            description=BUILD_INDEX_DESCRIPTION,
+            add_help=False,
+            formatter_class=argparse.RawTextHelpFormatter)
+
+    def add_required_arguments(self):
+        group = self.parser.add_argument_group('required arguments')
+        for item in BUILD_INDEX_REQUIRED:
+            group.add_argument(*item['keys'], **item['properties'])
+
+    def add_optional_arguments(self):
+        group = self.parser.add_argument_group('optional arguments')
+        for item in BUILD_INDEX_OPTIONAL:
+            group.add_argument(*item['keys'], **item['properties'])
+
+    def run(self):
+        args = self.parser.parse_args(sys.argv[2:])
+        print(f'Start building MicroTaxa {__VERSION__} reference index\n', flush=True)
+        microtaxa.build_index(
+            ref_fa=args.ref_fa,
+            index_root=args.index_root)
 
 
 if __name__ == '__main__':
-    EntryPoint().main()
+    if len(sys.argv) > 1 and sys.argv[1] == BUILD_INDEX_COMMAND:
+        BuildIndexEntryPoint().main()
+    else:
+        EntryPoint().main()
@@ -1,8 +1,15 @@
 import os
 from shutil import rmtree
+from typing import Optional, List
 from .template import Settings
 from .microtaxa import MicroTaxa
 from .utils import get_temp_path
+from .codec_names import PARALLEL_GZIP
+from .merge import PEAR
+from .trimming import TRIM_GALORE
+from .heatmap import MEAN_ABUNDANCE
+from .normalization import LOG_PSEUDOCOUNT
+from .reference_index import BuildReferenceIndex
 
 
 def entrypoint(
@@ -20,15 +27,39 @@ def entrypoint(
         publication_figure: bool,
         outdir: str,
         threads: int,
-        debug: bool):
+        debug: bool,
+        resume: Optional[str] = None,
+        exact_match: bool = False,
+        forward_primer: Optional[str] = None,
+        reverse_primer: Optional[str] = None,
+        glsearch_threads_per_worker: Optional[int] = None,
+        kmer_prefilter_top_k: int = 0,
+        kmer_prefilter_validation_size: int = 0,
+        intermediate_codec: str = PARALLEL_GZIP,
+        read_merger: str = PEAR,
+        validate_read_merger: bool = False,
+        trimmer: str = TRIM_GALORE,
+        boxplot_max_p_value: Optional[float] = None,
+        boxplot_adjusted_p_value: bool = False,
+        boxplot_top_n: Optional[int] = None,
+        boxplot_pdf: bool = False,
+        heatmap_large_matrix: bool = False,
+        heatmap_top_n: Optional[int] = None,
+        heatmap_rank_by: str = MEAN_ABUNDANCE,
+        heatmap_count_transform: str = LOG_PSEUDOCOUNT,
+        rarefaction_depth: Optional[int] = None,
+        rarefaction_draws: int = 1,
+        rarefaction_seed: int = 0,
+        output_formats: Optional[List[str]] = None):
 
     settings = Settings(
-        workdir=get_temp_path(prefix='./microtaxa_workdir_'),
+        workdir=get_temp_path(prefix='./microtaxa_workdir_') if resume is None else resume,
         outdir=outdir,
         threads=threads,
         debug=debug,
         mock=False,
-        for_publication=publication_figure)
+        for_publication=publication_figure,
+        intermediate_codec=intermediate_codec)
 
     for d in [settings.workdir, settings.outdir]:
         os.makedirs(d, exist_ok=True)
@@ -44,7 +75,45 @@ def entrypoint(
         clip_r1_5_prime=clip_r1_5_prime,
         clip_r2_5_prime=clip_r2_5_prime,
         colormap=colormap,
-        invert_colors=invert_colors)
+        invert_colors=invert_colors,
+        exact_match=exact_match,
+        forward_primer=forward_primer,
+        reverse_primer=reverse_primer,
+        glsearch_threads_per_worker=glsearch_threads_per_worker,
+        kmer_prefilter_top_k=kmer_prefilter_top_k,
+        kmer_prefilter_validation_size=kmer_prefilter_validation_size,
+        read_merger=read_merger,
+        validate_read_merger=validate_read_merger,
+        trimmer=trimmer,
+        boxplot_max_p_value=boxplot_max_p_value,
+        boxplot_adjusted_p_value=boxplot_adjusted_p_value,
+        boxplot_top_n=boxplot_top_n,
+        boxplot_pdf=boxplot_pdf,
+        heatmap_large_matrix=heatmap_large_matrix,
+        heatmap_top_n=heatmap_top_n,
+        heatmap_rank_by=heatmap_rank_by,
+        heatmap_count_transform=heatmap_count_transform,
+        rarefaction_depth=rarefaction_depth,
+        rarefaction_draws=rarefaction_draws,
+        rarefaction_seed=rarefaction_seed,
+        output_formats=output_formats)
 
     if not debug:
         rmtree(settings.workdir)
+
+
+def build_index(
+        ref_fa: str,
+        index_root: Optional[str] = None):
+
+    settings = Settings(
+        workdir='.',
+        outdir='.',
+        threads=1,
+        debug=False,
+        mock=False,
+        for_publication=False)
+
+    BuildReferenceIndex(settings).main(
+        ref_fa=ref_fa,
+        index_root=index_root)
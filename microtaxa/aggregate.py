@@ -1,8 +1,21 @@
+import json
+import numpy as np
 import pandas as pd
-from os.path import basename
-from typing import List, Dict, Tuple
-from .utils import FastaParser
+from os.path import basename, exists, getsize
+from typing import List, Dict, Tuple, Optional
+from .utils import FastaParser, get_read_stats_json
+from .matrix import TaxonMatrix
 from .template import Processor
+from .reference_index import ReferenceIndex, find_reference_index
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+    import pyarrow.compute as pyarrow_compute
+except ImportError:  # optional, for faster parsing of large glsearch outputs
+    pyarrow, pyarrow_csv, pyarrow_compute = None, None, None
+
+
+OTHERS = 'Others'  # row of the reads not assigned to any taxon
 
 
 class Aggregate(Processor):
@@ -11,10 +24,13 @@ class Aggregate(Processor):
     min_percent_identity: float
     ref_fa: str
     query_fastas: List[str]
+    abundance_tsv: Optional[str]
 
-    count_df: pd.DataFrame
-    percent_id_mean_df: pd.DataFrame
-    percent_id_std_df: pd.DataFrame
+    sample_ids: List[str]
+    stats_dfs: List[pd.DataFrame]
+    count_df: TaxonMatrix
+    percent_id_mean_df: TaxonMatrix
+    percent_id_std_df: TaxonMatrix
     subject_id_to_taxon: Dict[str, str]
     sample_id_to_total_count: Dict[str, int]
 
@@ -23,19 +39,29 @@ class Aggregate(Processor):
             blast_tabular_tsvs: List[str],
             min_percent_identity: float,
             ref_fa: str,
-            query_fastas: List[str]) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+            query_fastas: List[str],
+            abundance_tsv: Optional[str] = None) -> Tuple[TaxonMatrix, TaxonMatrix, TaxonMatrix]:
+        """
+        If `abundance_tsv` is given (from Dereplicate), the blast tabular tsvs are hits of unique sequences,
+        which are expanded back to per-sample counts by their abundances
+
+        Returns sparse count, percent identity mean and std matrices, see TaxonMatrix.to_dataframe()
+        """
 
         self.blast_tabular_tsvs = blast_tabular_tsvs
         self.min_percent_identity = min_percent_identity
         self.ref_fa = ref_fa
         self.query_fastas = query_fastas
+        self.abundance_tsv = abundance_tsv
 
-        self.count_df = pd.DataFrame()
-        self.percent_id_mean_df = pd.DataFrame()
-        self.percent_id_std_df = pd.DataFrame()
-        for tsv in self.blast_tabular_tsvs:
-            self.process_one(tsv=tsv)
-        self.count_df.fillna(0, inplace=True)
+        self.sample_ids = []
+        self.stats_dfs = []
+        if self.abundance_tsv is None:
+            for tsv in self.blast_tabular_tsvs:
+                self.process_one(tsv=tsv)
+        else:
+            self.process_dereplicated()
+        self.build_matrices()
 
         self.set_subject_id_to_taxon()
         self.set_sample_id_to_total_count()
@@ -49,25 +75,78 @@ class Aggregate(Processor):
 
         sample_id = basename(tsv)[:-len('.tsv')]
 
-        count_series = query_df.groupby('Subject ID').size()
-        count_series.name = sample_id  # column name after join
-        count_series.index.name = None
-        self.count_df = self.count_df.join(count_series, how='outer')
+        grouped = query_df.groupby('Subject ID')['Percent Identity']
+        stats_df = pd.DataFrame({
+            'Count': grouped.size(),
+            'Mean': grouped.mean(),
+            'Std': grouped.std(),
+        }).reset_index()
+        stats_df['Sample ID'] = sample_id
+
+        self.sample_ids.append(sample_id)
+        self.stats_dfs.append(stats_df)
+
+    def process_dereplicated(self):
+        """
+        Same statistics as process_one(), with each unique sequence weighted by its 'Count' in the sample,
+        computed for all samples at once
+        """
+        query_df = pd.concat([
+            ReadBlastTsv(self.settings).main(tsv=tsv, min_percent_identity=self.min_percent_identity)
+            for tsv in self.blast_tabular_tsvs
+        ])
+        abundance_df = pd.read_csv(self.abundance_tsv, sep='\t', dtype={'Query ID': str, 'Sample ID': str})
+        df = abundance_df.merge(query_df, on='Query ID', how='inner')
+
+        keys = ['Sample ID', 'Subject ID']
+        df['Weighted'] = df['Percent Identity'] * df['Count']
+        stats_df = df.groupby(keys)[['Count', 'Weighted']].sum()
+        stats_df['Mean'] = stats_df['Weighted'] / stats_df['Count']
+
+        df = df.join(stats_df['Mean'], on=keys)
+        df['Squares'] = (df['Percent Identity'] - df['Mean']) ** 2 * df['Count']
+        sum_of_squares = df.groupby(keys)['Squares'].sum()
+        count = stats_df['Count']
+        stats_df['Std'] = np.sqrt(sum_of_squares / (count - 1)).where(count > 1)  # ddof=1 like pandas std()
 
-        percent_id_mean_series = query_df.groupby('Subject ID')['Percent Identity'].mean()
-        percent_id_mean_series.name = sample_id  # column name after join
-        percent_id_mean_series.index.name = None
-        self.percent_id_mean_df = self.percent_id_mean_df.join(percent_id_mean_series, how='outer')
+        self.sample_ids = [basename(fa)[:-len('.fasta')] for fa in self.query_fastas]
+        self.stats_dfs = [stats_df.reset_index()]
 
-        percent_id_std_series = query_df.groupby('Subject ID')['Percent Identity'].std()
-        percent_id_std_series.name = sample_id  # column name after join
-        percent_id_std_series.index.name = None
-        self.percent_id_std_df = self.percent_id_std_df.join(percent_id_std_series, how='outer')
+    def build_matrices(self):
+        """
+        All (sample, subject) records into sparse subject x sample matrices in one go,
+        sorted by subject ID and with samples in input order, including samples without any hit
+        """
+        stats_df = pd.concat(self.stats_dfs, ignore_index=True)
+        subject_ids = np.sort(stats_df['Subject ID'].astype(str).unique())
+        rows = np.searchsorted(subject_ids, stats_df['Subject ID'].astype(str))
+        columns = pd.Index(self.sample_ids).get_indexer(stats_df['Sample ID'].astype(str))
+
+        matrices = {}
+        for column, fill_value in [('Count', 0.), ('Mean', np.nan), ('Std', np.nan)]:
+            matrices[column] = TaxonMatrix.from_coordinates(
+                rows=rows,
+                columns=columns,
+                data=stats_df[column].to_numpy(dtype=np.float64),
+                index=subject_ids,
+                column_names=self.sample_ids,
+                fill_value=fill_value)
+
+        self.count_df = matrices['Count']
+        self.percent_id_mean_df = matrices['Mean']
+        self.percent_id_std_df = matrices['Std']
 
     def set_subject_id_to_taxon(self):
+        index_dir = find_reference_index(self.ref_fa)
+        if index_dir is not None:  # built by build-index, look up only the subjects that were hit
+            self.logger.info(f'Use reference index "{index_dir}"')
+            self.subject_id_to_taxon = ReferenceIndex(index_dir).subject_id_to_header(
+                subject_ids=[str(s) for s in self.count_df.index])
+            return
+
         self.subject_id_to_taxon = {}
         with FastaParser(self.ref_fa) as parser:
-            for head, seq in parser:
+            for head in parser.headers():  # sequences are not needed
                 subject_id = head.split(' ')[0]
                 self.subject_id_to_taxon[subject_id] = head
 
@@ -75,25 +154,54 @@ class Aggregate(Processor):
         self.sample_id_to_total_count = {}
         for fa in self.query_fastas:
             sample_id = basename(fa)[:-len('.fasta')]
-            count = 0
-            with FastaParser(fa) as parser:
-                for _ in parser:
-                    count += 1
-            self.sample_id_to_total_count[sample_id] = count
+            self.sample_id_to_total_count[sample_id] = self.__count_reads(fa)
+
+    def __count_reads(self, fa: str) -> int:
+        read_stats_json = get_read_stats_json(fa)
+        if exists(read_stats_json):  # written by FastqToFasta, no need to parse the fasta again
+            with open(read_stats_json) as fh:
+                return json.load(fh)['Read Count']
+
+        with FastaParser(fa) as parser:
+            return parser.count()
 
     def calculate_unmapped_read_counts(self):
-        for sample_id in self.count_df.columns:
-            total = self.sample_id_to_total_count[sample_id]
-            unmapped = total - self.count_df[sample_id].sum()
-            self.count_df.at['Others', sample_id] = unmapped
+        totals = np.array([self.sample_id_to_total_count[s] for s in self.count_df.columns], dtype=np.float64)
+        unmapped = totals - self.count_df.column_sums()
+        self.count_df = self.count_df.append_row(label=OTHERS, row=unmapped)
 
     def label_rows_with_taxon(self):
-        self.count_df.rename(index=self.subject_id_to_taxon, inplace=True)
-        self.percent_id_mean_df.rename(index=self.subject_id_to_taxon, inplace=True)
-        self.percent_id_std_df.rename(index=self.subject_id_to_taxon, inplace=True)
+        self.count_df = self.count_df.rename(index=self.subject_id_to_taxon)
+        self.percent_id_mean_df = self.percent_id_mean_df.rename(index=self.subject_id_to_taxon)
+        self.percent_id_std_df = self.percent_id_std_df.rename(index=self.subject_id_to_taxon)
 
 
 class ReadBlastTsv(Processor):
+    """
+    Reads only the Query ID, Subject ID and Percent Identity columns of BLAST tabular (-m 8) output,
+    dropping rows below `min_percent_identity` block by block while parsing
+
+    The multithreaded pyarrow csv reader is used if pyarrow is installed, otherwise the pandas C parser
+    """
+
+    COLUMNS = [
+        'Query ID',
+        'Subject ID',
+        'Percent Identity',
+        'Alignment Length',
+        'Number of Mismatches',
+        'Number of Gap Openings',
+        'Query Start',
+        'Query End',
+        'Subject Start',
+        'Subject End',
+        'E-value',
+        'Bit Score',
+    ]
+    USECOLS = COLUMNS[:3]
+    BLOCK_SIZE = 2**26  # bytes per pyarrow block
+    CHUNK_SIZE = 2**20  # rows per pandas chunk
+    TIE_BREAK_SEED = 0  # aggregation does not go through StageCache, a changed seed applies to the next run
 
     tsv: str
     min_percent_identity: float
@@ -109,41 +217,104 @@ class ReadBlastTsv(Processor):
         self.tsv = tsv
         self.min_percent_identity = min_percent_identity
 
-        self.df = pd.read_csv(tsv, sep='\t', header=None, names=[
-            'Query ID',
-            'Subject ID',
-            'Percent Identity',
-            'Alignment Length',
-            'Number of Mismatches',
-            'Number of Gap Openings',
-            'Query Start',
-            'Query End',
-            'Subject Start',
-            'Subject End',
-            'E-value',
-            'Bit Score'
-        ])
+        if getsize(self.tsv) == 0:  # no hits
+            self.df = pd.DataFrame({
+                'Query ID': pd.Series(dtype=str),
+                'Subject ID': pd.Series(dtype=str),
+                'Percent Identity': pd.Series(dtype=float),
+            })
+        elif pyarrow_csv is not None:
+            self.read_with_pyarrow()
+        else:
+            self.read_with_pandas()
+
+        self.set_query_df()
 
-        self.df = self.df[[
-            'Query ID',
-            'Subject ID',
-            'Percent Identity',
-        ]]
+        self.query_df['Subject ID'] = self.query_df['Subject ID'].astype(str)  # pyarrow reads it dictionary-encoded
 
-        self.df = self.df[self.df['Percent Identity'] >= self.min_percent_identity]
+        return self.query_df
 
-        self.df = self.df.sample(  # shuffle
-            frac=1.
-        ).sort_values(
-            by='Percent Identity',  # high to low
-            ascending=False
-        )
+    def set_query_df(self):
+        """
+        Best hit of each query by grouped arg-max in linear time, in the order queries first appear
 
-        self.query_df = self.df.drop_duplicates(
-            subset='Query ID',  # unique Query ID
-            keep='first'
-        ).reset_index(
-            drop=True
-        )
+        Ties in Percent Identity are broken by the smallest seeded hash of (Query ID, Subject ID),
+        which is random across subjects but identical between runs
+        """
+        query_codes, query_ids = pd.factorize(self.df['Query ID'])
+        n_queries = len(query_ids)
+        percent_identity = self.df['Percent Identity'].to_numpy(dtype=np.float64)
 
-        return self.query_df
+        best_percent_identity = np.full(n_queries, -np.inf)
+        np.maximum.at(best_percent_identity, query_codes, percent_identity)
+        is_best = np.flatnonzero(percent_identity == best_percent_identity[query_codes])
+
+        tie_hash = self.tie_hash(rows=is_best)  # hash only the candidates, mostly one per query
+        min_hash = np.full(n_queries, np.iinfo(np.uint64).max, dtype=np.uint64)
+        np.minimum.at(min_hash, query_codes[is_best], tie_hash)
+        is_chosen = is_best[tie_hash == min_hash[query_codes[is_best]]]
+
+        position = np.full(n_queries, len(self.df), dtype=np.int64)
+        np.minimum.at(position, query_codes[is_chosen], is_chosen)  # first row if (query, subject) is duplicated
+
+        self.query_df = self.df.iloc[position].reset_index(drop=True)
+
+    def tie_hash(self, rows: np.ndarray) -> np.ndarray:
+        hash_key = f'{self.TIE_BREAK_SEED:016d}'  # siphash key, 16 characters
+        df = self.df.iloc[rows]
+        query_hash = pd.util.hash_pandas_object(df['Query ID'], index=False, hash_key=hash_key).to_numpy()
+        subject_hash = pd.util.hash_pandas_object(df['Subject ID'], index=False, hash_key=hash_key).to_numpy()
+        return splitmix64(query_hash ^ splitmix64(subject_hash))
+
+    def read_with_pyarrow(self):
+        reader = pyarrow_csv.open_csv(
+            self.tsv,
+            read_options=pyarrow_csv.ReadOptions(
+                column_names=self.COLUMNS,
+                block_size=self.BLOCK_SIZE,
+                use_threads=True),
+            parse_options=pyarrow_csv.ParseOptions(delimiter='\t'),
+            convert_options=pyarrow_csv.ConvertOptions(
+                include_columns=self.USECOLS,
+                column_types={
+                    'Query ID': pyarrow.string(),
+                    'Subject ID': pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+                    'Percent Identity': pyarrow.float64(),
+                }))
+
+        batches = []
+        for batch in reader:
+            keep = pyarrow_compute.greater_equal(batch.column('Percent Identity'), self.min_percent_identity)
+            batches.append(batch.filter(keep))
+
+        table = pyarrow.Table.from_batches(batches, schema=reader.schema).unify_dictionaries().combine_chunks()
+        self.df = table.to_pandas()
+        self.df['Query ID'] = self.df['Query ID'].astype(str)
+
+    def read_with_pandas(self):
+        chunks = pd.read_csv(
+            self.tsv,
+            sep='\t',
+            header=None,
+            names=self.COLUMNS,
+            usecols=self.USECOLS,
+            dtype={
+                'Query ID': str,
+                'Subject ID': str,
+                'Percent Identity': float,
+            },
+            chunksize=self.CHUNK_SIZE)
+
+        self.df = pd.concat(
+            [chunk[chunk['Percent Identity'] >= self.min_percent_identity] for chunk in chunks],
+            ignore_index=True)
+
+
+def splitmix64(x: np.ndarray) -> np.ndarray:
+    """
+    Bit mixer of uint64 values
+    """
+    with np.errstate(over='ignore'):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+        return x ^ (x >> np.uint64(31))
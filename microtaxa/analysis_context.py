@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from functools import cached_property
+from typing import Union, Optional, List, Dict, Tuple
+from .matrix import TaxonMatrix
+from .template import Settings
+from .normalization import CountNormalization, LOG_PSEUDOCOUNT
+from .grouping import AddGroupColumn, SampleSheet, read_sample_sheet
+
+
+def shorten_silva(s: str) -> str:
+    """
+    SILVA taxonomy format:
+
+    AY188352.1.1546 Bacteria;Bacillota;Bacilli;Lactobacillales;Streptococcaceae;Streptococcus;Streptococcus salivarius
+
+    Shortened format:
+
+    AY188352.1.1546 Streptococcus salivarius
+
+    Other taxon names are unchanged
+    """
+    if ';' not in s:
+        return s
+    prefix = s.split(' ')[0]
+    suffix = s.split(';')[-1]
+    return f'{prefix} {suffix}'
+
+
+def add_suffix_to_duplicates(names: List[str]) -> List[str]:
+    """
+    ['a', 'b', 'a'] -> ['a_1', 'b', 'a_2']
+    """
+    name_to_count = {}
+    for name in names:
+        name_to_count[name] = name_to_count.get(name, 0) + 1
+
+    cumulative_count = {}
+    ret = []
+    for name in names:
+        if name_to_count[name] > 1:
+            cumulative_count[name] = cumulative_count.get(name, 0) + 1
+            name = f'{name}_{cumulative_count[name]}'
+        ret.append(name)
+    return ret
+
+
+def as_taxon_matrix(df: Union[pd.DataFrame, TaxonMatrix], fill_value: float = 0.) -> TaxonMatrix:
+    return df if isinstance(df, TaxonMatrix) else TaxonMatrix.from_dataframe(df, fill_value=fill_value)
+
+
+class AnalysisContext:
+    """
+    Aggregated tables and the sample sheet of one analysis,
+    with the views derived for differential abundance and heatmaps computed once on first use
+
+    Views are shared read-only: consumers subset or relabel them into new objects sharing the same data,
+    so the analysis holds the sparse tables plus one dense copy of the count table at most
+    """
+
+    settings: Settings
+    count_matrix: TaxonMatrix
+    percent_id_mean_matrix: Optional[TaxonMatrix]
+    percent_id_std_matrix: Optional[TaxonMatrix]
+    sample_sheet: SampleSheet
+    transformed_views: Dict[Tuple[str, float, np.dtype], Union[TaxonMatrix, pd.DataFrame]]
+
+    def __init__(
+            self,
+            settings: Settings,
+            count_df: Union[pd.DataFrame, TaxonMatrix],
+            sample_sheet: Union[str, SampleSheet],
+            percent_id_mean_df: Optional[Union[pd.DataFrame, TaxonMatrix]] = None,
+            percent_id_std_df: Optional[Union[pd.DataFrame, TaxonMatrix]] = None):
+        """
+        Percent identity tables are only needed for heatmaps, NaN where a taxon has no hit in a sample
+        """
+        self.settings = settings
+        self.count_matrix = as_taxon_matrix(count_df)
+        self.sample_sheet = read_sample_sheet(sample_sheet)
+        self.percent_id_mean_matrix, self.percent_id_std_matrix = [
+            None if df is None else as_taxon_matrix(df, fill_value=np.nan)
+            for df in [percent_id_mean_df, percent_id_std_df]
+        ]
+        self.transformed_views = {}
+
+    @cached_property
+    def percent(self) -> TaxonMatrix:
+        """
+        Counts per 100 reads of each sample
+        """
+        return CountNormalization(self.settings).main(
+            df=self.count_matrix,
+            log_pseudocount=False,
+            by_sample_reads=True,
+            sample_reads_unit=100)
+
+    @property
+    def log_pseudocount(self) -> TaxonMatrix:
+        """
+        log10(count + 1)
+        """
+        return self.transformed(transform=LOG_PSEUDOCOUNT)
+
+    def transformed(
+            self,
+            transform: str,
+            pseudocount: float = 1.,
+            dtype: type = np.float64) -> Union[TaxonMatrix, pd.DataFrame]:
+        """
+        Count table under one of normalization.TRANSFORMS, computed once for each set of arguments
+        """
+        key = (transform, pseudocount, np.dtype(dtype))
+        if key not in self.transformed_views:
+            self.transformed_views[key] = CountNormalization(self.settings).main(
+                df=self.count_matrix,
+                transform=transform,
+                pseudocount=pseudocount,
+                dtype=dtype)
+        return self.transformed_views[key]
+
+    @cached_property
+    def short_taxon_names(self) -> pd.Index:
+        """
+        Taxon names with SILVA taxonomy shortened, see shorten_silva
+        """
+        return pd.Index([shorten_silva(taxon) for taxon in self.count_matrix.index])
+
+    @cached_property
+    def abundance_table(self) -> pd.DataFrame:
+        """
+        Sample x taxon table of relative abundance (%) to be tested, densified once
+
+        GROUP_COLUMN first, then taxa by short names made unique with suffixes
+        """
+        taxa = add_suffix_to_duplicates(list(self.short_taxon_names))
+        df = self.percent.set_index(taxa).to_transposed_dataframe()
+        return AddGroupColumn(self.settings).main(df=df, sample_sheet=self.sample_sheet)
@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+from typing import Dict, Any, Optional, Type
+from .utils import file_digest
+from .template import Processor, Settings
+
+
+class StageCache:
+    """
+    Manifest of processor outputs in the workdir, keyed by a hash of the processor inputs and parameters
+
+    A key covers:
+        - processor class name
+        - class constants (e.g. QUALITY, MIN_OVERLAP), except thread/core counts which do not change outputs
+        - main() keyword arguments, except thread counts, with the SHA-256 digest of every argument that is an existing file,
+          paths (existing files or strings with a path separator) made absolute, so ./workdir and workdir give the same key
+        - SETTINGS fields, which change outputs unlike threads or debug
+
+    A cached output is valid as long as every returned file still exists with the recorded size and mtime
+    """
+
+    MANIFEST_NAME = 'stage-manifest.json'
+    SETTINGS = ['mock', 'for_publication', 'intermediate_codec']
+
+    manifest_json: str
+    stages: Dict[str, Dict[str, Any]]
+    digests: Dict[str, Dict[str, Any]]
+
+    def __init__(self, workdir: str):
+        self.manifest_json = f'{workdir}/{self.MANIFEST_NAME}'
+        self.stages = {}
+        self.digests = {}
+        if os.path.exists(self.manifest_json):
+            with open(self.manifest_json) as fh:
+                manifest = json.load(fh)
+            self.stages = manifest['stages']
+            self.digests = manifest['digests']
+
+    def key(self, processor: Type[Processor], kwargs: Dict[str, Any], settings: Settings) -> str:
+        data = {
+            'processor': processor.__name__,
+            'constants': self.__constants(processor),
+            'settings': {name: getattr(settings, name) for name in self.SETTINGS},
+            'kwargs': {k: self.__encode(v) for k, v in sorted(kwargs.items()) if 'threads' not in k},
+        }
+        text = json.dumps(data, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the recorded return value of the stage, or None if it is missing or stale
+        """
+        stage = self.stages.get(key)
+        if stage is None:
+            return None
+        for fpath, stat in stage['files'].items():
+            if self.__stat(fpath) != stat:
+                return None
+        returned = stage['returned']
+        return tuple(returned) if isinstance(returned, list) else returned
+
+    def put(self, key: str, returned: Any):
+        """
+        Records the return value of the stage, only if all returned paths are existing files
+        """
+        fpaths = list(returned) if isinstance(returned, (list, tuple)) else [returned]
+        fpaths = [f for f in fpaths if f is not None]
+        if not all(isinstance(f, str) and os.path.isfile(f) for f in fpaths):
+            return
+        self.stages[key] = {
+            'returned': returned,
+            'files': {f: self.__stat(f) for f in fpaths},
+        }
+        self.save()
+
+    def save(self):
+        temp = f'{self.manifest_json}.temp'
+        with open(temp, 'w') as fh:
+            json.dump({'stages': self.stages, 'digests': self.digests}, fh, indent=2)
+        os.replace(temp, self.manifest_json)  # atomic, a crash never leaves a truncated manifest
+
+    def digest(self, fpath: str) -> str:
+        """
+        SHA-256 of the file, memoized by path, size and mtime
+        """
+        stat = self.__stat(fpath)
+        memo = self.digests.get(fpath)
+        if memo is not None and memo['stat'] == stat:
+            return memo['sha256']
+        sha256 = file_digest(fpath)
+        self.digests[fpath] = {'stat': stat, 'sha256': sha256}
+        return sha256
+
+    def __encode(self, value: Any) -> Any:
+        if isinstance(value, (list, tuple)):
+            return [self.__encode(v) for v in value]
+        if isinstance(value, str) and os.path.isfile(value):
+            path = os.path.abspath(value)
+            return {'path': path, 'sha256': self.digest(path)}
+        if isinstance(value, str) and os.sep in value:  # e.g. an output path not written yet
+            return os.path.abspath(value)
+        return value
+
+    def __constants(self, processor: Type[Processor]) -> Dict[str, Any]:
+        constants = {}
+        for cls in reversed(processor.__mro__):
+            for name, value in vars(cls).items():
+                if not name.isupper() or 'THREADS' in name or 'CORES' in name:
+                    continue
+                if isinstance(value, (str, int, float, bool, tuple)) or value is None:
+                    constants[name] = value
+        return constants
+
+    def __stat(self, fpath: str) -> Optional[list]:
+        if not os.path.isfile(fpath):
+            return None
+        s = os.stat(fpath)
+        return [s.st_size, s.st_mtime_ns]
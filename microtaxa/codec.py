@@ -0,0 +1,141 @@
+import os
+import gzip
+from typing import BinaryIO
+from concurrent.futures import ThreadPoolExecutor
+from .utils import open_sequence_file
+from .template import Processor
+from .codec_names import GZIP, GZIP_FAST, PARALLEL_GZIP, NONE, CODECS
+
+
+GZIP_LEVEL = 6
+GZIP_FAST_LEVEL = 1
+
+
+def codec_suffix(codec: str) -> str:
+    assert codec in CODECS, f'Unknown intermediate codec "{codec}", choose from {CODECS}'
+    return '' if codec == NONE else '.gz'
+
+
+def is_gzip(fpath: str) -> bool:
+    with open(fpath, 'rb') as fh:
+        return fh.read(2) == b'\x1f\x8b'
+
+
+def open_intermediate(fpath: str, codec: str, threads: int = 1) -> BinaryIO:
+    """
+    Binary writer of `fpath` in the codec, for stages that stream their output
+    """
+    assert codec in CODECS, f'Unknown intermediate codec "{codec}", choose from {CODECS}'
+    if codec == NONE:
+        return open(fpath, 'wb')
+    if codec == PARALLEL_GZIP:
+        return ParallelGzipWriter(fpath, threads=threads)
+    level = GZIP_FAST_LEVEL if codec == GZIP_FAST else GZIP_LEVEL
+    return gzip.open(fpath, 'wb', compresslevel=level)
+
+
+class ParallelGzipWriter:
+    """
+    Writes fixed-size blocks as independent gzip members compressed by concurrent threads,
+    zlib releases the GIL while compressing
+    """
+
+    BLOCK_SIZE = 2**22
+    LEVEL = 6
+
+    def __init__(self, fpath: str, threads: int):
+        self.__fh = open(fpath, 'wb')
+        self.__executor = ThreadPoolExecutor(max_workers=max(1, threads))
+        self.__max_pending = 2 * max(1, threads)  # bound the memory of blocks in flight
+        self.__pending = []
+        self.__buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return
+
+    def write(self, data: bytes):
+        self.__buffer += data
+        while len(self.__buffer) >= self.BLOCK_SIZE:
+            self.__submit(bytes(self.__buffer[:self.BLOCK_SIZE]))
+            del self.__buffer[:self.BLOCK_SIZE]
+
+    def close(self):
+        if len(self.__buffer) > 0:
+            self.__submit(bytes(self.__buffer))
+            self.__buffer = bytearray()
+        for future in self.__pending:
+            self.__fh.write(future.result())
+        self.__pending = []
+        self.__executor.shutdown()
+        self.__fh.close()
+
+    def __submit(self, block: bytes):
+        self.__pending.append(self.__executor.submit(gzip.compress, block, self.LEVEL, mtime=0))
+        if len(self.__pending) >= self.__max_pending:
+            self.__fh.write(self.__pending.pop(0).result())
+
+
+class WriteIntermediate(Processor):
+    """
+    Writes a plain or gzipped file `src` to `dst` in the intermediate codec of the workdir (settings.intermediate_codec)
+
+    Gzipped input is copied as is for any gzip codec, decompression or recompression would only cost time
+    """
+
+    BLOCK_SIZE = 2**22
+
+    src: str
+    dst: str
+    move: bool
+
+    codec: str
+
+    def main(self, src: str, dst: str, move: bool = False):
+        """
+        If `move`, `src` is removed afterwards
+        """
+        self.src = src
+        self.dst = dst
+        self.move = move
+
+        self.codec = self.settings.intermediate_codec
+        self.logger.info(f'Write "{self.src}" to "{self.dst}" ({self.codec})')
+        if self.mock:
+            return
+
+        if self.codec == NONE:
+            self.write_uncompressed()
+        else:
+            self.write_compressed()
+
+        if self.move and os.path.exists(self.src):
+            os.remove(self.src)
+
+    def write_uncompressed(self):
+        if is_gzip(self.src):
+            with open_sequence_file(self.src) as reader, open(self.dst, 'wb') as writer:
+                self.__copy_blocks(reader=reader, writer=writer)
+        else:
+            self.__copy_or_move()
+
+    def write_compressed(self):
+        if is_gzip(self.src):
+            self.__copy_or_move()
+        else:
+            with open(self.src, 'rb') as reader, \
+                    open_intermediate(self.dst, codec=self.codec, threads=self.threads) as writer:
+                self.__copy_blocks(reader=reader, writer=writer)
+
+    def __copy_blocks(self, reader: BinaryIO, writer: BinaryIO):
+        for block in iter(lambda: reader.read(self.BLOCK_SIZE), b''):
+            writer.write(block)
+
+    def __copy_or_move(self):
+        if self.move:
+            os.replace(self.src, self.dst)
+        else:
+            self.call(f'cp "{self.src}" "{self.dst}"')
@@ -0,0 +1,5 @@
+GZIP = 'gzip'  # single-threaded gzip, level 6
+GZIP_FAST = 'gzip-fast'  # single-threaded gzip, level 1
+PARALLEL_GZIP = 'parallel-gzip'  # blocks compressed by concurrent threads, written as a multi-member gzip
+NONE = 'none'  # uncompressed
+CODECS = [GZIP, GZIP_FAST, PARALLEL_GZIP, NONE]
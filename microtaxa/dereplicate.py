@@ -0,0 +1,85 @@
+import pandas as pd
+from os.path import basename
+from collections import Counter
+from typing import List, Dict, Tuple
+from .utils import FastaParser
+from .template import Processor
+
+
+class Dereplicate(Processor):
+    """
+    Collapses identical sequences across all samples into one unique fasta,
+    so that each distinct sequence is aligned only once
+
+    The abundance table (long format) has columns 'Query ID', 'Sample ID' and 'Count',
+    where 'Query ID' is the header of the unique sequence
+    """
+
+    DSTDIR_NAME = 'dereplicate'
+    UNIQUE_FASTA_NAME = 'unique-sequences.fasta'
+    ABUNDANCE_TSV_NAME = 'abundance.tsv'
+    QUERY_ID_PREFIX = 'U'
+    THREADS_PER_JOB = 1
+
+    fastas: List[str]
+
+    dstdir: str
+    seq_to_query_id: Dict[str, str]
+    abundance_data: List[Tuple[str, str, int]]
+    unique_fasta: str
+    abundance_tsv: str
+
+    def main(self, fastas: List[str]) -> Tuple[str, str]:
+        self.fastas = fastas
+
+        self.make_dstdir()
+        self.set_output_paths()
+
+        if not self.mock:
+            self.seq_to_query_id = {}
+            self.abundance_data = []
+            for fa in self.fastas:
+                self.process_one(fa=fa)
+            self.write_unique_fasta()
+            self.write_abundance_tsv()
+
+        return self.unique_fasta, self.abundance_tsv
+
+    def make_dstdir(self):
+        self.dstdir = f'{self.workdir}/{self.DSTDIR_NAME}'
+        self.call(f'mkdir -p {self.dstdir}')
+
+    def set_output_paths(self):
+        self.unique_fasta = f'{self.dstdir}/{self.UNIQUE_FASTA_NAME}'
+        self.abundance_tsv = f'{self.dstdir}/{self.ABUNDANCE_TSV_NAME}'
+
+    def process_one(self, fa: str):
+        sample_id = basename(fa)[:-len('.fasta')]
+
+        with FastaParser(fa) as parser:
+            seq_to_count = Counter(seq for _, seq in parser)
+
+        for seq, count in seq_to_count.items():
+            query_id = self.seq_to_query_id.get(seq)
+            if query_id is None:
+                query_id = f'{self.QUERY_ID_PREFIX}{len(self.seq_to_query_id) + 1}'
+                self.seq_to_query_id[seq] = query_id
+            self.abundance_data.append((query_id, sample_id, count))
+
+        self.logger.debug(f'{sample_id}: {sum(seq_to_count.values())} reads, {len(seq_to_count)} unique sequences')
+
+    def write_unique_fasta(self):
+        with open(self.unique_fasta, 'w') as fh:
+            for seq, query_id in self.seq_to_query_id.items():
+                fh.write(f'>{query_id}\n{seq}\n')
+        self.logger.info(f'{len(self.seq_to_query_id)} unique sequences across {len(self.fastas)} samples')
+
+    def write_abundance_tsv(self):
+        pd.DataFrame(
+            self.abundance_data,
+            columns=['Query ID', 'Sample ID', 'Count']
+        ).to_csv(
+            self.abundance_tsv,
+            sep='\t',
+            index=False
+        )
@@ -1,15 +1,19 @@
 import os
+import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.axes
 import matplotlib.pyplot as plt
-from typing import List
+from matplotlib.backends.backend_pdf import PdfPages
+from typing import List, Union, Optional
 from itertools import combinations
-from scipy.stats import mannwhitneyu
 from statsmodels.stats.multitest import multipletests
+from .matrix import TaxonMatrix
 from .template import Processor
-from .grouping import GROUP_COLUMN, AddGroupColumn
-from .normalization import CountNormalization
+from .rank_tests import GroupedMannWhitneyU
+from .rendering import RenderFigures, FigureJob
+from .grouping import GROUP_COLUMN, SampleSheet, read_sample_sheet
+from .analysis_context import AnalysisContext, add_suffix_to_duplicates
 
 
 DSTDIR_NAME = 'differential-abundance'
@@ -17,200 +21,208 @@ DSTDIR_NAME = 'differential-abundance'
 
 class DifferentialAbundance(Processor):
 
+    context: AnalysisContext
+    colors: Optional[list]
+    boxplot_max_p_value: Optional[float]
+    boxplot_adjusted_p_value: bool
+    boxplot_top_n: Optional[int]
+    boxplot_pdf: bool
+
     count_df: pd.DataFrame
-    sample_sheet: str
-    colors: list
 
     def main(
             self,
-            count_df: pd.DataFrame,
-            sample_sheet: str,
-            colors: list):
-
-        self.count_df = count_df
-        self.sample_sheet = sample_sheet
+            count_df: Optional[Union[pd.DataFrame, TaxonMatrix]] = None,
+            sample_sheet: Optional[Union[str, SampleSheet]] = None,
+            colors: Optional[list] = None,
+            boxplot_max_p_value: Optional[float] = None,
+            boxplot_adjusted_p_value: bool = False,
+            boxplot_top_n: Optional[int] = None,
+            boxplot_pdf: bool = False,
+            context: Optional[AnalysisContext] = None):
+        """
+        Tested on the count table and sample sheet, or the `context` shared with other analyses
+
+        `colors` of groups, seaborn default colors if None
+
+        See MannwhitneyuTestsAndBoxplots for the boxplot options
+        """
+        self.context = context if context is not None else AnalysisContext(
+            settings=self.settings,
+            count_df=count_df,
+            sample_sheet=sample_sheet)
         self.colors = colors
+        self.boxplot_max_p_value = boxplot_max_p_value
+        self.boxplot_adjusted_p_value = boxplot_adjusted_p_value
+        self.boxplot_top_n = boxplot_top_n
+        self.boxplot_pdf = boxplot_pdf
 
-        self.count_df = PrepareCountDf(self.settings).main(
-            count_df=self.count_df,
-            sample_sheet=self.sample_sheet)
+        self.count_df = self.context.abundance_table
 
         MannwhitneyuTestsAndBoxplots(self.settings).main(
             count_df=self.count_df,
-            sample_sheet=self.sample_sheet,
-            colors=self.colors)
+            sample_sheet=self.context.sample_sheet,
+            colors=self.colors,
+            boxplot_max_p_value=self.boxplot_max_p_value,
+            boxplot_adjusted_p_value=self.boxplot_adjusted_p_value,
+            boxplot_top_n=self.boxplot_top_n,
+            boxplot_pdf=self.boxplot_pdf)
 
 
 class PrepareCountDf(Processor):
 
-    df: pd.DataFrame
-    sample_sheet: str
-
     def main(
             self,
-            count_df: pd.DataFrame,
-            sample_sheet: str) -> pd.DataFrame:
-
-        self.df = count_df.copy()
-        self.sample_sheet = sample_sheet
-
-        self.df = CountNormalization(self.settings).main(
-            df=self.df,
-            log_pseudocount=False,
-            by_sample_reads=True,
-            sample_reads_unit=100)  # 100 for percentage
-
-        self.df = self.df.transpose()
-
-        self.shorten_taxon_columns()
-
-        self.df = AddSuffixToDuplicatedColumns(self.settings).main(self.df)
-
-        self.df = AddGroupColumn(self.settings).main(
-            df=self.df,
-            sample_sheet=self.sample_sheet)
-
-        return self.df
-
-    def shorten_taxon_columns(self):
-
-        def shorten_silva(s: str) -> str:
-            """
-            SILVA taxonomy format:
-
-            AY188352.1.1546 Bacteria;Bacillota;Bacilli;Lactobacillales;Streptococcaceae;Streptococcus;Streptococcus salivarius
-
-            Shortened format:
-
-            AY188352.1.1546 Streptococcus salivarius
-            """
-            prefix = s.split(' ')[0]
-            suffix = s.split(';')[-1]
-            return f'{prefix} {suffix}'
-
-        rename = {}
-        for column in self.df.columns:
-            if ';' in column:
-                rename[column] = shorten_silva(column)
-
-        self.df.rename(columns=rename, inplace=True)
+            count_df: Union[pd.DataFrame, TaxonMatrix],
+            sample_sheet: Union[str, SampleSheet]) -> pd.DataFrame:
+        """
+        Sample x taxon table of relative abundance (%) with the group column, see AnalysisContext.abundance_table
+        """
+        return AnalysisContext(settings=self.settings, count_df=count_df, sample_sheet=sample_sheet).abundance_table
 
 
 class AddSuffixToDuplicatedColumns(Processor):
 
-    df: pd.DataFrame
-
-    duplicated_columns: List[str]
-
-    outdf: pd.DataFrame
-
     def main(self, df: pd.DataFrame) -> pd.DataFrame:
-        self.df = df.copy()
-
-        self.set_duplicated_columns()
-        self.rename_duplicated_columns_and_set_outdf()
-
-        return self.outdf
-
-    def set_duplicated_columns(self):
-        column_to_count = {}
-        for c in self.df.columns:
-            column_to_count.setdefault(c, 0)
-            column_to_count[c] += 1
-
-        self.duplicated_columns = [
-            column for column, count in column_to_count.items()
-            if count > 1
-        ]
-
-    def rename_duplicated_columns_and_set_outdf(self):
-        self.outdf = pd.DataFrame(index=self.df.index)
-
-        cumulative_count = {c: 0 for c in self.duplicated_columns}
-
-        for column, series in self.df.items():
-            if column in self.duplicated_columns:
-                cumulative_count[column] += 1
-                series.name = f'{column}_{cumulative_count[column]}'
-
-            self.outdf = pd.concat([self.outdf, series], axis=1)
+        outdf = df.copy(deep=False)  # only the column labels change
+        outdf.columns = add_suffix_to_duplicates(list(df.columns))
+        return outdf
 
 
 class MannwhitneyuTestsAndBoxplots(Processor):
 
+    P_VALUE = 'P value'
+    ADJUSTED_P_VALUE = 'Benjamini-Hochberg adjusted P value'
+    BOXPLOT_PDF_NAME = 'boxplots.pdf'
+
     count_df: pd.DataFrame
-    sample_sheet: str
+    sample_sheet: SampleSheet
     colors: list
+    boxplot_max_p_value: Optional[float]
+    boxplot_adjusted_p_value: bool
+    boxplot_top_n: Optional[int]
+    boxplot_pdf: bool
+
+    taxa: List[str]
+    mann_whitney_u: GroupedMannWhitneyU
+    figure_jobs: List[FigureJob]
 
     def main(
             self,
             count_df: pd.DataFrame,
-            sample_sheet: str,
-            colors: list):
-
+            sample_sheet: Union[str, SampleSheet],
+            colors: list,
+            boxplot_max_p_value: Optional[float] = None,
+            boxplot_adjusted_p_value: bool = False,
+            boxplot_top_n: Optional[int] = None,
+            boxplot_pdf: bool = False):
+        """
+        Boxplots are drawn for all taxa by default, or only for taxa
+            with P value (or the adjusted one if `boxplot_adjusted_p_value`) <= `boxplot_max_p_value`
+            among the `boxplot_top_n` smallest P values
+
+        If `boxplot_pdf`, boxplots of a group pair are pages of one PDF instead of PNG files
+        """
         self.count_df = count_df
-        self.sample_sheet = sample_sheet
+        self.sample_sheet = read_sample_sheet(sample_sheet)
         self.colors = colors
+        self.boxplot_max_p_value = boxplot_max_p_value
+        self.boxplot_adjusted_p_value = boxplot_adjusted_p_value
+        self.boxplot_top_n = boxplot_top_n
+        self.boxplot_pdf = boxplot_pdf
 
-        groups = pd.read_csv(self.sample_sheet, index_col=0)[GROUP_COLUMN].unique()
+        groups = self.sample_sheet.groups
 
+        self.rank_taxa()
+        self.figure_jobs = []
         for group_1, group_2 in combinations(groups, 2):
             self.process_group_pair(group_1=group_1, group_2=group_2)
+        RenderFigures(self.settings).main(jobs=self.figure_jobs)
+
+    def rank_taxa(self):
+        """
+        Taxa are ranked and sorted by group once, then reused by all group pairs
+        """
+        self.taxa = [c for c in self.count_df.columns if c != GROUP_COLUMN]
+        self.mann_whitney_u = GroupedMannWhitneyU(
+            values=self.count_df[self.taxa].to_numpy(dtype=np.float64),
+            groups=self.count_df[GROUP_COLUMN].to_numpy())
 
     def process_group_pair(self, group_1: str, group_2: str):
         dstdir = f'{self.outdir}/{DSTDIR_NAME}/{group_1}-{group_2}'
         os.makedirs(dstdir, exist_ok=True)
 
-        stats_data = []
-
-        for taxon in self.count_df.columns:
+        statistics, pvalues = self.mann_whitney_u.test(group_1=group_1, group_2=group_2)
 
-            if taxon == GROUP_COLUMN:
-                continue
-
-            is_group_1 = self.count_df[GROUP_COLUMN] == group_1
-            is_group_2 = self.count_df[GROUP_COLUMN] == group_2
-
-            statistic, pvalue = mannwhitneyu(
-                x=self.count_df.loc[is_group_1, taxon],
-                y=self.count_df.loc[is_group_2, taxon]
-            )
-
-            Boxplot(self.settings).main(
-                data=self.count_df[is_group_1 | is_group_2],
-                x=GROUP_COLUMN,
-                y=taxon,
-                colors=self.colors,
-                title=f'{taxon}\np = {pvalue:.4f}',
-                dstdir=dstdir)
-
-            stats_data.append({
-                'Taxon': taxon,
-                'Mean 1 (%)': self.count_df.loc[is_group_1, taxon].mean(),
-                'Mean 2 (%)': self.count_df.loc[is_group_2, taxon].mean(),
-                'Statistics': statistic,
-                'P value': pvalue,
-            })
-
-        stats_df = pd.DataFrame(stats_data).sort_values(
-            by='P value',
+        stats_df = pd.DataFrame({
+            'Taxon': self.taxa,
+            'Mean 1 (%)': self.mann_whitney_u.means(group_1),
+            'Mean 2 (%)': self.mann_whitney_u.means(group_2),
+            'Statistics': statistics,
+            self.P_VALUE: pvalues,
+        }).sort_values(
+            by=self.P_VALUE,
             ascending=True
         )
 
         rejected, pvals_corrected, _, _ = multipletests(
-            stats_df['P value'],
+            stats_df[self.P_VALUE],
             alpha=0.1,
             method='fdr_bh',  # Benjamini-Hochberg
             is_sorted=False,
             returnsorted=False)
 
-        stats_df['Benjamini-Hochberg adjusted P value'] = pvals_corrected
+        stats_df[self.ADJUSTED_P_VALUE] = pvals_corrected
 
         stats_df.to_csv(
             f'{dstdir}/Mann-Whitney-U.csv',
             index=False
         )
 
+        self.queue_boxplots(
+            data=self.count_df[self.count_df[GROUP_COLUMN].isin([group_1, group_2])],
+            stats_df=self.boxplot_taxa(stats_df),
+            dstdir=dstdir)
+
+    def boxplot_taxa(self, stats_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Rows of taxa passing the boxplot options, in the order of the stats table
+        """
+        if self.boxplot_max_p_value is not None:
+            column = self.ADJUSTED_P_VALUE if self.boxplot_adjusted_p_value else self.P_VALUE
+            stats_df = stats_df[stats_df[column] <= self.boxplot_max_p_value]
+        if self.boxplot_top_n is not None:
+            stats_df = stats_df.head(self.boxplot_top_n)  # sorted by P value
+        return stats_df
+
+    def queue_boxplots(self, data: pd.DataFrame, stats_df: pd.DataFrame, dstdir: str):
+        """
+        Each job carries only the columns it draws, rendered later by RenderFigures
+        """
+        taxa = stats_df['Taxon'].tolist()
+        titles = [f'{taxon}\np = {pvalue:.4f}' for taxon, pvalue in zip(taxa, stats_df[self.P_VALUE])]
+
+        if self.boxplot_pdf:
+            self.figure_jobs.append((BoxplotPdf, {
+                'data': data[[GROUP_COLUMN] + taxa],
+                'x': GROUP_COLUMN,
+                'ys': taxa,
+                'colors': self.colors,
+                'titles': titles,
+                'pdf': f'{dstdir}/{self.BOXPLOT_PDF_NAME}',
+            }))
+            return
+
+        for taxon, title in zip(taxa, titles):
+            self.figure_jobs.append((Boxplot, {
+                'data': data[[GROUP_COLUMN, taxon]],
+                'x': GROUP_COLUMN,
+                'y': taxon,
+                'colors': self.colors,
+                'title': title,
+                'dstdir': dstdir,
+            }))
+
 
 class Boxplot(Processor):
 
@@ -292,3 +304,41 @@ class Boxplot(Processor):
         plt.tight_layout()
         plt.savefig(f'{self.dstdir}/{self.y}.png', dpi=self.DPI)
         plt.close()
+
+
+class BoxplotPdf(Boxplot):
+    """
+    Boxplots of many columns `ys` as pages of one PDF, all drawn on one reused figure
+    """
+
+    ys: List[str]
+    titles: List[str]
+    pdf: str
+
+    def main(
+            self,
+            data: pd.DataFrame,
+            x: str,
+            ys: List[str],
+            colors: list,
+            titles: List[str],
+            pdf: str):
+
+        self.data = data
+        self.x = x
+        self.ys = ys
+        self.colors = colors
+        self.titles = titles
+        self.pdf = pdf
+
+        self.init()
+        with PdfPages(self.pdf) as pages:
+            for y, title in zip(self.ys, self.titles):
+                self.y = y
+                self.title = title
+                plt.gca().clear()
+                self.plot()
+                self.config()
+                plt.tight_layout()
+                pages.savefig()
+        plt.close()
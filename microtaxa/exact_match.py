@@ -0,0 +1,168 @@
+import re
+import hashlib
+from os.path import basename
+from typing import List, Dict, Tuple, Optional
+from .utils import FastaParser
+from .template import Processor
+
+
+IUPAC_TO_BASES = {
+    'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T',
+    'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT', 'M': 'AC',
+    'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG', 'N': 'ACGT',
+}
+COMPLEMENT = str.maketrans('ACGTRYSWKMBDHVN', 'TGCAYRSWMKVHDBN')
+
+
+class ExactMatch(Processor):
+    """
+    Hash-based fast path ahead of glsearch:
+    queries identical to a reference sequence are assigned at 100% identity without alignment,
+    the rest are written to a fasta for glsearch
+
+    If primers are given, the amplicon region between them (primers excluded) is hashed instead of the full reference,
+    which matches reads whose primers were clipped
+
+    Hits are written in the BLAST tabular (-m 8) format that ReadBlastTsv reads,
+    one row for every reference whose full sequence (or amplicon region) is identical to the query
+
+    The tie set of a resolved query can be smaller than that of glsearch, which aligns the whole query
+    against a local stretch of the subject and so also reports 100% identity for references containing the query
+    as a substring, or whose amplicon region is not cut by the primers.
+    Reads resolved here are assigned among identical references only, possibly to a different best hit than glsearch
+    """
+
+    DSTDIR_NAME = 'exact-match'
+    THREADS_PER_JOB = 1
+
+    query_fa: str
+    ref_fa: str
+    forward_primer: Optional[str]
+    reverse_primer: Optional[str]
+
+    dstdir: str
+    hits_tsv: str
+    unresolved_fa: str
+    digest_to_query_ids: Dict[bytes, List[str]]
+    query_id_to_seq: Dict[str, str]
+    hits: List[Tuple[str, str, int]]
+    forward_regex: Optional[re.Pattern]
+    reverse_regex: Optional[re.Pattern]
+
+    def main(
+            self,
+            query_fa: str,
+            ref_fa: str,
+            forward_primer: Optional[str] = None,
+            reverse_primer: Optional[str] = None) -> Tuple[str, str]:
+
+        self.query_fa = query_fa
+        self.ref_fa = ref_fa
+        self.forward_primer = forward_primer
+        self.reverse_primer = reverse_primer
+
+        self.make_dstdir()
+        self.set_output_paths()
+
+        if not self.mock:
+            self.read_queries()
+            self.set_primer_regexes()
+            self.scan_reference()
+            self.write_hits_tsv()
+            self.write_unresolved_fa()
+
+        return self.hits_tsv, self.unresolved_fa
+
+    def make_dstdir(self):
+        self.dstdir = f'{self.workdir}/{self.DSTDIR_NAME}'
+        self.call(f'mkdir -p {self.dstdir}')
+
+    def set_output_paths(self):
+        fname = basename(self.query_fa)[:-len('.fasta')]
+        self.hits_tsv = f'{self.dstdir}/{fname}.tsv'
+        self.unresolved_fa = f'{self.dstdir}/{fname}-unresolved.fasta'
+
+    def read_queries(self):
+        """
+        Only query digests are held in memory, the reference is streamed
+        """
+        self.digest_to_query_ids = {}
+        self.query_id_to_seq = {}
+        with FastaParser(self.query_fa) as parser:
+            for head, seq in parser:
+                query_id = head.split(' ')[0]
+                self.query_id_to_seq[query_id] = seq
+                self.digest_to_query_ids.setdefault(digest(seq), []).append(query_id)
+
+    def set_primer_regexes(self):
+        self.forward_regex, self.reverse_regex = None, None
+        if self.forward_primer is not None:
+            self.forward_regex = primer_regex(self.forward_primer)
+        if self.reverse_primer is not None:
+            reverse_complement = self.reverse_primer.upper().translate(COMPLEMENT)[::-1]
+            self.reverse_regex = primer_regex(reverse_complement)
+
+    def scan_reference(self):
+        self.hits = []
+        with FastaParser(self.ref_fa) as parser:
+            for head, seq in parser:
+                region = self.amplicon_region(seq.upper().replace('U', 'T'))  # SILVA sequences are RNA
+                if region is None:
+                    continue
+                query_ids = self.digest_to_query_ids.get(digest(region))
+                if query_ids is None:
+                    continue
+                subject_id = head.split(' ')[0]
+                for query_id in query_ids:
+                    self.hits.append((query_id, subject_id, len(region)))
+
+        n_resolved = len(set(h[0] for h in self.hits))
+        self.logger.info(f'{n_resolved} of {len(self.query_id_to_seq)} queries resolved by exact match')
+
+    def amplicon_region(self, seq: str) -> Optional[str]:
+        start, end = 0, len(seq)
+        if self.forward_regex is not None:
+            m = self.forward_regex.search(seq)
+            if m is None:
+                return None
+            start = m.end()
+        if self.reverse_regex is not None:
+            m = self.reverse_regex.search(seq, start)
+            if m is None:
+                return None
+            end = m.start()
+        return seq[start:end]
+
+    def write_hits_tsv(self):
+        with open(self.hits_tsv, 'w') as fh:
+            for query_id, subject_id, length in self.hits:
+                fh.write('\t'.join(map(str, [
+                    query_id,
+                    subject_id,
+                    100.0,  # Percent Identity
+                    length,  # Alignment Length
+                    0,  # Number of Mismatches
+                    0,  # Number of Gap Openings
+                    1,  # Query Start
+                    length,  # Query End
+                    1,  # Subject Start, relative to the amplicon region
+                    length,  # Subject End
+                    0.0,  # E-value, not computed
+                    'nan',  # Bit Score, not computed
+                ])) + '\n')
+
+    def write_unresolved_fa(self):
+        resolved = set(h[0] for h in self.hits)
+        with open(self.unresolved_fa, 'w') as fh:
+            for query_id, seq in self.query_id_to_seq.items():
+                if query_id not in resolved:
+                    fh.write(f'>{query_id}\n{seq}\n')
+
+
+def digest(seq: str) -> bytes:
+    return hashlib.blake2b(seq.upper().replace('U', 'T').encode(), digest_size=16).digest()
+
+
+def primer_regex(primer: str) -> re.Pattern:
+    pattern = ''.join(f'[{IUPAC_TO_BASES[b]}]' for b in primer.upper())
+    return re.compile(pattern)
@@ -1,5 +1,7 @@
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from typing import List, Sequence, Union
 from matplotlib.colors import to_rgba
 from .template import Processor
 
@@ -7,98 +9,124 @@ from .template import Processor
 GROUP_COLUMN = 'Group'
 
 
+class SampleSheet:
+    """
+    Sample sheet CSV parsed and validated once, then passed through the analysis in place of its path
+
+    The first column holds unique sample IDs, the GROUP_COLUMN column their groups
+    """
+
+    path: str
+    df: pd.DataFrame
+
+    def __init__(self, path: str):
+        self.path = path
+        self.df = pd.read_csv(self.path, index_col=0)
+        assert GROUP_COLUMN in self.df.columns, \
+            f'No "{GROUP_COLUMN}" column in {self.path}'
+        duplicated = self.df.index[self.df.index.duplicated()].unique().tolist()
+        assert len(duplicated) == 0, \
+            f'Duplicated sample IDs {duplicated} in {self.path}'
+
+    @property
+    def sample_ids(self) -> list:
+        return self.df.index.tolist()
+
+    @property
+    def groups(self) -> np.ndarray:
+        """
+        Unique groups in the order of first appearance
+        """
+        return self.df[GROUP_COLUMN].unique()
+
+    def groups_of(self, sample_ids: Sequence[str]) -> pd.Series:
+        """
+        Group of each sample, NaN for samples not in the sheet
+        """
+        return self.df[GROUP_COLUMN].reindex(sample_ids)
+
+    def tag_group_names(self, sample_ids: Sequence[str]) -> List[str]:
+        """
+        'S01' -> '[Group] S01' for samples in the sheet, others unchanged
+        """
+        groups = self.groups_of(sample_ids).tolist()
+        in_sheet = pd.Index(sample_ids).isin(self.df.index)
+        return [
+            f'[{group}] {sample_id}' if is_in else sample_id
+            for sample_id, group, is_in in zip(sample_ids, groups, in_sheet)
+        ]
+
+
+def read_sample_sheet(sample_sheet: Union[str, SampleSheet]) -> SampleSheet:
+    return sample_sheet if isinstance(sample_sheet, SampleSheet) else SampleSheet(sample_sheet)
+
+
 class AddGroupColumn(Processor):
 
     NA_VALUE: str = 'None'  # Don't use 'NA', which would make dtype = `float` but not `str`, tricky for testing
 
     df: pd.DataFrame
-    sample_sheet: str
-
-    sample_df: pd.DataFrame
+    sample_sheet: SampleSheet
 
     def main(
             self,
             df: pd.DataFrame,
-            sample_sheet: str) -> pd.DataFrame:
-
-        self.df = df.copy(deep=True)
-        self.sample_sheet = sample_sheet
+            sample_sheet: Union[str, SampleSheet]) -> pd.DataFrame:
+        """
+        Returns a new DataFrame with GROUP_COLUMN first, the data of `df` is not copied
+        """
+        self.df = df
+        self.sample_sheet = read_sample_sheet(sample_sheet)
 
-        self.read_sample_sheet()
         self.add_group_column()
-        self.reorder_columns()
 
         return self.df
 
-    def read_sample_sheet(self):
-        self.sample_df = pd.read_csv(self.sample_sheet, index_col=0)
-        assert GROUP_COLUMN in self.sample_df.columns, \
-            f'No "{GROUP_COLUMN}" column in {self.sample_sheet}'
-
     def add_group_column(self):
-        self.df = self.df.merge(
-            right=self.sample_df[GROUP_COLUMN],
-            how='left',
-            left_index=True,
-            right_index=True)
-        self.df[GROUP_COLUMN] = self.df[GROUP_COLUMN].fillna(self.NA_VALUE)
-
-    def reorder_columns(self):
-        cols = list(self.df.columns)
-        cols = [cols[-1]] + cols[:-1]
-        self.df = self.df[cols]
+        groups = self.sample_sheet.groups_of(self.df.index).fillna(self.NA_VALUE)
+        df = self.df.copy(deep=False)
+        df.insert(loc=0, column=GROUP_COLUMN, value=groups.to_numpy())
+        self.df = df
 
 
 class TagGroupNamesOnSampleColumns(Processor):
 
     df: pd.DataFrame
-    sample_sheet: str
-
-    sample_df: pd.DataFrame
+    sample_sheet: SampleSheet
 
     def main(
             self,
             df: pd.DataFrame,
-            sample_sheet: str) -> pd.DataFrame:
+            sample_sheet: Union[str, SampleSheet]) -> pd.DataFrame:
 
-        self.df = df.copy(deep=True)
-        self.sample_sheet = sample_sheet
+        self.df = df.copy(deep=False)  # only the column labels change
+        self.sample_sheet = read_sample_sheet(sample_sheet)
 
-        self.read_sample_sheet()
         self.rename_columns()
 
         return self.df
 
-    def read_sample_sheet(self):
-        self.sample_df = pd.read_csv(self.sample_sheet, index_col=0)
-        assert GROUP_COLUMN in self.sample_df.columns, \
-            f'No "{GROUP_COLUMN}" column in {self.sample_sheet}'
-
     def rename_columns(self):
-        for col in self.df.columns:
-            if col in self.sample_df.index:
-                group = self.sample_df.loc[col, GROUP_COLUMN]
-                self.df = self.df.rename(columns={col: f'[{group}] {col}'})
+        self.df.columns = self.sample_sheet.tag_group_names(list(self.df.columns))
 
 
 class GetColors(Processor):
 
-    sample_sheet: str
+    sample_sheet: SampleSheet
     colormap: str
     invert_colors: bool
 
     def main(
             self,
-            sample_sheet: str,
+            sample_sheet: Union[str, SampleSheet],
             colormap: str,
             invert_colors: bool) -> list:
 
-        self.sample_sheet = sample_sheet
+        self.sample_sheet = read_sample_sheet(sample_sheet)
         self.colormap = colormap
         self.invert_colors = invert_colors
 
-        df = pd.read_csv(self.sample_sheet, index_col=0)
-        n_groups = len(df[GROUP_COLUMN].unique())
+        n_groups = len(self.sample_sheet.groups)
 
         if ',' in self.colormap:
             names = self.colormap.split(',')
@@ -1,79 +1,156 @@
 import os
+import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
-from typing import Tuple
+from typing import Tuple, Union, List, Optional
+from .matrix import TaxonMatrix
 from .template import Processor
-from .normalization import CountNormalization
-from .grouping import TagGroupNamesOnSampleColumns
+from .rendering import RenderFigures
+from .aggregate import OTHERS
+from .normalization import CountNormalization, LOG_PSEUDOCOUNT
+from .grouping import TagGroupNamesOnSampleColumns, SampleSheet, read_sample_sheet
+from .analysis_context import AnalysisContext, shorten_silva
 
 
 DSTDIR_NAME = 'heatmap'
+MEAN_ABUNDANCE = 'mean'
+PREVALENCE = 'prevalence'
+RANK_BY = [MEAN_ABUNDANCE, PREVALENCE]
 
 
 class PlotHeatmaps(Processor):
 
+    context: AnalysisContext
+    large_matrix: bool
+    top_n: Optional[int]
+    rank_by: str
+    count_transform: str
+
     def main(
             self,
-            count_df: pd.DataFrame,
-            percent_id_mean_df: pd.DataFrame,
-            percent_id_std_df: pd.DataFrame,
-            sample_sheet: str):
-
-        PlotOneHeatmap(self.settings).main(
-            df=count_df,
-            sample_sheet=sample_sheet,
-            log_pseudocount=True,
-            normalize_by_sample_reads=False,
-            colormap='PuBu',
-            output_fname='log-pseudocount'
-        )
-
-        PlotOneHeatmap(self.settings).main(
-            df=percent_id_mean_df,
+            count_df: Optional[Union[pd.DataFrame, TaxonMatrix]] = None,
+            percent_id_mean_df: Optional[Union[pd.DataFrame, TaxonMatrix]] = None,
+            percent_id_std_df: Optional[Union[pd.DataFrame, TaxonMatrix]] = None,
+            sample_sheet: Optional[Union[str, SampleSheet]] = None,
+            large_matrix: bool = False,
+            top_n: Optional[int] = None,
+            rank_by: str = MEAN_ABUNDANCE,
+            count_transform: str = LOG_PSEUDOCOUNT,
+            context: Optional[AnalysisContext] = None):
+        """
+        Plots the three tables and sample sheet, or those of the `context` shared with other analyses,
+        percent identity heatmaps are skipped if their tables are absent
+
+        large_matrix: see Clustermap, the count heatmap is computed in float32
+        top_n: only plot the top-N taxa of the count table ranked by `rank_by`, in all three heatmaps
+        count_transform: one of normalization.TRANSFORMS for the count heatmap, also its file name
+        """
+        self.context = context if context is not None else AnalysisContext(
+            settings=self.settings,
+            count_df=count_df,
             sample_sheet=sample_sheet,
-            log_pseudocount=False,
-            normalize_by_sample_reads=False,
-            colormap='winter',
-            output_fname='percent-identity-mean'
-        )
-
-        PlotOneHeatmap(self.settings).main(
-            df=percent_id_std_df,
-            sample_sheet=sample_sheet,
-            log_pseudocount=False,
-            normalize_by_sample_reads=False,
-            colormap='winter',
-            output_fname='percent-identity-std'
-        )
+            percent_id_mean_df=percent_id_mean_df,
+            percent_id_std_df=percent_id_std_df)
+        self.large_matrix = large_matrix
+        self.top_n = top_n
+        self.rank_by = rank_by
+        self.count_transform = count_transform
+
+        views = [  # normalized once by the context, top-N taxa are selected from the views
+            (self.context.transformed(
+                transform=self.count_transform,
+                dtype=np.float32 if self.large_matrix else np.float64), 'PuBu', self.count_transform),
+            (self.context.percent_id_mean_matrix, 'winter', 'percent-identity-mean'),
+            (self.context.percent_id_std_matrix, 'winter', 'percent-identity-std'),
+        ]
+        for view, _, output_fname in views:
+            if view is None:
+                self.logger.info(f'No percent identity table in the analysis context, skip the "{output_fname}" heatmap')
+        views = [v for v in views if v[0] is not None]
+
+        if self.top_n is not None:
+            taxa = top_taxa(count_df=self.context.count_matrix, n=self.top_n, rank_by=self.rank_by)
+            views = [(select_taxa(df=view, taxa=taxa), colormap, output_fname) for view, colormap, output_fname in views]
+
+        jobs = [
+            (PlotOneHeatmap, {
+                'df': view,
+                'sample_sheet': self.context.sample_sheet,
+                'log_pseudocount': False,  # counts already transformed
+                'normalize_by_sample_reads': False,
+                'colormap': colormap,
+                'output_fname': output_fname,
+                'large_matrix': self.large_matrix,
+            })
+            for view, colormap, output_fname in views
+        ]
+        RenderFigures(self.settings).main(jobs=jobs)  # the heatmaps are rendered concurrently
+
+
+def top_taxa(count_df: Union[pd.DataFrame, TaxonMatrix], n: int, rank_by: str) -> List[str]:
+    """
+    Top `n` taxa by mean relative abundance over samples,
+    or by prevalence (number of samples present) with ties broken by mean relative abundance
+
+    The OTHERS row of unassigned reads is not ranked, as it is in every sample and usually the most abundant,
+    it is kept in addition to the `n` taxa
+    """
+    assert rank_by in RANK_BY, f'Unknown taxon ranking "{rank_by}", choose from {RANK_BY}'
+    matrix = count_df if isinstance(count_df, TaxonMatrix) else TaxonMatrix.from_dataframe(count_df)
+
+    sums = matrix.column_sums()
+    relative = matrix.divide_columns(np.where(sums > 0, sums, 1.))
+    mean_abundance = np.asarray(relative.values.sum(axis=1)).ravel() / max(1, matrix.shape[1])
+    prevalence = np.asarray((matrix.values > 0).sum(axis=1)).ravel()
+
+    if rank_by == PREVALENCE:
+        order = np.lexsort((-mean_abundance, -prevalence))
+    else:
+        order = np.argsort(-mean_abundance, kind='stable')
+    is_others = matrix.index[order] == OTHERS
+    return matrix.index[order[~is_others][:n]].tolist() + matrix.index[order[is_others]].tolist()
+
+
+def select_taxa(
+        df: Union[pd.DataFrame, TaxonMatrix],
+        taxa: List[str]) -> Union[pd.DataFrame, TaxonMatrix]:
+    """
+    Rows of the given taxa, kept in their original order
+    """
+    rows = np.flatnonzero(pd.Index(df.index).isin(taxa))
+    return df.select_rows(rows) if isinstance(df, TaxonMatrix) else df.iloc[rows]
 
 
 class PlotOneHeatmap(Processor):
 
-    df: pd.DataFrame
-    sample_sheet: str
+    df: Union[pd.DataFrame, TaxonMatrix]
+    sample_sheet: SampleSheet
     log_pseudocount: bool
     normalize_by_sample_reads: bool
     colormap: str
     output_fname: str
+    large_matrix: bool
 
     dstdir: str
 
     def main(
             self,
-            df: pd.DataFrame,
-            sample_sheet: str,
+            df: Union[pd.DataFrame, TaxonMatrix],
+            sample_sheet: Union[str, SampleSheet],
             log_pseudocount: bool,
             normalize_by_sample_reads: bool,
             colormap: str,
-            output_fname: str):
+            output_fname: str,
+            large_matrix: bool = False):
 
         self.df = df
-        self.sample_sheet = sample_sheet
+        self.sample_sheet = read_sample_sheet(sample_sheet)
         self.log_pseudocount = log_pseudocount
         self.normalize_by_sample_reads = normalize_by_sample_reads
         self.colormap = colormap
         self.output_fname = output_fname
+        self.large_matrix = large_matrix
 
         self.dstdir = f'{self.outdir}/{DSTDIR_NAME}'
         os.makedirs(self.dstdir, exist_ok=True)
@@ -87,10 +164,16 @@ class PlotOneHeatmap(Processor):
             data=self.df,
             sample_sheet=self.sample_sheet,
             colormap=self.colormap,
-            output_prefix=f'{self.dstdir}/{self.output_fname}')
+            output_prefix=f'{self.dstdir}/{self.output_fname}',
+            large_matrix=self.large_matrix)
 
 
 class Clustermap(Processor):
+    """
+    In `large_matrix` mode, cells are drawn without borders as one rasterized image layer at LARGE_MATRIX_DPI,
+    rows are LARGE_MATRIX_CELL_HEIGHT high and at most LARGE_MATRIX_MAX_ROW_LABELS rows are labeled,
+    so that thousands of taxa render in seconds into a small PDF (laying out tick labels dominates otherwise)
+    """
 
     CLUSTER_ROWS = False
     CLUSTER_COLUMNS = False
@@ -103,12 +186,17 @@ class Clustermap(Processor):
     COLORBAR_HORIZONTAL_POSITION = 1.
     FONTSIZE = 7
     LINE_WIDTH = 0.5
+    CELL_LINE_WIDTH = 0.25
     DPI = 600
+    LARGE_MATRIX_DPI = 150
+    LARGE_MATRIX_CELL_HEIGHT = 0.1 / 2.54
+    LARGE_MATRIX_MAX_ROW_LABELS = 100
 
     data: pd.DataFrame
-    sample_sheet: str
+    sample_sheet: SampleSheet
     colormap: str
     output_prefix: str
+    large_matrix: bool
 
     x_label_padding: float
     y_label_padding: float
@@ -117,15 +205,17 @@ class Clustermap(Processor):
 
     def main(
             self,
-            data: pd.DataFrame,
-            sample_sheet: str,
+            data: Union[pd.DataFrame, TaxonMatrix],
+            sample_sheet: Union[str, SampleSheet],
             colormap: str,
-            output_prefix: str):
+            output_prefix: str,
+            large_matrix: bool = False):
 
-        self.data = data.copy()
-        self.sample_sheet = sample_sheet
+        self.data = data.to_dataframe() if isinstance(data, TaxonMatrix) else data  # never modified in place
+        self.sample_sheet = read_sample_sheet(sample_sheet)
         self.colormap = colormap
         self.output_prefix = output_prefix
+        self.large_matrix = large_matrix
 
         self.tag_group_names_on_sample_columns()
         self.shorten_taxon_names_for_publication()
@@ -144,31 +234,13 @@ class Clustermap(Processor):
         if not self.settings.for_publication:
             return
 
-        def shorten_silva(s: str) -> str:
-            """
-            SILVA taxonomy format:
-
-            AY188352.1.1546 Bacteria;Bacillota;Bacilli;Lactobacillales;Streptococcaceae;Streptococcus;Streptococcus salivarius
-
-            Shortened format:
-
-            AY188352.1.1546 Streptococcus salivarius
-            """
-            prefix = s.split(' ')[0]
-            suffix = s.split(';')[-1]
-            return f'{prefix} {suffix}'
-
-        rename = {}
-        for idx in self.data.index:
-            if ';' in idx:
-                rename[idx] = shorten_silva(idx)
-
-        self.data.rename(index=rename, inplace=True)
+        self.data = self.data.set_axis([shorten_silva(taxon) for taxon in self.data.index], axis=0)
 
     def set_figsize(self):
         self.__set_x_y_label_padding()
         w = (len(self.data.columns) * self.CELL_WIDTH) + self.y_label_padding
-        h = (len(self.data.index) * self.CELL_HEIGHT) + self.x_label_padding
+        cell_height = self.LARGE_MATRIX_CELL_HEIGHT if self.large_matrix else self.CELL_HEIGHT
+        h = (len(self.data.index) * cell_height) + self.x_label_padding
         self.figsize = (w, h)
 
     def __set_x_y_label_padding(self):
@@ -191,11 +263,17 @@ class Clustermap(Processor):
             cmap=self.colormap,
             figsize=self.figsize,
             xticklabels=True,  # include every x label
-            yticklabels=True,  # include every y label
+            yticklabels=self.__yticklabels(),
             dendrogram_ratio=dendrogram_ratio,
-            linewidth=0.25)
+            linewidth=0 if self.large_matrix else self.CELL_LINE_WIDTH,
+            rasterized=self.large_matrix)
         self.__set_plotted_data()
 
+    def __yticklabels(self) -> Union[bool, int]:
+        if not self.large_matrix:
+            return True  # include every y label
+        return max(1, -(-len(self.data) // self.LARGE_MATRIX_MAX_ROW_LABELS))  # label every n-th row
+
     def __set_plotted_data(self):
         self.data = self.grid.__dict__['data2d']
 
@@ -248,7 +326,7 @@ class Clustermap(Processor):
 
     def __downsize_dpi_if_too_large(self) -> int:
         longer_side = max(self.figsize)
-        dpi = self.DPI
+        dpi = self.LARGE_MATRIX_DPI if self.large_matrix else self.DPI
         while longer_side * dpi >= 2**15:  # 2^16 is the limit of matplotlib, but 2^15 is safer after some tests
             dpi = int(dpi/2)  # downsize
         return dpi
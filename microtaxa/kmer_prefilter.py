@@ -0,0 +1,319 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from typing import List, Tuple, Optional, Union
+from .utils import FastaParser
+from .template import Processor
+from .reference_index import BuildReferenceIndex, ReferenceIndex, find_reference_index
+
+
+K = 12
+SAMPLING = 4  # keep k-mers whose hash is divisible by SAMPLING, the same k-mers are kept in queries and references
+MAX_POSTINGS_FRACTION = 0.01  # k-mers in conserved regions hit most references and carry no signal
+INVALID_BASE = 4
+
+BASE_TO_CODE = np.full(256, INVALID_BASE, dtype=np.uint8)
+for _bases, _code in [(b'Aa', 0), (b'Cc', 1), (b'Gg', 2), (b'TtUu', 3)]:
+    BASE_TO_CODE[np.frombuffer(_bases, dtype=np.uint8)] = _code
+
+
+def sampled_kmers(
+        seqs: Union[List[str], np.ndarray],
+        k: int = K,
+        sampling: int = SAMPLING) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Unique sampled k-mer codes of all sequences at once, str or bytes (a batch of SequenceParser.batches)
+
+    Returns (codes, seq_indices), sorted by sequence index then code
+    """
+    if len(seqs) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    separator = b'N' * k  # no window spans two sequences
+    joined = separator.join(s if isinstance(s, bytes) else s.encode() for s in seqs)
+    bases = BASE_TO_CODE[np.frombuffer(joined, dtype=np.uint8)]
+    if len(bases) < k:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    lengths = np.array([len(s) for s in seqs], dtype=np.int64)
+    seq_index_of_position = np.repeat(np.arange(len(seqs)), lengths + k)[:len(bases)]
+
+    n = len(bases) - k + 1
+    codes = np.zeros(n, dtype=np.int64)
+    for j in range(k):  # rolling 2-bit encoding, one window position per element
+        codes = (codes << 2) | (bases[j:j + n] & 3)
+
+    invalid_cumsum = np.concatenate([[0], np.cumsum(bases == INVALID_BASE)])
+    valid = (invalid_cumsum[k:] - invalid_cumsum[:n]) == 0
+
+    hashed = (codes * 2654435761) % 2**32  # Knuth multiplicative hash
+    positions = np.flatnonzero(valid & (hashed % sampling == 0))
+    seq_indices = seq_index_of_position[positions]
+
+    n_codes = 4 ** k
+    keys = np.unique(seq_indices * n_codes + codes[positions])
+    return keys % n_codes, keys // n_codes
+
+
+class BuildKmerIndex(Processor):
+    """
+    Inverted index from sampled k-mer code to the references containing it
+
+    Index files:
+        metadata.json   k, sampling, number of references
+        offsets.npy     4^k + 1 offsets, postings of code c are refs[offsets[c]:offsets[c + 1]]
+        refs.npy        integer subject indices of the reference index, sorted by code
+    """
+
+    BATCH_SIZE = 2000  # references per vectorized batch
+
+    reference_index_dir: str
+    index_dir: str
+
+    n_refs: int
+    all_codes: List[np.ndarray]
+    all_refs: List[np.ndarray]
+
+    def main(
+            self,
+            reference_index_dir: str,
+            index_dir: str) -> str:
+
+        self.reference_index_dir = reference_index_dir
+        self.index_dir = index_dir
+
+        if os.path.exists(f'{self.index_dir}/metadata.json'):
+            return self.index_dir
+
+        self.collect_kmers()
+        self.write_index()
+
+        return self.index_dir
+
+    def collect_kmers(self):
+        ref_index = ReferenceIndex(self.reference_index_dir)
+        self.n_refs = len(ref_index)
+        self.all_codes, self.all_refs = [], []
+
+        first = 0
+        with FastaParser(ref_index.ref_fa) as parser:  # same order as the reference index
+            for _, seqs in parser.batches(size=self.BATCH_SIZE):
+                self.__add_batch(batch=seqs, first=first)
+                first += len(seqs)
+
+    def __add_batch(self, batch: np.ndarray, first: int):
+        codes, seq_indices = sampled_kmers(batch)
+        self.all_codes.append(codes.astype(np.int32))
+        self.all_refs.append((seq_indices + first).astype(np.int32))
+
+    def write_index(self):
+        codes = np.concatenate(self.all_codes)
+        refs = np.concatenate(self.all_refs)
+
+        counts = np.bincount(codes, minlength=4 ** K)
+        max_postings = max(1, int(self.n_refs * MAX_POSTINGS_FRACTION))
+        frequent = counts > max_postings
+        keep = ~frequent[codes]
+        codes, refs = codes[keep], refs[keep]
+        counts[frequent] = 0
+
+        offsets = np.zeros(4 ** K + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        order = np.argsort(codes, kind='stable')
+
+        temp_dir = f'{self.index_dir}.temp'
+        os.makedirs(temp_dir, exist_ok=True)
+        np.save(f'{temp_dir}/offsets.npy', offsets)
+        np.save(f'{temp_dir}/refs.npy', refs[order])
+        with open(f'{temp_dir}/metadata.json', 'w') as fh:
+            json.dump({'k': K, 'sampling': SAMPLING, 'n_refs': self.n_refs}, fh, indent=2)
+        os.replace(temp_dir, self.index_dir)
+
+        self.logger.info(f'k-mer index of {self.n_refs} references, {frequent.sum()} frequent k-mers dropped: "{self.index_dir}"')
+
+
+class KmerIndex:
+
+    offsets: np.ndarray
+    refs: np.ndarray
+    n_refs: int
+
+    def __init__(self, index_dir: str):
+        self.offsets = np.load(f'{index_dir}/offsets.npy', mmap_mode='r')
+        self.refs = np.load(f'{index_dir}/refs.npy', mmap_mode='r')
+        with open(f'{index_dir}/metadata.json') as fh:
+            self.n_refs = json.load(fh)['n_refs']
+
+    def top_candidates(self, seqs: List[str], top_k: int) -> np.ndarray:
+        """
+        Union over all query sequences of the top_k references by number of shared k-mers
+        """
+        codes, queries = sampled_kmers(seqs)
+        starts = self.offsets[codes]
+        lengths = self.offsets[codes + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        # gather all postings of all query k-mers in one go
+        group_starts = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - group_starts, lengths) + np.arange(total)
+        refs = np.asarray(self.refs[positions], dtype=np.int64)
+        queries = np.repeat(queries, lengths)
+
+        keys, shared = np.unique(queries * self.n_refs + refs, return_counts=True)
+        queries, refs = keys // self.n_refs, keys % self.n_refs
+
+        order = np.lexsort((-shared, queries))  # by query, most shared k-mers first
+        queries, refs = queries[order], refs[order]
+        group_first = np.searchsorted(queries, queries, side='left')
+        rank = np.arange(len(queries)) - group_first
+        return np.unique(refs[rank < top_k])
+
+
+class KmerPrefilter(Processor):
+    """
+    For each query shard, writes a temporary glsearch library of the top-K candidate references by shared k-mers
+
+    The reference index (build-index) is used to extract candidate sequences,
+    and is built in the workdir if there is none for the reference
+    """
+
+    INDEX_DIRNAME = 'kmer-prefilter-index'
+
+    query_fas: List[str]
+    ref_fa: str
+    top_k: int
+
+    reference_index_dir: str
+    kmer_index_dir: str
+    library_fas: List[str]
+
+    def main(
+            self,
+            query_fas: List[str],
+            ref_fa: str,
+            top_k: int) -> Tuple[List[str], int]:
+        """
+        Returns the library fasta of each query fasta, and the size of the full reference for the database size of E-values (glsearch -Z)
+        """
+        self.query_fas = query_fas
+        self.ref_fa = ref_fa
+        self.top_k = top_k
+
+        self.set_reference_index_dir()
+        self.set_kmer_index_dir()
+
+        ref_index = ReferenceIndex(self.reference_index_dir, ref_fa=self.ref_fa)
+        kmer_index = KmerIndex(self.kmer_index_dir)
+
+        self.library_fas = []
+        for query_fa in self.query_fas:
+            library_fa = f'{query_fa[:-len(".fasta")]}-library.fasta'
+            self.write_library(
+                query_fa=query_fa,
+                library_fa=library_fa,
+                ref_index=ref_index,
+                kmer_index=kmer_index)
+            self.library_fas.append(library_fa)
+
+        return self.library_fas, len(ref_index)
+
+    def set_reference_index_dir(self):
+        index_dir = find_reference_index(self.ref_fa)
+        if index_dir is None:
+            index_dir = BuildReferenceIndex(self.settings).main(
+                ref_fa=self.ref_fa,
+                index_root=f'{self.workdir}/{self.INDEX_DIRNAME}')
+        self.reference_index_dir = index_dir
+
+    def set_kmer_index_dir(self):
+        name = f'{os.path.basename(self.reference_index_dir)}-k{K}-s{SAMPLING}'
+        self.kmer_index_dir = BuildKmerIndex(self.settings).main(
+            reference_index_dir=self.reference_index_dir,
+            index_dir=f'{self.workdir}/{self.INDEX_DIRNAME}/{name}')
+
+    def write_library(
+            self,
+            query_fa: str,
+            library_fa: str,
+            ref_index: ReferenceIndex,
+            kmer_index: KmerIndex):
+
+        with FastaParser(query_fa) as parser:
+            seqs = [seq for _, seq in parser]
+
+        candidates = kmer_index.top_candidates(seqs=seqs, top_k=self.top_k)
+        with open(library_fa, 'w') as fh:
+            for i in candidates:  # sorted, sequential reads of ref_fa
+                fh.write(f'>{ref_index.header(i)}\n{ref_index.sequence(i)}\n')
+
+        self.logger.debug(f'{len(seqs)} queries in "{query_fa}", {len(candidates)} candidate references')
+
+
+class ValidateKmerPrefilter(Processor):
+    """
+    Compares the best hits of prefiltered and exhaustive glsearch on the same queries
+    """
+
+    CSV_NAME = 'glsearch-kmer-prefilter-validation.csv'
+
+    prefiltered_tsv: str
+    exhaustive_tsv: str
+    query_ids: List[str]
+
+    df: pd.DataFrame
+
+    def main(
+            self,
+            prefiltered_tsv: str,
+            exhaustive_tsv: str,
+            query_ids: List[str]) -> Optional[float]:
+        """
+        Returns the fraction of queries whose best hit differs
+        """
+        self.prefiltered_tsv = prefiltered_tsv
+        self.exhaustive_tsv = exhaustive_tsv
+        self.query_ids = query_ids
+
+        prefiltered = self.best_hits(tsv=self.prefiltered_tsv)
+        exhaustive = self.best_hits(tsv=self.exhaustive_tsv)
+
+        data = []
+        for query_id in self.query_ids:
+            pi_1, subjects_1 = exhaustive.get(query_id, (np.nan, set()))
+            pi_2, subjects_2 = prefiltered.get(query_id, (np.nan, set()))
+            same = (np.isnan(pi_1) and np.isnan(pi_2)) or (pi_1 == pi_2 and len(subjects_1 & subjects_2) > 0)
+            data.append({
+                'Query ID': query_id,
+                'Exhaustive Best Percent Identity': pi_1,
+                'Prefiltered Best Percent Identity': pi_2,
+                'Same Best Hit': same,
+            })
+        self.df = pd.DataFrame(data, columns=[
+            'Query ID',
+            'Exhaustive Best Percent Identity',
+            'Prefiltered Best Percent Identity',
+            'Same Best Hit',
+        ])
+        self.df.to_csv(f'{self.outdir}/{self.CSV_NAME}', index=False)
+
+        if len(self.df) == 0:
+            return None
+        n_differ = int((~self.df['Same Best Hit']).sum())
+        fraction = n_differ / len(self.df)
+        self.logger.info(f'k-mer prefilter validation: best hit differs from exhaustive search for {n_differ} of {len(self.df)} queries ({fraction:.2%})')
+        return fraction
+
+    def best_hits(self, tsv: str) -> dict:
+        """
+        {query ID: (best percent identity, set of subject IDs tied at the best)}
+        """
+        df = pd.read_csv(tsv, sep='\t', header=None, usecols=[0, 1, 2], names=['Query ID', 'Subject ID', 'Percent Identity'])
+        df['Query ID'] = df['Query ID'].astype(str)
+        ret = {}
+        for query_id, group in df.groupby('Query ID'):
+            best = group['Percent Identity'].max()
+            ret[query_id] = (best, set(group.loc[group['Percent Identity'] == best, 'Subject ID']))
+        return ret
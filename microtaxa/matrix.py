@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from typing import List, Dict, Union, Optional, Sequence
+
+
+class TaxonMatrix:
+    """
+    Sparse taxon x sample matrix, rows and columns are integer codes into `index` and `columns`
+
+    Only entries different from `fill_value` are stored:
+        0 for count tables, taxa absent from a sample
+        NaN for percent identity tables, no hit in a sample
+
+    Most taxa are absent from most samples, so rows are densified only when plotted or tested
+    """
+
+    ROWS_PER_CSV_CHUNK = 10000
+    DTYPES = [np.float64, np.float32]  # other dtypes are converted to float64
+
+    values: sparse.csr_matrix
+    index: pd.Index
+    columns: pd.Index
+    fill_value: float
+
+    def __init__(
+            self,
+            values: sparse.spmatrix,
+            index: Sequence[str],
+            columns: Sequence[str],
+            fill_value: float = 0.):
+
+        dtype = values.dtype if values.dtype in self.DTYPES else np.float64
+        self.values = sparse.csr_matrix(values, dtype=dtype)
+        self.index = pd.Index(index)
+        self.columns = pd.Index(columns)
+        self.fill_value = fill_value
+        assert self.values.shape == (len(self.index), len(self.columns))
+
+    @classmethod
+    def from_coordinates(
+            cls,
+            rows: np.ndarray,
+            columns: np.ndarray,
+            data: np.ndarray,
+            index: Sequence[str],
+            column_names: Sequence[str],
+            fill_value: float = 0.) -> 'TaxonMatrix':
+        """
+        Builds the matrix from (row code, column code, value) records, values equal to `fill_value` are not stored
+        """
+        rows, columns, data = np.asarray(rows), np.asarray(columns), np.asarray(data, dtype=np.float64)
+        keep = ~np.isnan(data) if np.isnan(fill_value) else data != fill_value
+        values = sparse.coo_matrix(
+            (data[keep], (rows[keep], columns[keep])),
+            shape=(len(index), len(column_names)))
+        return cls(values=values, index=index, columns=column_names, fill_value=fill_value)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, fill_value: float = 0.) -> 'TaxonMatrix':
+        dense = df.to_numpy(dtype=np.float64)
+        rows, columns = np.indices(dense.shape)
+        return cls.from_coordinates(
+            rows=rows.ravel(),
+            columns=columns.ravel(),
+            data=dense.ravel(),
+            index=df.index,
+            column_names=df.columns,
+            fill_value=fill_value)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def to_dataframe(self, rows: Optional[Union[slice, np.ndarray, List[int]]] = None) -> pd.DataFrame:
+        """
+        Dense DataFrame of the given row positions, all rows by default
+        """
+        if rows is None:
+            rows = slice(None)
+        values = self.values[rows].tocoo()
+        dense = np.full(values.shape, self.fill_value, dtype=self.values.dtype)
+        dense[values.row, values.col] = values.data
+        return pd.DataFrame(dense, index=self.index[rows], columns=self.columns, copy=False)
+
+    def to_transposed_dataframe(self) -> pd.DataFrame:
+        """
+        Dense sample x taxon DataFrame, same as to_dataframe().transpose() without densifying twice
+        """
+        values = self.values.T.tocoo()
+        dense = np.full(values.shape, self.fill_value, dtype=self.values.dtype)
+        dense[values.row, values.col] = values.data
+        return pd.DataFrame(dense, index=self.columns, columns=self.index, copy=False)
+
+    def to_csv(self, path: str):
+        """
+        Same output as to_dataframe().to_csv(path), densified one chunk of rows at a time
+        """
+        with open(path, 'w') as fh:
+            for start in range(0, max(len(self), 1), self.ROWS_PER_CSV_CHUNK):
+                df = self.to_dataframe(rows=slice(start, start + self.ROWS_PER_CSV_CHUNK))
+                df.to_csv(fh, header=(start == 0))
+
+    def select_rows(self, rows: Union[np.ndarray, List[int]]) -> 'TaxonMatrix':
+        """
+        Rows at the given positions, still sparse
+        """
+        return TaxonMatrix(values=self.values[rows], index=self.index[rows], columns=self.columns, fill_value=self.fill_value)
+
+    def select_columns(self, columns: Union[np.ndarray, List[int]]) -> 'TaxonMatrix':
+        """
+        Columns at the given positions, still sparse
+        """
+        return TaxonMatrix(values=self.values[:, columns], index=self.index, columns=self.columns[columns], fill_value=self.fill_value)
+
+    def set_index(self, index: Sequence[str]) -> 'TaxonMatrix':
+        return TaxonMatrix(values=self.values, index=index, columns=self.columns, fill_value=self.fill_value)
+
+    def rename(self, index: Dict[str, str]) -> 'TaxonMatrix':
+        return self.set_index([index.get(i, i) for i in self.index])
+
+    def append_row(self, label: str, row: np.ndarray) -> 'TaxonMatrix':
+        row = TaxonMatrix.from_coordinates(
+            rows=np.zeros(len(self.columns), dtype=np.int64),
+            columns=np.arange(len(self.columns)),
+            data=row,
+            index=[label],
+            column_names=self.columns,
+            fill_value=self.fill_value)
+        return TaxonMatrix(
+            values=sparse.vstack([self.values, row.values]),
+            index=self.index.append(pd.Index([label])),
+            columns=self.columns,
+            fill_value=self.fill_value)
+
+    def column_sums(self) -> np.ndarray:
+        """
+        NaN are skipped as in DataFrame.sum()
+        """
+        data = self.values.data
+        if np.isnan(data).any():
+            data = np.nan_to_num(data, nan=0.)
+        sums = np.bincount(self.values.indices, weights=data, minlength=self.values.shape[1])
+        if not np.isnan(self.fill_value):
+            sums += self.fill_value * (len(self) - self.values.getnnz(axis=0))
+        return sums
+
+    def divide_columns(self, divisors: np.ndarray) -> 'TaxonMatrix':
+        """
+        Only for fill values unchanged by division (0 or NaN)
+        """
+        values = self.values.copy()
+        values.data = values.data / np.asarray(divisors, dtype=np.float64)[values.indices]  # keeps stored zeros
+        return TaxonMatrix(values=values, index=self.index, columns=self.columns, fill_value=self.fill_value)
+
+    def log10_pseudocount(self) -> 'TaxonMatrix':
+        """
+        log10(x + 1), which maps the fill value 0 to 0
+        """
+        values = self.values.copy()
+        values.data = np.log10(values.data + 1)
+        return TaxonMatrix(values=values, index=self.index, columns=self.columns, fill_value=np.log10(self.fill_value + 1))
@@ -1,25 +1,44 @@
 from typing import Optional, Tuple
 from .template import Processor
+from .codec import WriteIntermediate, codec_suffix, NONE
+from .read_merger import MergeReadPairs, CompareMergedReads
+
+
+PEAR = 'pear'
+NUMPY = 'numpy'  # built-in, read_merger.MergeReadPairs
+MERGERS = [PEAR, NUMPY]
 
 
 class MergePairedEndReads(Processor):
 
     DSTDIR_NAME = 'merged-fastq'
     MIN_OVERLAP = 10
+    THREADS_PER_JOB = 4
 
     sample_id: str
     fastq_pair: Tuple[str, Optional[str]]
+    merger: str
+    validate_merger: bool
 
     dstdir: str
     output_fastq: str
+    temp_dir: str
 
     def main(
             self,
             sample_id: str,
-            fastq_pair: Tuple[str, Optional[str]]) -> str:
-
+            fastq_pair: Tuple[str, Optional[str]],
+            merger: str = PEAR,
+            validate_merger: bool = False) -> str:
+        """
+        If `validate_merger`, pairs are also merged by the other merger and the two compared,
+        see read_merger.CompareMergedReads
+        """
         self.sample_id = sample_id
         self.fastq_pair = fastq_pair
+        self.merger = merger
+        self.validate_merger = validate_merger
+        assert self.merger in MERGERS, f'Unknown read merger "{self.merger}", choose from {MERGERS}'
 
         self.make_dstdir()
         self.set_output_fastq()
@@ -28,7 +47,11 @@ class MergePairedEndReads(Processor):
         if fq2 is None:
             self.copy_fq1()
         else:
+            self.make_temp_dir()
             self.merge_fq1_fq2()
+            if self.validate_merger:
+                self.compare_mergers()
+            self.call(f'rm -r {self.temp_dir}')
 
         return self.output_fastq
 
@@ -37,20 +60,33 @@ class MergePairedEndReads(Processor):
         self.call(f'mkdir -p {self.dstdir}')
 
     def set_output_fastq(self):
-        self.output_fastq = f'{self.dstdir}/{self.sample_id}.fastq.gz'
+        suffix = codec_suffix(self.settings.intermediate_codec)
+        self.output_fastq = f'{self.dstdir}/{self.sample_id}.fastq{suffix}'
 
     def copy_fq1(self):
-        fq1 = self.fastq_pair[0]
-        if fq1.endswith('.gz'):
-            self.call(f'cp {fq1} {self.output_fastq}')
-        else:
-            self.call(f'gzip -c {fq1} > {self.output_fastq}')
+        WriteIntermediate(self.settings).main(
+            src=self.fastq_pair[0],
+            dst=self.output_fastq)
+
+    def make_temp_dir(self):
+        self.temp_dir = f'{self.workdir}/pear-temp/{self.sample_id}'  # one per sample, other samples may be running
+        self.call(f'mkdir -p {self.temp_dir}')
 
     def merge_fq1_fq2(self):
-        temp_dir = f'{self.workdir}/pear-temp'
-        self.call(f'mkdir -p {temp_dir}')
+        if self.merger == NUMPY:
+            MergeReadPairs(self.settings).main(
+                fq1=self.fastq_pair[0],
+                fq2=self.fastq_pair[1],
+                output_fastq=self.output_fastq,
+                min_overlap=self.MIN_OVERLAP)
+        else:
+            WriteIntermediate(self.settings).main(
+                src=self.run_pear(),
+                dst=self.output_fastq,
+                move=True)
 
-        output_prefix = f'{temp_dir}/{self.sample_id}'
+    def run_pear(self) -> str:
+        output_prefix = f'{self.temp_dir}/{self.sample_id}'
         log = f'{self.outdir}/pear.log'
         args = [
             'pear',
@@ -63,6 +99,21 @@ class MergePairedEndReads(Processor):
             f'2>> "{log}"'
         ]
         self.call(self.CMD_LINEBREAK.join(args))
+        return f'{output_prefix}.assembled.fastq'
 
-        self.call(f'gzip -c {output_prefix}.assembled.fastq > {self.output_fastq}')
-        self.call(f'rm -r {temp_dir}')
+    def compare_mergers(self):
+        if self.merger == NUMPY:
+            pear_fastq, numpy_fastq = self.run_pear(), self.output_fastq
+        else:
+            pear_fastq, numpy_fastq = self.output_fastq, f'{self.temp_dir}/{self.sample_id}.numpy.fastq'
+            MergeReadPairs(self.settings).main(
+                fq1=self.fastq_pair[0],
+                fq2=self.fastq_pair[1],
+                output_fastq=numpy_fastq,
+                min_overlap=self.MIN_OVERLAP,
+                codec=NONE)
+
+        CompareMergedReads(self.settings).main(
+            sample_id=self.sample_id,
+            pear_fastq=pear_fastq,
+            numpy_fastq=numpy_fastq)
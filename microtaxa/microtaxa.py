@@ -1,19 +1,32 @@
-import pandas as pd
-from os.path import basename
-from typing import Optional, List, Tuple
+import os
+import json
+import shutil
+from os.path import basename, getsize
+from typing import Optional, List, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
 from .template import Processor
-from .grouping import GetColors
+from .utils import FastaParser, FastqParser, get_read_stats_json
+from .grouping import GetColors, SampleSheet
+from .matrix import TaxonMatrix
 from .aggregate import Aggregate
-from .heatmap import PlotHeatmaps
-from .merge import MergePairedEndReads
+from .rarefaction import Rarefy
+from .table_formats import WriteTaxonTables, check_output_formats
+from .analysis_context import AnalysisContext
+from .heatmap import PlotHeatmaps, MEAN_ABUNDANCE
+from .normalization import LOG_PSEUDOCOUNT
+from .merge import MergePairedEndReads, PEAR
+from .dereplicate import Dereplicate
+from .exact_match import ExactMatch
+from .kmer_prefilter import KmerPrefilter, ValidateKmerPrefilter
+from .parallel import SampleScheduler
 from .differential_abundance import DifferentialAbundance
-from .trimming import TrimGalorePairedEnd, TrimGaloreSingleEnd
+from .trimming import TrimGalore, TrimGalorePairedEnd, TrimGaloreSingleEnd, TRIM_GALORE, NUMPY as NUMPY_TRIMMER
 
 
 class MicroTaxa(Processor):
 
     ref_fa: str
-    sample_sheet: str
+    sample_sheet: Union[str, SampleSheet]
     fq_dir: str
     fq1_suffix: str
     fq2_suffix: Optional[str]
@@ -23,16 +36,42 @@ class MicroTaxa(Processor):
     clip_r2_5_prime: int
     colormap: str
     invert_colors: bool
+    exact_match: bool
+    forward_primer: Optional[str]
+    reverse_primer: Optional[str]
+    glsearch_threads_per_worker: Optional[int]
+    kmer_prefilter_top_k: int
+    kmer_prefilter_validation_size: int
+    read_merger: str
+    validate_read_merger: bool
+    trimmer: str
+    boxplot_max_p_value: Optional[float]
+    boxplot_adjusted_p_value: bool
+    boxplot_top_n: Optional[int]
+    boxplot_pdf: bool
+    heatmap_large_matrix: bool
+    heatmap_top_n: Optional[int]
+    heatmap_rank_by: str
+    heatmap_count_transform: str
+    rarefaction_depth: Optional[int]
+    rarefaction_draws: int
+    rarefaction_seed: int
+    output_formats: List[str]
 
     sample_ids: List[str]
     fastq_pairs: List[Tuple[str, Optional[str]]]
     trimmed_fastq_pairs: List[Tuple[str, Optional[str]]]
     merged_fastqs: List[str]
     fastas: List[str]
+    unique_fasta: str
+    abundance_tsv: str
+    exact_match_tsvs: List[str]
+    unresolved_fasta: str
     glsearch_tsvs: List[str]
-    count_df: pd.DataFrame
-    percent_id_mean_df: pd.DataFrame
-    percent_id_std_df: pd.DataFrame
+    count_df: TaxonMatrix
+    percent_id_mean_df: TaxonMatrix
+    percent_id_std_df: TaxonMatrix
+    context: AnalysisContext
 
     def main(
             self,
@@ -46,7 +85,28 @@ class MicroTaxa(Processor):
             clip_r1_5_prime: int,
             clip_r2_5_prime: int,
             colormap: str,
-            invert_colors: bool):
+            invert_colors: bool,
+            exact_match: bool = False,
+            forward_primer: Optional[str] = None,
+            reverse_primer: Optional[str] = None,
+            glsearch_threads_per_worker: Optional[int] = None,
+            kmer_prefilter_top_k: int = 0,
+            kmer_prefilter_validation_size: int = 0,
+            read_merger: str = PEAR,
+            validate_read_merger: bool = False,
+            trimmer: str = TRIM_GALORE,
+            boxplot_max_p_value: Optional[float] = None,
+            boxplot_adjusted_p_value: bool = False,
+            boxplot_top_n: Optional[int] = None,
+            boxplot_pdf: bool = False,
+            heatmap_large_matrix: bool = False,
+            heatmap_top_n: Optional[int] = None,
+            heatmap_rank_by: str = MEAN_ABUNDANCE,
+            heatmap_count_transform: str = LOG_PSEUDOCOUNT,
+            rarefaction_depth: Optional[int] = None,
+            rarefaction_draws: int = 1,
+            rarefaction_seed: int = 0,
+            output_formats: Optional[List[str]] = None):
 
         self.ref_fa = ref_fa
         self.sample_sheet = sample_sheet
@@ -59,13 +119,39 @@ class MicroTaxa(Processor):
         self.clip_r2_5_prime = clip_r2_5_prime
         self.colormap = colormap
         self.invert_colors = invert_colors
-
+        self.exact_match = exact_match
+        self.forward_primer = forward_primer
+        self.reverse_primer = reverse_primer
+        self.glsearch_threads_per_worker = glsearch_threads_per_worker
+        self.kmer_prefilter_top_k = kmer_prefilter_top_k
+        self.kmer_prefilter_validation_size = kmer_prefilter_validation_size
+        self.read_merger = read_merger
+        self.validate_read_merger = validate_read_merger
+        self.trimmer = trimmer
+        self.boxplot_max_p_value = boxplot_max_p_value
+        self.boxplot_adjusted_p_value = boxplot_adjusted_p_value
+        self.boxplot_top_n = boxplot_top_n
+        self.boxplot_pdf = boxplot_pdf
+        self.heatmap_large_matrix = heatmap_large_matrix
+        self.heatmap_top_n = heatmap_top_n
+        self.heatmap_rank_by = heatmap_rank_by
+        self.heatmap_count_transform = heatmap_count_transform
+        self.rarefaction_depth = rarefaction_depth
+        self.rarefaction_draws = rarefaction_draws
+        self.rarefaction_seed = rarefaction_seed
+        self.output_formats = [] if output_formats is None else output_formats
+
+        check_output_formats(self.output_formats)  # before hours of alignment
         self.read_sample_sheet()
         self.trim_galore()
         self.merge_paired_end_reads()
         self.convert_fastqs_to_fastas()
+        self.dereplicate()
+        self.match_exact_sequences()
         self.run_glsearches()
         self.aggregate_search_results()
+        self.rarefy()
+        self.build_analysis_context()
         self.differential_abundance()
         self.plot_heatmaps()
         self.collect_log_files()
@@ -73,7 +159,8 @@ class MicroTaxa(Processor):
     def read_sample_sheet(self):
         self.sample_ids = []
         self.fastq_pairs = []
-        self.sample_ids = pd.read_csv(self.sample_sheet, index_col=0).index.tolist()
+        self.sample_sheet = SampleSheet(self.sample_sheet)  # parsed and validated once, passed to the analysis
+        self.sample_ids = self.sample_sheet.sample_ids
         for s in self.sample_ids:
             fq1 = f'{self.fq_dir}/{s}{self.fq1_suffix}'
             if self.fq2_suffix is None:
@@ -83,54 +170,135 @@ class MicroTaxa(Processor):
             self.fastq_pairs.append((fq1, fq2))
 
     def trim_galore(self):
-        self.trimmed_fastq_pairs = []
-        for fq1, fq2 in self.fastq_pairs:
-            if fq2 is None:
-                trimmed_fq = TrimGaloreSingleEnd(self.settings).main(
-                    fq=fq1,
-                    clip_5_prime=self.clip_r1_5_prime)
-                self.trimmed_fastq_pairs.append((trimmed_fq, None))
-            else:
-                trimmed_fq1, trimmed_fq2 = TrimGalorePairedEnd(self.settings).main(
-                    fq1=fq1,
-                    fq2=fq2,
-                    clip_r1_5_prime=self.clip_r1_5_prime,
-                    clip_r2_5_prime=self.clip_r2_5_prime)
-                self.trimmed_fastq_pairs.append((trimmed_fq1, trimmed_fq2))
+        threads_per_job = TrimGalore.BUILT_IN_THREADS_PER_JOB \
+            if self.trimmer == NUMPY_TRIMMER else TrimGalore.THREADS_PER_JOB
+        single_end = self.fq2_suffix is None
+        if single_end:
+            trimmed_fqs = SampleScheduler(self.settings).main(
+                processor=TrimGaloreSingleEnd,
+                kwargs_list=[
+                    {'fq': fq1, 'clip_5_prime': self.clip_r1_5_prime, 'trimmer': self.trimmer}
+                    for fq1, _ in self.fastq_pairs
+                ],
+                threads_per_job=threads_per_job)
+            self.trimmed_fastq_pairs = [(fq, None) for fq in trimmed_fqs]
+        else:
+            self.trimmed_fastq_pairs = SampleScheduler(self.settings).main(
+                processor=TrimGalorePairedEnd,
+                kwargs_list=[
+                    {
+                        'fq1': fq1,
+                        'fq2': fq2,
+                        'clip_r1_5_prime': self.clip_r1_5_prime,
+                        'clip_r2_5_prime': self.clip_r2_5_prime,
+                        'trimmer': self.trimmer,
+                    }
+                    for fq1, fq2 in self.fastq_pairs
+                ],
+                threads_per_job=threads_per_job)
 
     def merge_paired_end_reads(self):
-        self.merged_fastqs = []
-        for sample_id, fastq_pair in zip(self.sample_ids, self.trimmed_fastq_pairs):
-            fq = MergePairedEndReads(self.settings).main(
-                sample_id=sample_id,
-                fastq_pair=fastq_pair
-            )
-            self.merged_fastqs.append(fq)
+        self.merged_fastqs = SampleScheduler(self.settings).main(
+            processor=MergePairedEndReads,
+            kwargs_list=[
+                {
+                    'sample_id': sample_id,
+                    'fastq_pair': fastq_pair,
+                    'merger': self.read_merger,
+                    'validate_merger': self.validate_read_merger,
+                }
+                for sample_id, fastq_pair in zip(self.sample_ids, self.trimmed_fastq_pairs)
+            ],
+            threads_per_job=MergePairedEndReads.THREADS_PER_JOB)
 
     def convert_fastqs_to_fastas(self):
-        self.fastas = []
-        for fq in self.merged_fastqs:
-            fa = FastqToFasta(self.settings).main(fastq=fq)
-            self.fastas.append(fa)
+        self.fastas = SampleScheduler(self.settings).main(
+            processor=FastqToFasta,
+            kwargs_list=[{'fastq': fq} for fq in self.merged_fastqs],
+            threads_per_job=FastqToFasta.THREADS_PER_JOB)
+
+    def dereplicate(self):
+        # a single study-wide job, run through the scheduler for the stage cache
+        self.unique_fasta, self.abundance_tsv = SampleScheduler(self.settings).main(
+            processor=Dereplicate,
+            kwargs_list=[{'fastas': self.fastas}],
+            threads_per_job=Dereplicate.THREADS_PER_JOB)[0]
+
+    def match_exact_sequences(self):
+        self.exact_match_tsvs = []
+        self.unresolved_fasta = self.unique_fasta
+        if not self.exact_match:
+            return
+        hits_tsv, self.unresolved_fasta = SampleScheduler(self.settings).main(
+            processor=ExactMatch,
+            kwargs_list=[{
+                'query_fa': self.unique_fasta,
+                'ref_fa': self.ref_fa,
+                'forward_primer': self.forward_primer,
+                'reverse_primer': self.reverse_primer,
+            }],
+            threads_per_job=ExactMatch.THREADS_PER_JOB)[0]
+        self.exact_match_tsvs = [hits_tsv]
 
     def run_glsearches(self):
-        self.glsearch_tsvs = []
-        for fa in self.fastas:
-            tsv = Glsearch(self.settings).main(
-                query_fa=fa,
-                library_fa=self.ref_fa,
-                e_value=self.e_value)
-            self.glsearch_tsvs.append(tsv)
+        self.glsearch_tsvs = self.exact_match_tsvs + SampleScheduler(self.settings).main(
+            processor=Glsearch,
+            kwargs_list=[{
+                'query_fa': self.unresolved_fasta,
+                'library_fa': self.ref_fa,
+                'e_value': self.e_value,
+                'threads_per_worker': self.glsearch_threads_per_worker,
+                'prefilter_top_k': self.kmer_prefilter_top_k,
+                'prefilter_validation_size': self.kmer_prefilter_validation_size,
+            }],
+            threads_per_job=Glsearch.THREADS_PER_JOB)
 
     def aggregate_search_results(self):
         self.count_df, self.percent_id_mean_df, self.percent_id_std_df = Aggregate(self.settings).main(
             blast_tabular_tsvs=self.glsearch_tsvs,
             min_percent_identity=self.min_percent_identity,
             ref_fa=self.ref_fa,
-            query_fastas=self.fastas)
+            query_fastas=self.fastas,
+            abundance_tsv=self.abundance_tsv)
         self.count_df.to_csv(f'{self.outdir}/count-table.csv')
         self.percent_id_mean_df.to_csv(f'{self.outdir}/percent-identity-mean.csv')
         self.percent_id_std_df.to_csv(f'{self.outdir}/percent-identity-std.csv')
+        WriteTaxonTables(self.settings).main(
+            count_df=self.count_df,
+            percent_id_mean_df=self.percent_id_mean_df,
+            percent_id_std_df=self.percent_id_std_df,
+            formats=self.output_formats)
+
+    def rarefy(self):
+        """
+        The first draw replaces the count table of the analysis, all draws are written for downstream use
+
+        Percent identity tables keep the statistics of all reads, only the dropped samples are removed
+        """
+        if self.rarefaction_depth is None:
+            return
+        draws = Rarefy(self.settings).main(
+            count_df=self.count_df,
+            depth=self.rarefaction_depth,
+            n_draws=self.rarefaction_draws,
+            seed=self.rarefaction_seed)
+        dstdir = f'{self.outdir}/rarefaction'
+        os.makedirs(dstdir, exist_ok=True)
+        for i, draw in enumerate(draws, start=1):
+            draw.to_csv(f'{dstdir}/count-table-{i}.csv')
+
+        self.count_df = draws[0]
+        kept = self.percent_id_mean_df.columns.get_indexer(self.count_df.columns)  # samples deep enough
+        self.percent_id_mean_df = self.percent_id_mean_df.select_columns(kept)
+        self.percent_id_std_df = self.percent_id_std_df.select_columns(kept)
+
+    def build_analysis_context(self):
+        self.context = AnalysisContext(  # derived views shared by differential abundance and heatmaps
+            settings=self.settings,
+            count_df=self.count_df,
+            sample_sheet=self.sample_sheet,
+            percent_id_mean_df=self.percent_id_mean_df,
+            percent_id_std_df=self.percent_id_std_df)
 
     def differential_abundance(self):
         colors = GetColors(self.settings).main(
@@ -138,16 +306,20 @@ class MicroTaxa(Processor):
             colormap=self.colormap,
             invert_colors=self.invert_colors)
         DifferentialAbundance(self.settings).main(
-            count_df=self.count_df,
-            sample_sheet=self.sample_sheet,
-            colors=colors)
+            context=self.context,
+            colors=colors,
+            boxplot_max_p_value=self.boxplot_max_p_value,
+            boxplot_adjusted_p_value=self.boxplot_adjusted_p_value,
+            boxplot_top_n=self.boxplot_top_n,
+            boxplot_pdf=self.boxplot_pdf)
 
     def plot_heatmaps(self):
         PlotHeatmaps(self.settings).main(
-            count_df=self.count_df,
-            percent_id_mean_df=self.percent_id_mean_df,
-            percent_id_std_df=self.percent_id_std_df,
-            sample_sheet=self.sample_sheet)
+            context=self.context,
+            large_matrix=self.heatmap_large_matrix,
+            top_n=self.heatmap_top_n,
+            rank_by=self.heatmap_rank_by,
+            count_transform=self.heatmap_count_transform)
 
     def collect_log_files(self):
         self.call(f'mkdir -p {self.outdir}/log')
@@ -157,17 +329,23 @@ class MicroTaxa(Processor):
 class FastqToFasta(Processor):
 
     DSTDIR_NAME = 'fasta'
+    THREADS_PER_JOB = 1
 
     fastq: str
 
     fasta: str
+    read_count: int
+    base_count: int
+    min_length: Optional[int]
+    max_length: Optional[int]
 
     def main(self, fastq: str) -> str:
         self.fastq = fastq
 
         self.make_dstdir()
         self.set_fasta_path()
-        self.run_seqtk()
+        self.convert()
+        self.write_read_stats()
 
         return self.fasta
 
@@ -184,54 +362,243 @@ class FastqToFasta(Processor):
             fname = fname[:-6]
         self.fasta = f'{self.workdir}/{self.DSTDIR_NAME}/{fname}.fasta'
 
-    def run_seqtk(self):
-        lines = [
-            'seqtk seq',
-            f'-a {self.fastq}',
-            f'> {self.fasta}'
-        ]
-        self.call(self.CMD_LINEBREAK.join(lines))
+    def convert(self):
+        """
+        Streams the (gzipped) fastq in large blocks and writes whole records to the fasta,
+        collecting read count and length stats on the way
+        """
+        self.read_count, self.base_count = 0, 0
+        self.min_length, self.max_length = None, None
+        self.logger.info(f'Convert "{self.fastq}" to "{self.fasta}"')
+        if self.mock:
+            return
+
+        with FastqParser(self.fastq) as parser, open(self.fasta, 'wb') as writer:
+            for lines in parser.record_lines():
+                self.__write_records(writer=writer, lines=lines)
+
+    def __write_records(self, writer, lines: List[bytes]):
+        heads = lines[0::4]
+        seqs = lines[1::4]
+        if len(heads) == 0:
+            return
+        self.__update_read_stats(lengths=list(map(len, seqs)))
+
+        out = [b''] * (2 * len(seqs))
+        out[0::2] = heads
+        out[1::2] = seqs
+        text = b'\n'.join(out)
+        # sequence lines never start with '@', so every '@' at a line start is a header
+        text = b'>' + text[1:].replace(b'\n@', b'\n>') + b'\n'
+        writer.write(text)
+
+    def __update_read_stats(self, lengths: List[int]):
+        self.read_count += len(lengths)
+        self.base_count += sum(lengths)
+        lo, hi = min(lengths), max(lengths)
+        self.min_length = lo if self.min_length is None else min(self.min_length, lo)
+        self.max_length = hi if self.max_length is None else max(self.max_length, hi)
+
+    def write_read_stats(self):
+        if self.mock:
+            return
+        stats = {
+            'Read Count': self.read_count,
+            'Base Count': self.base_count,
+            'Min Length': self.min_length,
+            'Max Length': self.max_length,
+            'Mean Length': self.base_count / self.read_count if self.read_count > 0 else None,
+        }
+        with open(get_read_stats_json(self.fasta), 'w') as fh:
+            json.dump(stats, fh, indent=2)
 
 
 class Glsearch(Processor):
+    """
+    Query sharding: the query fasta is split into contiguous chunks of similar total length,
+    one glsearch36 worker per chunk runs concurrently with `threads_per_worker` threads,
+    and the chunk outputs are appended to one tsv in the original query order
+
+    Each query is aligned independently against the same library, so the result is identical to an unsharded run
+
+    Optional k-mer prefilter: each chunk is aligned only against its top-K candidate references by shared k-mers,
+    -Z sets the database size of E-values to that of the full library, but glsearch still estimates
+    its score statistics from the few candidates, so E-values differ from those of an exhaustive search
+    """
 
     DSTDIR_NAME = 'glsearch'
+    THREADS_PER_JOB = 4
+    THREADS_PER_WORKER = 4  # glsearch36 threading does not scale well beyond a few threads
+    QUERIES_PER_PREFILTER_SHARD = 1000  # smaller shards, smaller candidate libraries
 
     query_fa: str
     library_fa: str
     e_value: float
+    threads_per_worker: int
+    prefilter_top_k: int
+    prefilter_validation_size: int
 
+    dstdir: str
+    fname: str
     output_tsv: str
+    n_workers: int
+    query_ids: List[str]
+    shard_dir: str
+    shard_fas: List[str]
+    shard_library_fas: List[str]
+    db_size: Optional[int]
 
     def main(
             self,
             query_fa: str,
             library_fa: str,
-            e_value: float) -> str:
+            e_value: float,
+            threads_per_worker: Optional[int] = None,
+            prefilter_top_k: int = 0,
+            prefilter_validation_size: int = 0) -> str:
 
         self.query_fa = query_fa
         self.library_fa = library_fa
         self.e_value = e_value
+        self.threads_per_worker = self.THREADS_PER_WORKER if threads_per_worker is None else threads_per_worker
+        self.prefilter_top_k = prefilter_top_k
+        self.prefilter_validation_size = prefilter_validation_size
 
         self.make_dstdir()
 
-        fname = basename(self.query_fa)[:-len('.fasta')]
-        self.output_tsv = f'{self.workdir}/{self.DSTDIR_NAME}/{fname}.tsv'
+        self.fname = basename(self.query_fa)[:-len('.fasta')]
+        self.output_tsv = f'{self.dstdir}/{self.fname}.tsv'
+
+        if not self.mock and getsize(self.query_fa) == 0:  # e.g. all queries resolved by ExactMatch
+            open(self.output_tsv, 'w').close()
+            return self.output_tsv
+
+        self.n_workers = max(1, self.threads // max(1, self.threads_per_worker))
+        prefilter = self.prefilter_top_k > 0 and not self.mock
+        if not prefilter and (self.n_workers == 1 or self.mock):
+            self.glsearch(query_fa=self.query_fa, library_fa=self.library_fa, output_tsv=self.output_tsv, threads=self.threads)
+        else:
+            self.split_query_fa(prefilter=prefilter)
+            self.set_shard_libraries(prefilter=prefilter)
+            self.run_shards()
+            if prefilter and self.prefilter_validation_size > 0:
+                self.validate_prefilter()
+            if not self.debug:
+                shutil.rmtree(self.shard_dir)
+
+        return self.output_tsv
+
+    def make_dstdir(self):
+        self.dstdir = f'{self.workdir}/{self.DSTDIR_NAME}'
+        self.call(f'mkdir -p {self.dstdir}')
+
+    def split_query_fa(self, prefilter: bool):
+        with FastaParser(self.query_fa) as parser:
+            records = [(head, seq) for head, seq in parser]
+        self.query_ids = [head.split(' ')[0] for head, _ in records]
+
+        n_shards = self.n_workers
+        if prefilter:
+            n_shards = max(n_shards, -(-len(records) // self.QUERIES_PER_PREFILTER_SHARD))
+        n_shards = max(1, min(n_shards, len(records)))
+        total_length = sum(len(seq) for _, seq in records)
+        length_per_shard = total_length / n_shards
+
+        self.shard_dir = f'{self.dstdir}/{self.fname}-shards'
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+        self.shard_fas = []
+        fh, cumulative_length = None, 0
+        for head, seq in records:
+            i = min(int(cumulative_length / length_per_shard), n_shards - 1) if total_length > 0 else 0
+            if i >= len(self.shard_fas):  # start a new shard
+                if fh is not None:
+                    fh.close()
+                self.shard_fas.append(f'{self.shard_dir}/shard-{len(self.shard_fas) + 1:03}.fasta')
+                fh = open(self.shard_fas[-1], 'w')
+            fh.write(f'>{head}\n{seq}\n')
+            cumulative_length += len(seq)
+        if fh is not None:
+            fh.close()
+
+    def set_shard_libraries(self, prefilter: bool):
+        if prefilter:
+            self.shard_library_fas, self.db_size = KmerPrefilter(self.settings).main(
+                query_fas=self.shard_fas,
+                ref_fa=self.library_fa,
+                top_k=self.prefilter_top_k)
+        else:
+            self.shard_library_fas = [self.library_fa] * len(self.shard_fas)
+            self.db_size = None
+
+    def run_shards(self):
+        n_workers = min(self.n_workers, len(self.shard_fas))
+        threads = max(1, self.threads // n_workers)
+        shard_tsvs = [f'{fa[:-len(".fasta")]}.tsv' for fa in self.shard_fas]
+
+        # glsearch36 runs in subprocesses, threads here only wait on them
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = [
+                executor.submit(
+                    self.glsearch,
+                    query_fa=fa,
+                    library_fa=library_fa,
+                    output_tsv=tsv,
+                    threads=threads,
+                    db_size=self.db_size)
+                for fa, library_fa, tsv in zip(self.shard_fas, self.shard_library_fas, shard_tsvs)
+            ]
+            with open(self.output_tsv, 'wb') as writer:
+                for future, tsv in zip(futures, shard_tsvs):  # append in the original query order
+                    future.result()
+                    with open(tsv, 'rb') as reader:
+                        shutil.copyfileobj(reader, writer)
+
+    def validate_prefilter(self):
+        query_ids = self.query_ids[:self.prefilter_validation_size]
+        validation_fa = f'{self.shard_dir}/validation.fasta'
+        exhaustive_tsv = f'{self.shard_dir}/validation-exhaustive.tsv'
+
+        n = 0
+        with FastaParser(self.query_fa) as parser, open(validation_fa, 'w') as fh:
+            for head, seq in parser:
+                if n == len(query_ids):
+                    break
+                fh.write(f'>{head}\n{seq}\n')
+                n += 1
+
+        self.glsearch(query_fa=validation_fa, library_fa=self.library_fa, output_tsv=exhaustive_tsv, threads=self.threads)
+        ValidateKmerPrefilter(self.settings).main(
+            prefiltered_tsv=self.output_tsv,
+            exhaustive_tsv=exhaustive_tsv,
+            query_ids=query_ids)
+
+    def glsearch(
+            self,
+            query_fa: str,
+            library_fa: str,
+            output_tsv: str,
+            threads: int,
+            db_size: Optional[int] = None):
+
+        if not self.mock and getsize(library_fa) == 0:  # no candidate references
+            open(output_tsv, 'w').close()
+            return
+
         args = [
             'glsearch36',
             '-3',  # forward strand only
             '-m 8',  # BLAST tabular output format
             '-n',  # DNA/RNA query
             f'-E {self.e_value}',
-            f'-T {self.threads}',
-            self.query_fa,
-            self.library_fa,
-            f'1> "{self.output_tsv}"',
+            f'-T {threads}',
+        ]
+        if db_size is not None:
+            args.append(f'-Z {db_size}')  # only the database size of E-values, score statistics are from the candidates
+        args += [
+            query_fa,
+            library_fa,
+            f'1> "{output_tsv}"',
             f'2>> "{self.outdir}/glsearch.log"'
         ]
         self.call(self.CMD_LINEBREAK.join(args))
-
-        return self.output_tsv
-
-    def make_dstdir(self):
-        self.call(f'mkdir -p {self.workdir}/{self.DSTDIR_NAME}')
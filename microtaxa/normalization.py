@@ -1,37 +1,175 @@
 import numpy as np
 import pandas as pd
+from scipy import sparse
+from typing import Union, Optional
+from .matrix import TaxonMatrix
 from .template import Processor
 
 
+RELATIVE_ABUNDANCE = 'relative-abundance'  # fraction of the reads of each sample
+CPM = 'cpm'  # counts per million reads of each sample
+CLR = 'clr'  # centered log-ratio: ln(count + pseudocount) minus its mean over all taxa of each sample
+VST = 'vst'  # variance-stabilizing log2(CPM + pseudocount)
+LOG_PSEUDOCOUNT = 'log-pseudocount'  # log10(count + pseudocount)
+TRANSFORMS = [RELATIVE_ABUNDANCE, CPM, CLR, VST, LOG_PSEUDOCOUNT]
+
+
 class CountNormalization(Processor):
+    """
+    Vectorized transforms of taxon x sample tables, dense (DataFrame or array) or sparse (TaxonMatrix)
+
+    Each transform is at most a division by a per-sample divisor, an elementwise log and a per-sample centering,
+    all done in place on one output buffer of `dtype`, float32 halves the memory
+
+    A TaxonMatrix is never densified: the stored entries and the fill value are transformed,
+    the result shares the sparsity structure (indices) of the input.
+    CLR is the exception as absent taxa get a different value in each sample,
+    its dense result is filled sample by sample and the stored entries scattered into it
+
+    Dense results are written into `out` if given, e.g. the input array itself to transform in place
+    """
 
-    df: pd.DataFrame
+    CHUNK_SIZE = 2**20  # stored entries divided at a time
+
+    df: Union[pd.DataFrame, np.ndarray, TaxonMatrix]
     log_pseudocount: bool
     by_sample_reads: bool
     sample_reads_unit: int
+    transform: Optional[str]
+    pseudocount: float
+    dtype: np.dtype
+    out: Optional[np.ndarray]
 
     def main(
             self,
-            df: pd.DataFrame,
-            log_pseudocount: bool,
-            by_sample_reads: bool,
-            sample_reads_unit: int = 10000) -> pd.DataFrame:
+            df: Union[pd.DataFrame, np.ndarray, TaxonMatrix],
+            log_pseudocount: bool = False,
+            by_sample_reads: bool = False,
+            sample_reads_unit: int = 10000,
+            transform: Optional[str] = None,
+            pseudocount: float = 1.,
+            dtype: type = np.float64,
+            out: Optional[np.ndarray] = None) -> Union[pd.DataFrame, np.ndarray, TaxonMatrix]:
+        """
+        Either `by_sample_reads` scales each sample to `sample_reads_unit` reads and `log_pseudocount` takes log10(x + 1),
+        or `transform` (one of TRANSFORMS, with `pseudocount` for the log transforms) is applied to the counts
 
+        A DataFrame or array in gives the same out, TaxonMatrix gives TaxonMatrix (DataFrame for CLR)
+        """
         self.df = df
         self.log_pseudocount = log_pseudocount
         self.by_sample_reads = by_sample_reads
         self.sample_reads_unit = sample_reads_unit
+        self.transform = transform
+        self.pseudocount = pseudocount
+        self.dtype = np.dtype(dtype if out is None else out.dtype)
+        self.out = out
+
+        assert self.transform is None or self.transform in TRANSFORMS, \
+            f'Unknown transform "{self.transform}", choose from {TRANSFORMS}'
+        assert self.transform is None or not (self.log_pseudocount or self.by_sample_reads), \
+            'Use either a transform or the log_pseudocount and by_sample_reads options'
+
+        if isinstance(self.df, TaxonMatrix):
+            return self.transform_sparse()
+        return self.transform_dense()
+
+    def transform_sparse(self) -> Union[TaxonMatrix, pd.DataFrame]:
+        matrix = self.df
+        values = matrix.values
+        data = values.data.astype(self.dtype, copy=True)
+
+        divisors = self.divisors(column_sums=matrix.column_sums())
+        if divisors is not None:  # the fill value 0 (or NaN) is unchanged by division
+            for start in range(0, len(data), self.CHUNK_SIZE):  # bounds the gathered divisors in memory
+                end = start + self.CHUNK_SIZE
+                data[start:end] /= divisors[values.indices[start:end]]
+        self.elementwise(data)
+
+        if self.transform == CLR:
+            return self.sparse_clr(data=data)
+
+        fill_value = self.elementwise(np.array([matrix.fill_value], dtype=np.float64))[0]
+        return TaxonMatrix(
+            values=sparse.csr_matrix((data, values.indices, values.indptr), shape=values.shape),
+            index=matrix.index,
+            columns=matrix.columns,
+            fill_value=fill_value)
+
+    def sparse_clr(self, data: np.ndarray) -> pd.DataFrame:
+        """
+        Absent taxa have count 0, ln(0 + pseudocount) before centering
+        """
+        matrix = self.df
+        values = matrix.values
+        n_taxa = len(matrix)
+        absent = np.log(self.pseudocount)
+
+        counts = np.bincount(values.indices, minlength=values.shape[1])
+        sums = np.bincount(values.indices, weights=data, minlength=values.shape[1])
+        means = (sums + (n_taxa - counts) * absent) / max(1, n_taxa)
+
+        out = self.output_buffer(shape=values.shape)
+        out[:] = absent - means
+        coo = values.tocoo()
+        out[coo.row, coo.col] = data - means[coo.col]
+        return pd.DataFrame(out, index=matrix.index, columns=matrix.columns, copy=False)
+
+    def transform_dense(self) -> Union[pd.DataFrame, np.ndarray]:
+        is_df = isinstance(self.df, pd.DataFrame)
+        values = self.df.to_numpy() if is_df else np.asarray(self.df)
+        column_sums = self.df.sum(axis=0).to_numpy() if is_df else np.nansum(values, axis=0)
+
+        out = self.output_buffer(shape=values.shape)
+        divisors = self.divisors(column_sums=column_sums)
+        if divisors is None:
+            np.copyto(out, values, casting='unsafe')
+        else:
+            np.divide(values, divisors, out=out)
+        self.elementwise(out)
+
+        if self.transform == CLR:
+            out -= out.mean(axis=0)
+
+        if is_df:
+            return pd.DataFrame(out, index=self.df.index, columns=self.df.columns, copy=False)
+        return out
 
-        self.normalize_by_sample_reads()
-        self.pseudocount_then_log10()
+    def output_buffer(self, shape) -> np.ndarray:
+        if self.out is None:
+            return np.empty(shape, dtype=self.dtype)
+        assert self.out.shape == shape, f'Output buffer of shape {self.out.shape} for a table of shape {shape}'
+        return self.out
 
-        return self.df
+    def divisors(self, column_sums: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Per-sample divisors of counts, None if not divided
 
-    def normalize_by_sample_reads(self):
+        Samples without reads are divided by 1 and stay 0, dense as sparse
+        """
+        column_sums = np.where(column_sums > 0, column_sums, 1.)
         if self.by_sample_reads:
-            sum_per_column = np.sum(self.df, axis=0) / self.sample_reads_unit
-            self.df = np.divide(self.df, sum_per_column)
+            return column_sums / self.sample_reads_unit
+        if self.transform == RELATIVE_ABUNDANCE:
+            return column_sums
+        if self.transform in [CPM, VST]:
+            return column_sums / 1e6
+        return None
 
-    def pseudocount_then_log10(self):
+    def elementwise(self, a: np.ndarray) -> np.ndarray:
+        """
+        Log transform of `a` in place
+        """
         if self.log_pseudocount:
-            self.df = np.log10(self.df + 1)
+            a += 1
+            np.log10(a, out=a)
+        elif self.transform == LOG_PSEUDOCOUNT:
+            a += self.pseudocount
+            np.log10(a, out=a)
+        elif self.transform == VST:
+            a += self.pseudocount
+            np.log2(a, out=a)
+        elif self.transform == CLR:
+            a += self.pseudocount
+            np.log(a, out=a)
+        return a
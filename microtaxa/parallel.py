@@ -0,0 +1,87 @@
+from typing import List, Dict, Any, Type
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .cache import StageCache
+from .template import Processor, Settings
+
+
+class SampleScheduler(Processor):
+    """
+    Runs one processor per sample, several samples at once, under the shared CPU budget `threads`
+
+    The budget is split evenly between concurrent jobs,
+    so each job sees `settings.threads` as its own share (e.g. cutadapt cores, PEAR --threads, glsearch -T)
+
+    Jobs whose outputs are still valid in the workdir stage cache are skipped, which allows resuming a crashed run
+    """
+
+    processor: Type[Processor]
+    kwargs_list: List[Dict[str, Any]]
+    threads_per_job: int
+
+    cache: StageCache
+    keys: List[str]
+    results: List[Any]
+    pending: List[int]
+    n_jobs: int
+    job_settings: Settings
+
+    def main(
+            self,
+            processor: Type[Processor],
+            kwargs_list: List[Dict[str, Any]],
+            threads_per_job: int) -> List[Any]:
+
+        self.processor = processor
+        self.kwargs_list = kwargs_list
+        self.threads_per_job = threads_per_job
+
+        self.read_cache()
+        self.set_n_jobs()
+        self.set_job_settings()
+        self.run_pending_jobs()
+
+        return self.results
+
+    def read_cache(self):
+        self.cache = StageCache(workdir=self.workdir)
+        self.keys = [self.cache.key(self.processor, kwargs, self.settings) for kwargs in self.kwargs_list]
+        self.results = [self.cache.get(key) for key in self.keys]
+        self.pending = [i for i, r in enumerate(self.results) if r is None]
+
+        n_cached = len(self.results) - len(self.pending)
+        if n_cached > 0:
+            self.logger.info(f'Skip {n_cached} {self.processor.__name__} jobs with valid cached outputs')
+
+    def run_pending_jobs(self):
+        if self.n_jobs == 1:
+            for i in self.pending:
+                self.collect(i, run_processor(self.processor, self.job_settings, self.kwargs_list[i]))
+            return
+
+        self.logger.info(f'Run {len(self.pending)} {self.processor.__name__} jobs, {self.n_jobs} at a time, {self.job_settings.threads} threads each')
+        with ProcessPoolExecutor(max_workers=self.n_jobs) as executor:
+            future_to_i = {
+                executor.submit(run_processor, self.processor, self.job_settings, self.kwargs_list[i]): i
+                for i in self.pending
+            }
+            for future in as_completed(future_to_i):  # record each job as soon as it is done
+                self.collect(future_to_i[future], future.result())
+
+    def collect(self, i: int, result: Any):
+        self.results[i] = result  # keep the input order
+        self.cache.put(self.keys[i], result)
+
+    def set_n_jobs(self):
+        n = self.threads // max(1, self.threads_per_job)
+        self.n_jobs = max(1, min(n, len(self.pending)))
+
+    def set_job_settings(self):
+        self.job_settings = self.settings.with_threads(
+            threads=max(1, self.threads // self.n_jobs))
+
+
+def run_processor(
+        processor: Type[Processor],
+        settings: Settings,
+        kwargs: Dict[str, Any]) -> Any:
+    return processor(settings).main(**kwargs)
@@ -0,0 +1,135 @@
+import numpy as np
+from scipy import special
+from scipy.stats import mannwhitneyu
+from typing import Dict, Tuple, Hashable
+
+
+class GroupedMannWhitneyU:
+    """
+    Two-sided Mann-Whitney U tests of every column between pairs of row groups,
+    same statistics and p values as scipy.stats.mannwhitneyu with its defaults, one column at a time
+
+    Each column is ranked once into integer keys (column * n_rows + dense rank) and the keys are sorted once per group,
+    so a group pair is tested for all columns by binary searches of one group's keys in the other's
+    """
+
+    MAX_EXACT_SIZE = 8  # scipy method='auto': exact p values if a group has <= 8 values and there are no ties
+
+    values: np.ndarray
+    n_rows: int
+    n_columns: int
+    keys: Dict[Hashable, np.ndarray]
+    rows: Dict[Hashable, np.ndarray]
+    has_nan: np.ndarray
+
+    def __init__(self, values: np.ndarray, groups: np.ndarray):
+        """
+        `values`: rows (samples) x columns (taxa)
+        `groups`: group label of each row
+        """
+        self.values = np.asarray(values, dtype=np.float64)
+        self.n_rows, self.n_columns = self.values.shape
+
+        ranks = dense_ranks(self.values)
+        keys = np.arange(self.n_columns, dtype=np.int64) * self.n_rows + ranks
+
+        self.keys, self.rows = {}, {}
+        for group in dict.fromkeys(groups):
+            rows = np.flatnonzero(np.asarray(groups) == group)
+            self.rows[group] = rows
+            self.keys[group] = np.sort(keys[rows].ravel())
+
+        self.has_nan = np.isnan(self.values)
+
+    def means(self, group: Hashable) -> np.ndarray:
+        """
+        Column means of the group skipping NaN, summed along contiguous memory as pandas does for a single column
+        """
+        values = np.ascontiguousarray(self.values[self.group_rows(group)].T)
+        is_nan = np.isnan(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(is_nan, 0., values).sum(axis=1) / (~is_nan).sum(axis=1)
+
+    def test(self, group_1: Hashable, group_2: Hashable) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        U statistic of group_1 and two-sided p value of each column, NaN where either group has NaN
+
+        All NaN if either group has no rows, e.g. all its samples dropped by rarefaction, as scipy for empty samples
+        """
+        n1, n2 = len(self.group_rows(group_1)), len(self.group_rows(group_2))
+        if n1 == 0 or n2 == 0:
+            return np.full(self.n_columns, np.nan), np.full(self.n_columns, np.nan)
+        keys_1, keys_2 = self.keys[group_1], self.keys[group_2]
+
+        u1 = self.u_statistics(keys_1=keys_1, keys_2=keys_2)
+        tie_terms, has_ties = self.tie_terms(keys_1=keys_1, keys_2=keys_2)
+
+        u = np.maximum(u1, n1 * n2 - u1)
+        pvalues = 2 * special.ndtr(-self.z_scores(u=u, n1=n1, n2=n2, tie_terms=tie_terms))
+
+        if n1 <= self.MAX_EXACT_SIZE or n2 <= self.MAX_EXACT_SIZE:
+            exact = np.flatnonzero(~has_ties)
+            if len(exact) > 0:
+                pvalues[exact] = mannwhitneyu(
+                    x=self.values[np.ix_(self.rows[group_1], exact)],
+                    y=self.values[np.ix_(self.rows[group_2], exact)],
+                    method='exact',
+                    axis=0).pvalue  # one batched call, the exact distribution needs small groups anyway
+
+        pvalues = np.clip(pvalues, 0., 1.)
+
+        has_nan = self.has_nan[self.rows[group_1]].any(axis=0) | self.has_nan[self.rows[group_2]].any(axis=0)
+        u1[has_nan] = np.nan
+        pvalues[has_nan] = np.nan
+        return u1, pvalues
+
+    def group_rows(self, group: Hashable) -> np.ndarray:
+        return self.rows.get(group, np.zeros(0, dtype=np.int64))
+
+    def u_statistics(self, keys_1: np.ndarray, keys_2: np.ndarray) -> np.ndarray:
+        """
+        For each value of group 1, the number of smaller values in group 2 plus half of the equal ones
+        """
+        columns = keys_1 // self.n_rows
+        column_starts = np.searchsorted(keys_2, columns * self.n_rows, side='left')
+        lefts = np.searchsorted(keys_2, keys_1, side='left')
+        rights = np.searchsorted(keys_2, keys_1, side='right')
+        twice_u = np.bincount(
+            columns,
+            weights=2 * (lefts - column_starts) + (rights - lefts),
+            minlength=self.n_columns)
+        return twice_u / 2
+
+    def tie_terms(self, keys_1: np.ndarray, keys_2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        sum(t^3 - t) over groups of t tied values in each column of the two groups combined
+        """
+        keys = np.sort(np.concatenate([keys_1, keys_2]), kind='stable')  # merges the two sorted runs
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        t = np.diff(np.append(starts, len(keys))).astype(np.float64)
+        columns = keys[starts] // self.n_rows
+        tie_terms = np.bincount(columns, weights=t ** 3 - t, minlength=self.n_columns)
+        return tie_terms, tie_terms > 0
+
+    def z_scores(self, u: np.ndarray, n1: int, n2: int, tie_terms: np.ndarray) -> np.ndarray:
+        """
+        Normal approximation with tie and continuity corrections, as scipy
+        """
+        mu = n1 * n2 / 2
+        n = n1 + n2
+        s = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_terms / (n * (n - 1))))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (u - mu - 0.5) / s
+
+
+def dense_ranks(values: np.ndarray) -> np.ndarray:
+    """
+    0-based dense rank of each value within its column, NaN ranked last
+    """
+    order = np.argsort(values, axis=0, kind='stable')
+    sorted_values = np.take_along_axis(values, order, axis=0)
+    is_new = np.ones_like(sorted_values, dtype=bool)
+    is_new[1:] = sorted_values[1:] != sorted_values[:-1]
+    ranks = np.empty(values.shape, dtype=np.int64)
+    np.put_along_axis(ranks, order, np.cumsum(is_new, axis=0) - 1, axis=0)
+    return ranks
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from typing import List, Union, Tuple
+from .matrix import TaxonMatrix
+from .template import Processor
+
+
+class Rarefy(Processor):
+    """
+    Subsamples `depth` reads without replacement from every sample of a count table, `n_draws` times
+
+    A draw from one sample is multivariate hypergeometric over its taxa.
+    It is sampled by binary splitting: the reads drawn from a run of taxa are split between its two halves
+    by one univariate hypergeometric draw, so all runs of all samples and draws are split at once
+    by one vectorized call per level, about log2(number of taxa in a sample) calls in total
+
+    Only the taxa present in a sample (stored entries) are drawn from, the table stays sparse.
+    Samples with fewer than `depth` reads are dropped
+    """
+
+    count_df: TaxonMatrix
+    depth: int
+    n_draws: int
+    seed: int
+
+    rng: np.random.Generator
+    counts: sparse.csc_matrix
+
+    def main(
+            self,
+            count_df: Union[pd.DataFrame, TaxonMatrix],
+            depth: int,
+            n_draws: int = 1,
+            seed: int = 0) -> List[TaxonMatrix]:
+        """
+        Returns `n_draws` rarefied tables of the kept samples, reproducible for the same `seed`
+        """
+        self.count_df = count_df if isinstance(count_df, TaxonMatrix) else TaxonMatrix.from_dataframe(count_df)
+        self.depth = depth
+        self.n_draws = n_draws
+        self.seed = seed
+
+        assert self.depth > 0, f'Rarefaction depth must be positive, got {self.depth}'
+        assert self.n_draws > 0, f'Number of rarefaction draws must be positive, got {self.n_draws}'
+
+        self.rng = np.random.default_rng(self.seed)
+        self.drop_shallow_samples()
+
+        data, indptr = self.tile_draws()
+        drawn = self.split_draws(data=data, indptr=indptr)
+
+        n_entries = len(self.counts.data)
+        return [
+            self.to_matrix(data=drawn[i * n_entries:(i + 1) * n_entries])
+            for i in range(self.n_draws)
+        ]
+
+    def drop_shallow_samples(self):
+        sums = self.count_df.column_sums()
+        keep = np.flatnonzero(sums >= self.depth)
+        dropped = self.count_df.columns[sums < self.depth].tolist()
+        if len(dropped) > 0:
+            self.logger.info(f'WARNING! {len(dropped)} samples with fewer than {self.depth} reads dropped by rarefaction: {dropped}')
+        self.count_df = self.count_df.select_columns(keep)
+
+        self.counts = self.count_df.values.tocsc()
+        self.counts.sum_duplicates()
+        assert np.all(self.counts.data == np.round(self.counts.data)), 'Only tables of integer counts can be rarefied'
+
+    def tile_draws(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Stored counts of all samples, repeated for each draw, and the start of each sample (then the end)
+        """
+        data = np.tile(self.counts.data.astype(np.int64), self.n_draws)
+        n_entries = len(self.counts.data)
+        indptr = np.concatenate([
+            self.counts.indptr[:-1] + i * n_entries for i in range(self.n_draws)
+        ] + [[self.n_draws * n_entries]])
+        return data, indptr
+
+    def split_draws(self, data: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+        """
+        Number of reads drawn from each stored count, `depth` per sample
+        """
+        prefix = np.concatenate([[0], np.cumsum(data)])
+        drawn = np.zeros(len(data), dtype=np.int64)
+
+        starts, ends = indptr[:-1], indptr[1:]
+        n = np.full(len(starts), self.depth, dtype=np.int64)
+        while len(starts) > 0:
+            is_leaf = ends - starts == 1
+            drawn[starts[is_leaf]] = n[is_leaf]
+
+            split = (ends - starts > 1) & (n > 0)
+            starts, ends, n = starts[split], ends[split], n[split]
+            mids = (starts + ends) // 2
+            n_left = self.rng.hypergeometric(
+                ngood=prefix[mids] - prefix[starts],
+                nbad=prefix[ends] - prefix[mids],
+                nsample=n)
+
+            starts = np.concatenate([starts, mids])
+            ends = np.concatenate([mids, ends])
+            n = np.concatenate([n_left, n - n_left])
+        return drawn
+
+    def to_matrix(self, data: np.ndarray) -> TaxonMatrix:
+        values = sparse.csc_matrix(
+            (data.astype(np.float64), self.counts.indices.copy(), self.counts.indptr.copy()),
+            shape=self.counts.shape)
+        values.eliminate_zeros()  # taxa not drawn, in place on the copied structure
+        return TaxonMatrix(
+            values=values,
+            index=self.count_df.index,
+            columns=self.count_df.columns,
+            fill_value=self.count_df.fill_value)
@@ -0,0 +1,247 @@
+import os
+import numpy as np
+import pandas as pd
+from itertools import islice
+from typing import List, Tuple, Optional
+from .utils import iter_fastq_records
+from .codec import open_intermediate
+from .template import Processor
+
+
+COMPLEMENT_TABLE = bytes.maketrans(b'ACGTNacgtn', b'TGCANtgcan')
+COMPLEMENT = np.frombuffer(bytes(range(256)).translate(COMPLEMENT_TABLE), dtype=np.uint8)
+UPPER = np.frombuffer(bytes(range(256)).upper(), dtype=np.uint8)
+
+
+def to_matrix(strings: List[bytes], width: int, right_align: bool) -> np.ndarray:
+    """
+    Byte strings as rows of a uint8 matrix padded with 0
+    """
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    flat = np.frombuffer(b''.join(strings), dtype=np.uint8)
+    rows = np.repeat(np.arange(len(strings)), lengths)
+    columns = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    if right_align:
+        columns += np.repeat(width - lengths, lengths)
+    matrix = np.zeros((len(strings), width), dtype=np.uint8)
+    matrix[rows, columns] = flat
+    return matrix
+
+
+class MergeReadPairs(Processor):
+    """
+    Built-in paired-end read merger, an alternative to PEAR
+
+    Read 2 is reverse-complemented and overlapped with the 3' end of read 1.
+    For a batch of pairs, read 1 is right-aligned and reverse-complemented read 2 left-aligned in two matrices,
+    so every overlap length is a pair of column slices scored for all pairs at once
+
+    The overlap of the highest score (matches - mismatches), at least `min_overlap` long
+    and with at most MAX_MISMATCH_FRACTION mismatches, is accepted
+
+    In the overlap, agreeing bases keep the higher quality,
+    disagreeing bases take the base of higher quality with the quality difference (at least MIN_QUALITY)
+
+    Unmerged pairs are dropped, as are PEAR's unassembled reads
+    """
+
+    MAX_MISMATCH_FRACTION = 0.1
+    MIN_QUALITY = 2
+    PHRED_OFFSET = 33
+    BATCH_SIZE = 10000
+
+    fq1: str
+    fq2: str
+    output_fastq: str
+    min_overlap: int
+    codec: str
+
+    n_pairs: int
+    n_merged: int
+
+    def main(
+            self,
+            fq1: str,
+            fq2: str,
+            output_fastq: str,
+            min_overlap: int,
+            codec: Optional[str] = None) -> Tuple[int, int]:
+        """
+        Writes merged reads to `output_fastq` in the intermediate codec, unless another `codec` is given
+
+        `min_overlap` is that of PEAR in MergePairedEndReads, so both mergers accept the same overlaps
+
+        Returns the number of read pairs and merged reads
+        """
+        self.fq1 = fq1
+        self.fq2 = fq2
+        self.output_fastq = output_fastq
+        self.min_overlap = min_overlap
+        self.codec = self.settings.intermediate_codec if codec is None else codec
+
+        self.n_pairs, self.n_merged = 0, 0
+        self.logger.info(f'Merge "{self.fq1}" and "{self.fq2}" into "{self.output_fastq}"')
+        if self.mock:
+            return self.n_pairs, self.n_merged
+
+        pairs = zip(iter_fastq_records(self.fq1), iter_fastq_records(self.fq2))
+        with open_intermediate(self.output_fastq, codec=self.codec, threads=self.threads) as writer:
+            while True:
+                batch = list(islice(pairs, self.BATCH_SIZE))
+                if len(batch) == 0:
+                    break
+                writer.write(self.merge_batch(batch))
+
+        self.logger.info(f'{self.n_merged} of {self.n_pairs} read pairs merged')
+        return self.n_pairs, self.n_merged
+
+    def merge_batch(self, batch: List[Tuple[Tuple[bytes, bytes, bytes], Tuple[bytes, bytes, bytes]]]) -> bytes:
+        headers = [r1[0] for r1, _ in batch]
+        seqs1, quals1 = [r1[1] for r1, _ in batch], [r1[2] for r1, _ in batch]
+        seqs2, quals2 = [r2[1] for _, r2 in batch], [r2[2] for _, r2 in batch]
+
+        overlaps = self.best_overlaps(seqs1=seqs1, seqs2=seqs2)
+        self.n_pairs += len(batch)
+        self.n_merged += int(np.count_nonzero(overlaps))
+        return self.merged_records(
+            headers=headers,
+            seqs1=seqs1,
+            quals1=quals1,
+            seqs2=seqs2,
+            quals2=quals2,
+            overlaps=overlaps)
+
+    def best_overlaps(self, seqs1: List[bytes], seqs2: List[bytes]) -> np.ndarray:
+        """
+        Overlap length of each pair, 0 if not merged
+        """
+        width1, width2 = max(map(len, seqs1)), max(map(len, seqs2))
+        read1 = UPPER[to_matrix(seqs1, width=width1, right_align=True)]
+        read2 = COMPLEMENT[UPPER[to_matrix(seqs2, width=width2, right_align=True)][:, ::-1]]  # left-aligned
+        max_overlaps = np.minimum(
+            np.fromiter(map(len, seqs1), dtype=np.int64, count=len(seqs1)),
+            np.fromiter(map(len, seqs2), dtype=np.int64, count=len(seqs2)))
+
+        best_scores = np.zeros(len(seqs1), dtype=np.int64)  # a merge needs a positive score
+        best_overlaps = np.zeros(len(seqs1), dtype=np.int64)
+        for overlap in range(self.min_overlap, min(width1, width2) + 1):
+            matches = np.count_nonzero(read1[:, width1 - overlap:] == read2[:, :overlap], axis=1)
+            mismatches = overlap - matches  # trim_galore --max_n 0 leaves no N to treat specially
+            scores = matches - mismatches
+            is_better = (scores > best_scores) \
+                & (overlap <= max_overlaps) \
+                & (mismatches <= self.MAX_MISMATCH_FRACTION * overlap)
+            best_scores[is_better] = scores[is_better]
+            best_overlaps[is_better] = overlap
+        return best_overlaps
+
+    def merged_records(
+            self,
+            headers: List[bytes],
+            seqs1: List[bytes],
+            quals1: List[bytes],
+            seqs2: List[bytes],
+            quals2: List[bytes],
+            overlaps: np.ndarray) -> bytes:
+
+        merged = np.flatnonzero(overlaps)
+        if len(merged) == 0:
+            return b''
+        seq_overlap, qual_overlap = self.overlap_consensus(
+            seqs1=[seqs1[i] for i in merged],
+            quals1=[quals1[i] for i in merged],
+            seqs2=[seqs2[i] for i in merged],
+            quals2=[quals2[i] for i in merged],
+            overlaps=overlaps[merged])
+
+        records = []
+        ends = np.cumsum(overlaps[merged]).tolist()
+        starts = [0] + ends[:-1]
+        for i, start, end in zip(merged.tolist(), starts, ends):
+            o = end - start
+            n1 = len(seqs1[i]) - o
+            seq = seqs1[i][:n1] + seq_overlap[start:end] + seqs2[i][::-1].translate(COMPLEMENT_TABLE)[o:]
+            qual = quals1[i][:n1] + qual_overlap[start:end] + quals2[i][::-1][o:]
+            records.append(b'@%s\n%s\n+\n%s\n' % (headers[i], seq, qual))
+        return b''.join(records)
+
+    def overlap_consensus(
+            self,
+            seqs1: List[bytes],
+            quals1: List[bytes],
+            seqs2: List[bytes],
+            quals2: List[bytes],
+            overlaps: np.ndarray) -> Tuple[bytes, bytes]:
+        """
+        Consensus sequence and quality of all overlaps, concatenated
+        """
+        width1, width2 = max(map(len, seqs1)), max(map(len, seqs2))
+        read1 = UPPER[to_matrix(seqs1, width=width1, right_align=True)]
+        qual1 = to_matrix(quals1, width=width1, right_align=True)
+        read2 = COMPLEMENT[UPPER[to_matrix(seqs2, width=width2, right_align=True)][:, ::-1]]
+        qual2 = to_matrix(quals2, width=width2, right_align=True)[:, ::-1]
+
+        rows = np.repeat(np.arange(len(overlaps)), overlaps)
+        k = np.arange(overlaps.sum()) - np.repeat(np.cumsum(overlaps) - overlaps, overlaps)
+        columns1 = width1 - np.repeat(overlaps, overlaps) + k
+
+        base1, base2 = read1[rows, columns1], read2[rows, k]
+        q1, q2 = qual1[rows, columns1].astype(np.int16), qual2[rows, k].astype(np.int16)
+
+        bases = np.where(q2 > q1, base2, base1)
+        quals = np.where(
+            base1 == base2,
+            np.maximum(q1, q2),
+            np.maximum(np.abs(q1 - q2) + self.PHRED_OFFSET, self.MIN_QUALITY + self.PHRED_OFFSET))
+        return bases.astype(np.uint8).tobytes(), quals.astype(np.uint8).tobytes()
+
+
+class CompareMergedReads(Processor):
+    """
+    Agreement of the built-in merger with PEAR on the same read pairs, matched by read name
+    """
+
+    DSTDIR_NAME = 'read-merger-validation'
+
+    sample_id: str
+    pear_fastq: str
+    numpy_fastq: str
+
+    def main(
+            self,
+            sample_id: str,
+            pear_fastq: str,
+            numpy_fastq: str) -> Optional[pd.DataFrame]:
+
+        self.sample_id = sample_id
+        self.pear_fastq = pear_fastq
+        self.numpy_fastq = numpy_fastq
+
+        if self.mock:
+            return None
+
+        pear = {header.split()[0]: seq for header, seq, _ in iter_fastq_records(self.pear_fastq)}
+        n_numpy, n_both, n_identical = 0, 0, 0
+        for header, seq, _ in iter_fastq_records(self.numpy_fastq):
+            n_numpy += 1
+            pear_seq = pear.get(header.split()[0])
+            if pear_seq is not None:
+                n_both += 1
+                n_identical += pear_seq == seq
+
+        n_either = len(pear) + n_numpy - n_both
+        df = pd.DataFrame([{
+            'Sample ID': self.sample_id,
+            'PEAR Merged': len(pear),
+            'NumPy Merged': n_numpy,
+            'Both Merged': n_both,
+            'Identical Merged Sequence': n_identical,
+            'Agreement': n_identical / n_either if n_either > 0 else np.nan,
+        }])
+
+        dstdir = f'{self.outdir}/{self.DSTDIR_NAME}'
+        os.makedirs(dstdir, exist_ok=True)
+        df.to_csv(f'{dstdir}/{self.sample_id}.csv', index=False)  # one file per sample, samples run concurrently
+
+        self.logger.info(f'{self.sample_id}: {n_identical} of {n_either} reads merged by either PEAR or the built-in merger are identical')
+        return df
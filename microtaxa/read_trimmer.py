@@ -0,0 +1,184 @@
+import numpy as np
+from itertools import islice
+from typing import List, Tuple
+from .codec import open_intermediate
+from .template import Processor
+from .utils import iter_fastq_records
+from .read_merger import to_matrix, UPPER
+
+
+ILLUMINA_ADAPTER = b'AGATCGGAAGAGC'
+
+
+class TrimReads(Processor):
+    """
+    Built-in trimmer applying the rules of trim_galore --illumina to batches of reads in matrices
+
+    Each read, in the order of cutadapt and trim_galore:
+        3' quality trimming, the BWA algorithm of cutadapt -q
+        3' Illumina adapter removal, full or partial (at the 3' end) adapter with at most MAX_ERROR_RATE mismatches
+        removal of flanking Ns (--trim-n)
+        5' clipping (--clip_R1, --clip_R2)
+
+    A read (a pair if any of its reads) shorter than `length` or with more than `max_n` Ns is removed
+
+    Adapter matches allow mismatches but not indels as cutadapt does
+    """
+
+    PHRED_OFFSET = 33
+    MAX_ERROR_RATE = 0.1
+    MIN_ADAPTER_OVERLAP = 1  # trim_galore --stringency
+    BATCH_SIZE = 10000
+
+    fqs: List[str]
+    output_fqs: List[str]
+    clips: List[int]
+    quality: int
+    length: int
+    max_n: int
+
+    n_reads: int
+    n_kept: int
+
+    def main(
+            self,
+            fqs: List[str],
+            output_fqs: List[str],
+            clips: List[int],
+            quality: int,
+            length: int,
+            max_n: int) -> Tuple[int, int]:
+        """
+        `fqs` holds one file, or two of paired reads trimmed in lockstep
+
+        Returns the number of reads (pairs) and kept reads (pairs)
+        """
+        self.fqs = fqs
+        self.output_fqs = output_fqs
+        self.clips = clips
+        self.quality = quality
+        self.length = length
+        self.max_n = max_n
+
+        self.n_reads, self.n_kept = 0, 0
+        self.logger.info(f'Trim {self.fqs} into {self.output_fqs}')
+        if self.mock:
+            return self.n_reads, self.n_kept
+
+        records = zip(*[iter_fastq_records(fq) for fq in self.fqs])
+        writers = [
+            open_intermediate(fq, codec=self.settings.intermediate_codec, threads=self.threads)
+            for fq in self.output_fqs
+        ]
+        try:
+            while True:
+                batch = list(islice(records, self.BATCH_SIZE))
+                if len(batch) == 0:
+                    break
+                for writer, data in zip(writers, self.trim_batch(batch)):
+                    writer.write(data)
+        finally:
+            for writer in writers:
+                writer.close()
+
+        self.logger.info(f'{self.n_kept} of {self.n_reads} reads (or pairs) kept after trimming')
+        return self.n_reads, self.n_kept
+
+    def trim_batch(self, batch: List[Tuple[Tuple[bytes, bytes, bytes], ...]]) -> List[bytes]:
+        """
+        Trimmed records of each file
+        """
+        bounds = []
+        keep = np.ones(len(batch), dtype=bool)
+        for i, clip in enumerate(self.clips):
+            starts, ends, n_counts = self.trim_bounds(
+                seqs=[records[i][1] for records in batch],
+                quals=[records[i][2] for records in batch],
+                clip=clip)
+            keep &= (ends - starts >= self.length) & (n_counts <= self.max_n)
+            bounds.append((starts, ends))
+
+        self.n_reads += len(batch)
+        self.n_kept += int(np.count_nonzero(keep))
+
+        outputs = []
+        for i, (starts, ends) in enumerate(bounds):
+            records = []
+            for j in np.flatnonzero(keep).tolist():
+                header, seq, qual = batch[j][i]
+                s, e = starts[j], ends[j]
+                records.append(b'@%s\n%s\n+\n%s\n' % (header, seq[s:e], qual[s:e]))
+            outputs.append(b''.join(records))
+        return outputs
+
+    def trim_bounds(self, seqs: List[bytes], quals: List[bytes], clip: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Start, end and number of Ns of each trimmed read
+        """
+        lengths = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+        qual_lengths = np.fromiter(map(len, quals), dtype=np.int64, count=len(quals))
+        malformed = np.flatnonzero(lengths != qual_lengths)
+        assert len(malformed) == 0, \
+            f'Malformed fastq record, sequence and quality of different lengths: {seqs[malformed[0]].decode()}'
+
+        width = int(lengths.max())
+        bases = UPPER[to_matrix(seqs, width=width, right_align=False)]
+        qualities = to_matrix(quals, width=width, right_align=False)
+
+        ends = self.quality_trim_ends(qualities=qualities, lengths=lengths)
+        ends = np.minimum(ends, self.adapter_starts(bases=bases, lengths=ends))
+        starts, ends = self.trim_flanking_n(bases=bases, lengths=ends)
+        starts = np.minimum(starts + clip, ends)
+
+        columns = np.arange(width)
+        in_read = (columns >= starts[:, None]) & (columns < ends[:, None])
+        n_counts = np.count_nonzero((bases == ord('N')) & in_read, axis=1)
+        return starts, ends, n_counts
+
+    def quality_trim_ends(self, qualities: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        BWA algorithm: going from the 3' end, cut at the position maximizing the sum of (cutoff - quality),
+        stopping once the sum turns negative
+        """
+        width = qualities.shape[1]
+        columns = np.arange(width)
+        in_read = columns < lengths[:, None]
+
+        diffs = np.where(in_read, self.quality + self.PHRED_OFFSET - qualities.astype(np.int64), 0)
+        sums = np.cumsum(diffs[:, ::-1], axis=1)[:, ::-1]  # from each position to the 3' end
+
+        negative = (sums < 0) & in_read
+        stops = np.where(negative.any(axis=1), width - 1 - np.argmax(negative[:, ::-1], axis=1), -1)
+        candidates = np.where((columns > stops[:, None]) & in_read, sums, 0)
+        best = candidates.max(axis=1)
+        last_best = width - 1 - np.argmax((candidates == best[:, None])[:, ::-1], axis=1)  # the first one from the 3' end
+        return np.where(best > 0, last_best, lengths)
+
+    def adapter_starts(self, bases: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        Start of the adapter match with the most matching bases (the leftmost of ties), `lengths` if none
+        """
+        adapter = np.frombuffer(ILLUMINA_ADAPTER, dtype=np.uint8)
+        width = bases.shape[1]
+
+        starts = lengths.copy()
+        best_matches = np.zeros(len(lengths), dtype=np.int64)
+        for position in range(width):
+            k = min(len(adapter), width - position)
+            overlaps = np.minimum(len(adapter), lengths - position)
+            cum_matches = np.cumsum(bases[:, position:position + k] == adapter[:k], axis=1)
+            matches = np.take_along_axis(cum_matches, np.clip(overlaps - 1, 0, k - 1)[:, None], axis=1)[:, 0]
+            is_better = (overlaps >= self.MIN_ADAPTER_OVERLAP) \
+                & (overlaps - matches <= np.floor(self.MAX_ERROR_RATE * overlaps)) \
+                & (matches > best_matches)
+            starts[is_better] = position
+            best_matches[is_better] = matches[is_better]
+        return starts
+
+    def trim_flanking_n(self, bases: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        columns = np.arange(bases.shape[1])
+        is_base = (bases != ord('N')) & (columns < lengths[:, None])
+        has_base = is_base.any(axis=1)
+        starts = np.where(has_base, np.argmax(is_base, axis=1), 0)
+        ends = np.where(has_base, bases.shape[1] - np.argmax(is_base[:, ::-1], axis=1), 0)
+        return starts, ends
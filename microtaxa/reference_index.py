@@ -0,0 +1,299 @@
+import os
+import json
+import shutil
+import numpy as np
+from typing import List, Optional, Dict
+from .utils import file_digest
+from .template import Processor
+
+
+METADATA_JSON = 'metadata.json'
+VERSION = 1
+
+
+class BuildReferenceIndex(Processor):
+    """
+    Converts a reference fasta (e.g. SILVA) once into an on-disk index at <index_root>/<sha256 of ref_fa>/
+
+    Index files:
+        metadata.json               ref_fa path, size, mtime, sha256, number of sequences
+        subject_ids.npy             fixed-width bytes, the first word of each header, in fasta order
+        sorted_subject_ids.npy      subject_ids sorted, for binary search
+        sorted_to_index.npy         integer subject index of each sorted subject ID
+        headers.bin                 concatenated headers (without '>')
+        header_offsets.npy          n + 1 offsets into headers.bin
+        taxonomies.bin              concatenated unique taxonomy strings (header after the first space)
+        taxonomy_offsets.npy        offsets into taxonomies.bin
+        taxonomy_codes.npy          taxonomy code of each subject
+        sequence_offsets.npy        byte offset of the first sequence line in ref_fa
+        sequence_byte_lengths.npy   bytes of the sequence lines, including line breaks
+        sequence_lengths.npy        number of residues
+    """
+
+    ref_fa: str
+    index_root: Optional[str]
+
+    sha256: str
+    index_dir: str
+    subject_ids: List[bytes]
+    headers: List[bytes]
+    taxonomy_to_code: Dict[bytes, int]
+    taxonomy_codes: List[int]
+    sequence_offsets: List[int]
+    sequence_byte_lengths: List[int]
+    sequence_lengths: List[int]
+
+    def main(
+            self,
+            ref_fa: str,
+            index_root: Optional[str] = None) -> str:
+
+        self.ref_fa = ref_fa
+        self.index_root = index_root
+
+        self.set_index_dir()
+        if os.path.exists(f'{self.index_dir}/{METADATA_JSON}'):
+            self.logger.info(f'Reference index already exists: "{self.index_dir}"')
+            return self.index_dir
+
+        self.parse_ref_fa()
+        self.write_index()
+
+        return self.index_dir
+
+    def set_index_dir(self):
+        if self.index_root is None:
+            self.index_root = get_default_index_root(self.ref_fa)
+        self.sha256 = file_digest(self.ref_fa)
+        self.index_dir = f'{self.index_root}/{self.sha256}'
+
+    def parse_ref_fa(self):
+        self.subject_ids = []
+        self.headers = []
+        self.taxonomy_to_code = {}
+        self.taxonomy_codes = []
+        self.sequence_offsets = []
+        self.sequence_byte_lengths = []
+        self.sequence_lengths = []
+
+        offset = 0
+        with open(self.ref_fa, 'rb') as fh:
+            for line in fh:
+                if line.startswith(b'>'):
+                    self.__add_header(header=line[1:].rstrip(), sequence_offset=offset + len(line))
+                elif len(self.headers) > 0:
+                    self.sequence_byte_lengths[-1] += len(line)
+                    self.sequence_lengths[-1] += len(line.rstrip())
+                offset += len(line)
+
+        self.logger.info(f'{len(self.headers)} sequences in "{self.ref_fa}"')
+
+    def __add_header(self, header: bytes, sequence_offset: int):
+        subject_id, _, taxonomy = header.partition(b' ')
+        self.subject_ids.append(subject_id)
+        self.headers.append(header)
+        code = self.taxonomy_to_code.setdefault(taxonomy, len(self.taxonomy_to_code))
+        self.taxonomy_codes.append(code)
+        self.sequence_offsets.append(sequence_offset)
+        self.sequence_byte_lengths.append(0)
+        self.sequence_lengths.append(0)
+
+    def write_index(self):
+        temp_dir = f'{self.index_dir}.temp'
+        os.makedirs(temp_dir, exist_ok=True)
+
+        subject_ids = np.array(self.subject_ids, dtype=bytes)
+        sorted_to_index = np.argsort(subject_ids, kind='stable')
+        np.save(f'{temp_dir}/subject_ids.npy', subject_ids)
+        np.save(f'{temp_dir}/sorted_subject_ids.npy', subject_ids[sorted_to_index])
+        np.save(f'{temp_dir}/sorted_to_index.npy', sorted_to_index.astype(np.int64))
+
+        write_string_table(
+            strings=self.headers,
+            bin_path=f'{temp_dir}/headers.bin',
+            offsets_npy=f'{temp_dir}/header_offsets.npy')
+        write_string_table(
+            strings=list(self.taxonomy_to_code.keys()),  # in order of code
+            bin_path=f'{temp_dir}/taxonomies.bin',
+            offsets_npy=f'{temp_dir}/taxonomy_offsets.npy')
+        np.save(f'{temp_dir}/taxonomy_codes.npy', np.array(self.taxonomy_codes, dtype=np.int32))
+
+        np.save(f'{temp_dir}/sequence_offsets.npy', np.array(self.sequence_offsets, dtype=np.int64))
+        np.save(f'{temp_dir}/sequence_byte_lengths.npy', np.array(self.sequence_byte_lengths, dtype=np.int64))
+        np.save(f'{temp_dir}/sequence_lengths.npy', np.array(self.sequence_lengths, dtype=np.int32))
+
+        stat = os.stat(self.ref_fa)
+        with open(f'{temp_dir}/{METADATA_JSON}', 'w') as fh:
+            json.dump({
+                'version': VERSION,
+                'ref_fa': os.path.abspath(self.ref_fa),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': self.sha256,
+                'n_sequences': len(self.headers),
+            }, fh, indent=2)
+
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+        os.replace(temp_dir, self.index_dir)  # a partially written index is never visible
+        self.logger.info(f'Reference index written to "{self.index_dir}"')
+
+
+def write_string_table(
+        strings: List[bytes],
+        bin_path: str,
+        offsets_npy: str):
+    """
+    String i is bin[offsets[i]:offsets[i + 1]]
+    """
+    lengths = np.fromiter((len(s) for s in strings), dtype=np.int64, count=len(strings))
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    with open(bin_path, 'wb') as fh:
+        fh.write(b''.join(strings))
+    np.save(offsets_npy, offsets)
+
+
+def get_default_index_root(ref_fa: str) -> str:
+    return f'{ref_fa}.index'
+
+
+def find_reference_index(
+        ref_fa: str,
+        index_root: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the index dir built from the current content of ref_fa, or None if there is none
+
+    The path, size and mtime recorded in metadata.json avoid re-hashing an unchanged ref_fa.
+    If ref_fa was copied or touched, it is hashed once and the metadata updated, so the next run does not hash again
+    """
+    if index_root is None:
+        index_root = get_default_index_root(ref_fa)
+    if not os.path.isdir(index_root):
+        return None
+
+    stat = os.stat(ref_fa)
+    key = (os.path.abspath(ref_fa), stat.st_size, stat.st_mtime_ns)
+    names = []  # indexes of the current version
+    for name in os.listdir(index_root):
+        metadata = read_metadata(f'{index_root}/{name}')
+        if metadata is None or metadata['version'] != VERSION:
+            continue
+        if (metadata['ref_fa'], metadata['size'], metadata['mtime_ns']) == key:
+            return f'{index_root}/{name}'
+        names.append(name)
+
+    if len(names) == 0:  # nothing to hash for
+        return None
+
+    sha256 = file_digest(ref_fa)
+    if sha256 not in names:
+        return None
+    index_dir = f'{index_root}/{sha256}'
+    metadata = read_metadata(index_dir)
+    metadata['ref_fa'], metadata['size'], metadata['mtime_ns'] = key
+    temp_json = f'{index_dir}/{METADATA_JSON}.temp'
+    with open(temp_json, 'w') as fh:
+        json.dump(metadata, fh, indent=2)
+    os.replace(temp_json, f'{index_dir}/{METADATA_JSON}')
+    return index_dir
+
+
+def read_metadata(index_dir: str) -> Optional[dict]:
+    metadata_json = f'{index_dir}/{METADATA_JSON}'
+    if not os.path.exists(metadata_json):
+        return None
+    with open(metadata_json) as fh:
+        return json.load(fh)
+
+
+class ReferenceIndex:
+    """
+    Read-only, memory-mapped view of an index written by BuildReferenceIndex
+
+    Pages are shared between processes through the OS page cache, so worker processes can open it for free
+    """
+
+    index_dir: str
+    metadata: dict
+    ref_fa: str
+    subject_ids: np.ndarray
+    sorted_subject_ids: np.ndarray
+    sorted_to_index: np.ndarray
+    headers: np.ndarray
+    header_offsets: np.ndarray
+    taxonomies: np.ndarray
+    taxonomy_offsets: np.ndarray
+    taxonomy_codes: np.ndarray
+    sequence_offsets: np.ndarray
+    sequence_byte_lengths: np.ndarray
+    sequence_lengths: np.ndarray
+
+    def __init__(self, index_dir: str, ref_fa: Optional[str] = None):
+        self.index_dir = index_dir
+        with open(f'{index_dir}/{METADATA_JSON}') as fh:
+            self.metadata = json.load(fh)
+        self.ref_fa = self.metadata['ref_fa'] if ref_fa is None else ref_fa  # only needed for sequences
+
+        self.subject_ids = self.__load('subject_ids')
+        self.sorted_subject_ids = self.__load('sorted_subject_ids')
+        self.sorted_to_index = self.__load('sorted_to_index')
+        self.headers = self.__load_bytes('headers')
+        self.header_offsets = self.__load('header_offsets')
+        self.taxonomies = self.__load_bytes('taxonomies')
+        self.taxonomy_offsets = self.__load('taxonomy_offsets')
+        self.taxonomy_codes = self.__load('taxonomy_codes')
+        self.sequence_offsets = self.__load('sequence_offsets')
+        self.sequence_byte_lengths = self.__load('sequence_byte_lengths')
+        self.sequence_lengths = self.__load('sequence_lengths')
+
+    def __load(self, name: str) -> np.ndarray:
+        return np.load(f'{self.index_dir}/{name}.npy', mmap_mode='r')
+
+    def __load_bytes(self, name: str) -> np.ndarray:
+        fpath = f'{self.index_dir}/{name}.bin'
+        if os.path.getsize(fpath) == 0:  # np.memmap cannot map an empty file
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(fpath, dtype=np.uint8, mode='r')
+
+    def __len__(self) -> int:
+        return len(self.subject_ids)
+
+    def indices(self, subject_ids: List[str]) -> np.ndarray:
+        """
+        Integer subject indices, -1 for subject IDs not in the reference
+        """
+        if len(self) == 0 or len(subject_ids) == 0:
+            return np.full(len(subject_ids), -1, dtype=np.int64)
+        encoded = [s.encode() for s in subject_ids]
+        fits = np.array([len(e) <= self.sorted_subject_ids.itemsize for e in encoded])  # longer IDs would be truncated
+        query = np.array(encoded, dtype=self.sorted_subject_ids.dtype)
+        pos = np.searchsorted(self.sorted_subject_ids, query)
+        pos = np.minimum(pos, len(self) - 1)
+        found = fits & (self.sorted_subject_ids[pos] == query)
+        return np.where(found, self.sorted_to_index[pos], -1)
+
+    def header(self, index: int) -> str:
+        start, end = self.header_offsets[index], self.header_offsets[index + 1]
+        return self.headers[start:end].tobytes().decode()
+
+    def taxonomy(self, index: int) -> str:
+        code = self.taxonomy_codes[index]
+        start, end = self.taxonomy_offsets[code], self.taxonomy_offsets[code + 1]
+        return self.taxonomies[start:end].tobytes().decode()
+
+    def sequence(self, index: int) -> str:
+        with open(self.ref_fa, 'rb') as fh:
+            fh.seek(int(self.sequence_offsets[index]))
+            block = fh.read(int(self.sequence_byte_lengths[index]))
+        return block.replace(b'\n', b'').replace(b'\r', b'').decode()
+
+    def subject_id_to_header(self, subject_ids: List[str]) -> Dict[str, str]:
+        """
+        Only the requested subject IDs are looked up, missing ones are left out
+        """
+        indices = self.indices(subject_ids)
+        return {
+            s: self.header(i)
+            for s, i in zip(subject_ids, indices)
+            if i >= 0
+        }
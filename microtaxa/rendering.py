@@ -0,0 +1,49 @@
+import matplotlib
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Type, Tuple
+from .parallel import run_processor
+from .template import Processor
+
+
+FigureJob = Tuple[Type[Processor], Dict[str, Any]]  # figure processor and the kwargs of its main()
+
+
+def use_headless_backend():
+    matplotlib.use('Agg', force=True)
+
+
+class RenderFigures(Processor):
+    """
+    Renders figure jobs in a pool of `settings.threads` processes with the headless Agg backend
+
+    Matplotlib rendering is CPU-bound and single-threaded,
+    so analysis code computes first and queues jobs carrying only the data each figure draws
+    """
+
+    TASKS_PER_WORKER = 4  # jobs are sent to workers in chunks, a few chunks per worker to balance the load
+
+    jobs: List[FigureJob]
+    n_workers: int
+
+    def main(self, jobs: List[FigureJob]):
+        self.jobs = jobs
+        if len(self.jobs) == 0:
+            return
+
+        self.n_workers = max(1, min(self.threads, len(self.jobs)))
+        self.logger.info(f'Render {len(self.jobs)} figures with {self.n_workers} processes')
+
+        settings = self.settings.with_threads(threads=1)
+        processors = [processor for processor, _ in self.jobs]
+        kwargs_list = [kwargs for _, kwargs in self.jobs]
+
+        if self.n_workers == 1:
+            for processor, kwargs in self.jobs:
+                run_processor(processor, settings, kwargs)
+            return
+
+        chunksize = max(1, len(self.jobs) // (self.n_workers * self.TASKS_PER_WORKER))
+        with ProcessPoolExecutor(max_workers=self.n_workers, initializer=use_headless_backend) as executor:
+            for _ in executor.map(run_processor, processors, repeat(settings), kwargs_list, chunksize=chunksize):
+                pass  # raises errors of the workers
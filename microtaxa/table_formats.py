@@ -0,0 +1,195 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import List, Optional
+from .matrix import TaxonMatrix
+from .template import Processor
+try:
+    import pyarrow
+    import pyarrow.parquet as pyarrow_parquet
+except ImportError:  # optional, for Parquet output
+    pyarrow, pyarrow_parquet = None, None
+try:
+    import h5py
+except ImportError:  # optional, for HDF5 and BIOM output
+    h5py = None
+
+
+PARQUET = 'parquet'
+HDF5 = 'hdf5'
+BIOM = 'biom'
+OUTPUT_FORMATS = [PARQUET, HDF5, BIOM]
+SUFFIXES = {PARQUET: '.parquet', HDF5: '.h5', BIOM: '.biom'}
+TAXON_CODE = 'Taxon Code'
+TAXON = 'Taxon'
+TAXONOMY_CSV = 'taxonomy.csv'
+
+
+def check_output_formats(formats: List[str]):
+    """
+    Fails early if a format is unknown or its optional package is not installed
+    """
+    for f in formats:
+        assert f in OUTPUT_FORMATS, f'Unknown output format "{f}", choose from {OUTPUT_FORMATS}'
+    if PARQUET in formats:
+        assert pyarrow is not None, 'Parquet output needs pyarrow, pip install pyarrow'
+    if HDF5 in formats or BIOM in formats:
+        assert h5py is not None, 'HDF5 and BIOM outputs need h5py, pip install h5py'
+
+
+class WriteTaxonTables(Processor):
+    """
+    Writes the count and percent identity tables in binary formats next to their CSV files,
+    taxa coded as integers whose names are in one lookup table TAXONOMY_CSV shared by all tables
+
+    Parquet: TAXON_CODE and one column per sample, zstd-compressed,
+        so samples are read (projected) without reading the others
+    HDF5: a taxon x sample dataset gzip-compressed in chunks of HDF5_CHUNK_SHAPE, sliced by sample or taxon
+    BIOM: the count table only, BIOM 2.1 (HDF5) with the sparse matrix in CSR and CSC, taxon codes as observation IDs
+
+    Tables are densified ROWS_PER_CHUNK taxa at a time, each chunk a row group of the Parquet file
+    """
+
+    ROWS_PER_CHUNK = 10000
+    HDF5_CHUNK_SHAPE = (4096, 16)
+    HDF5_COMPRESSION_LEVEL = 4
+    PARQUET_COMPRESSION = 'zstd'
+
+    count_df: TaxonMatrix
+    percent_id_mean_df: TaxonMatrix
+    percent_id_std_df: TaxonMatrix
+    formats: List[str]
+
+    taxa: pd.Index
+
+    def main(
+            self,
+            count_df: TaxonMatrix,
+            percent_id_mean_df: TaxonMatrix,
+            percent_id_std_df: TaxonMatrix,
+            formats: List[str]):
+
+        self.count_df = count_df
+        self.percent_id_mean_df = percent_id_mean_df
+        self.percent_id_std_df = percent_id_std_df
+        self.formats = formats
+
+        if len(self.formats) == 0:
+            return
+        check_output_formats(self.formats)
+
+        self.write_taxonomy()
+        for name, matrix in [
+            ('count-table', self.count_df),
+            ('percent-identity-mean', self.percent_id_mean_df),
+            ('percent-identity-std', self.percent_id_std_df),
+        ]:
+            codes = self.taxa.get_indexer(matrix.index)
+            prefix = f'{self.outdir}/{name}'
+            if PARQUET in self.formats:
+                self.write_parquet(matrix=matrix, codes=codes, path=prefix + SUFFIXES[PARQUET])
+            if HDF5 in self.formats:
+                self.write_hdf5(matrix=matrix, codes=codes, path=prefix + SUFFIXES[HDF5])
+            if BIOM in self.formats and matrix.fill_value == 0:  # BIOM omits zeros, not the NaN of percent identity
+                self.write_biom(matrix=matrix, codes=codes, path=prefix + SUFFIXES[BIOM])
+
+    def write_taxonomy(self):
+        self.taxa = self.count_df.index \
+            .append(self.percent_id_mean_df.index) \
+            .append(self.percent_id_std_df.index) \
+            .unique()
+        pd.DataFrame({
+            TAXON_CODE: np.arange(len(self.taxa)),
+            TAXON: self.taxa,
+        }).to_csv(f'{self.outdir}/{TAXONOMY_CSV}', index=False)
+
+    def chunks(self, matrix: TaxonMatrix):
+        for start in range(0, max(len(matrix), 1), self.ROWS_PER_CHUNK):
+            rows = slice(start, start + self.ROWS_PER_CHUNK)
+            yield rows, matrix.to_dataframe(rows=rows).to_numpy()
+
+    def write_parquet(self, matrix: TaxonMatrix, codes: np.ndarray, path: str):
+        self.logger.info(f'Write "{path}"')
+        schema = pyarrow.schema(
+            [(TAXON_CODE, pyarrow.int32())] + [(str(sample), pyarrow.float64()) for sample in matrix.columns])
+        with pyarrow_parquet.ParquetWriter(path, schema=schema, compression=self.PARQUET_COMPRESSION) as writer:
+            for rows, dense in self.chunks(matrix):
+                arrays = [pyarrow.array(codes[rows], type=pyarrow.int32())] + [
+                    pyarrow.array(dense[:, j], from_pandas=True)  # NaN as null
+                    for j in range(dense.shape[1])
+                ]
+                writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+
+    def write_hdf5(self, matrix: TaxonMatrix, codes: np.ndarray, path: str):
+        self.logger.info(f'Write "{path}"')
+        with h5py.File(path, 'w') as fh:
+            fh.create_dataset('taxon_codes', data=codes.astype(np.int32))
+            fh.create_dataset('samples', data=[str(s) for s in matrix.columns], dtype=h5py.string_dtype())
+            dataset = fh.create_dataset(
+                'values',
+                shape=matrix.shape,
+                dtype=np.float64,
+                chunks=tuple(max(1, min(c, n)) for c, n in zip(self.HDF5_CHUNK_SHAPE, matrix.shape)),
+                compression='gzip',
+                compression_opts=self.HDF5_COMPRESSION_LEVEL,
+                shuffle=True,
+                fillvalue=matrix.fill_value)
+            for rows, dense in self.chunks(matrix):
+                dataset[rows] = dense
+
+    def write_biom(self, matrix: TaxonMatrix, codes: np.ndarray, path: str):
+        """
+        https://biom-format.org/documentation/format_versions/biom-2.1.html
+        """
+        self.logger.info(f'Write "{path}"')
+        csr = matrix.values.copy()
+        csr.eliminate_zeros()
+        csc = csr.tocsc()
+
+        with h5py.File(path, 'w') as fh:
+            fh.attrs['id'] = 'microtaxa'
+            fh.attrs['type'] = 'OTU table'
+            fh.attrs['format-url'] = 'http://biom-format.org'
+            fh.attrs['format-version'] = (2, 1)
+            fh.attrs['generated-by'] = 'microtaxa'
+            fh.attrs['creation-date'] = datetime.now().isoformat()
+            fh.attrs['shape'] = matrix.shape
+            fh.attrs['nnz'] = csr.nnz
+
+            for axis, ids, compressed in [
+                ('observation', [str(c) for c in codes], csr),
+                ('sample', [str(s) for s in matrix.columns], csc),
+            ]:
+                group = fh.create_group(axis)
+                group.create_dataset('ids', data=ids, dtype=h5py.string_dtype(), compression='gzip')
+                group.create_dataset('matrix/data', data=compressed.data.astype(np.float64), compression='gzip')
+                group.create_dataset('matrix/indices', data=compressed.indices.astype(np.int32), compression='gzip')
+                group.create_dataset('matrix/indptr', data=compressed.indptr.astype(np.int32), compression='gzip')
+                group.create_group('metadata')
+                group.create_group('group-metadata')
+
+
+def read_taxon_table(fpath: str, samples: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Taxon x sample table indexed by TAXON_CODE from a Parquet or HDF5 file of WriteTaxonTables,
+    only the columns of `samples` are read if given
+    """
+    assert samples is None or len(set(samples)) == len(samples), f'Duplicated samples in {list(samples)}'
+    if fpath.endswith(SUFFIXES[PARQUET]):
+        check_output_formats([PARQUET])
+        columns = None if samples is None else [TAXON_CODE] + list(samples)
+        return pyarrow_parquet.read_table(fpath, columns=columns).to_pandas().set_index(TAXON_CODE)
+
+    check_output_formats([HDF5])
+    with h5py.File(fpath, 'r') as fh:
+        all_samples = pd.Index(fh['samples'].asstr()[:])
+        columns = np.arange(len(all_samples)) if samples is None else all_samples.get_indexer(samples)
+        assert np.all(columns >= 0), f'Samples {list(samples)} not all in {fpath}'
+        order = np.argsort(columns)  # h5py reads increasing positions
+        values = np.empty((fh['values'].shape[0], len(columns)), dtype=np.float64)
+        values[:, order] = fh['values'][:, columns[order]]
+        return pd.DataFrame(
+            values,
+            index=pd.Index(fh['taxon_codes'][:], name=TAXON_CODE),
+            columns=all_samples[columns],
+            copy=False)
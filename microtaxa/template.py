@@ -1,6 +1,8 @@
 import subprocess
 from abc import ABC
+from copy import copy
 from datetime import datetime
+from .codec_names import PARALLEL_GZIP
 
 
 class Settings:
@@ -11,6 +13,7 @@ class Settings:
     debug: bool
     mock: bool
     for_publication: bool
+    intermediate_codec: str
 
     def __init__(
             self,
@@ -19,7 +22,11 @@ class Settings:
             threads: int,
             debug: bool,
             mock: bool,
-            for_publication: bool):
+            for_publication: bool,
+            intermediate_codec: str = PARALLEL_GZIP):
+        """
+        intermediate_codec: compression of fastq files in the workdir, see codec_names.CODECS
+        """
 
         self.workdir = workdir
         self.outdir = outdir
@@ -27,6 +34,12 @@ class Settings:
         self.debug = debug
         self.mock = mock
         self.for_publication = for_publication
+        self.intermediate_codec = intermediate_codec
+
+    def with_threads(self, threads: int) -> 'Settings':
+        settings = copy(self)
+        settings.threads = threads
+        return settings
 
 
 class Logger:
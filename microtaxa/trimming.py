@@ -1,7 +1,14 @@
 import os
 from os.path import basename
-from typing import Tuple
+from typing import Tuple, List
 from .template import Processor
+from .codec import NONE, codec_suffix
+from .read_trimmer import TrimReads
+
+
+TRIM_GALORE = 'trim_galore'
+NUMPY = 'numpy'  # built-in, read_trimmer.TrimReads
+TRIMMERS = [TRIM_GALORE, NUMPY]
 
 
 class TrimGalore(Processor):
@@ -12,6 +19,11 @@ class TrimGalore(Processor):
     MAX_N = 0
     CUTADAPT_TOTAL_CORES = 2
     # According to the help message of trim_galore, 2 cores for cutadapt -> actually up to 9 cores
+    THREADS_PER_CUTADAPT_CORE = 4
+    THREADS_PER_JOB = 9
+    BUILT_IN_THREADS_PER_JOB = 2  # one for trimming, one for compressing the output
+
+    trimmer: str
 
     dstdir: str
 
@@ -19,15 +31,41 @@ class TrimGalore(Processor):
         self.dstdir = f'{self.workdir}/{self.DSTDIR_NAME}'
         self.call(f'mkdir -p "{self.dstdir}"')
 
-    def move_fastqc_report(self):
+    def gzip_arg(self) -> str:
+        # trim_galore compresses with pigz over --cores if available, any codec other than NONE gives its own gzip
+        return '--dont_gzip' if self.settings.intermediate_codec == NONE else '--gzip'
+
+    def output_suffix(self) -> str:
+        return codec_suffix(self.settings.intermediate_codec)
+
+    def trim_reads(self, fqs: List[str], output_fqs: List[str], clips: List[int]):
+        TrimReads(self.settings).main(
+            fqs=fqs,
+            output_fqs=output_fqs,
+            clips=clips,
+            quality=self.QUALITY,
+            length=self.LENGTH,
+            max_n=self.MAX_N)
+
+    def cutadapt_cores(self) -> int:
+        cores = (self.threads - 1) // self.THREADS_PER_CUTADAPT_CORE
+        return max(1, min(cores, self.CUTADAPT_TOTAL_CORES))
+
+    def move_fastqc_report(self, fqs: List[str], trimmed_names: List[str]):
+        """
+        Moves only the files trim_galore writes for this sample, other samples may be running in the same dstdir:
+        FastQC reports of the trimmed fastqs, e.g. S1_trimmed_fastqc.html or S1_R1_val_1_fastqc.html,
+        and the trimming reports of the input fastqs, e.g. S1.fastq.gz_trimming_report.txt
+        """
         dstdir = f'{self.outdir}/fastqc'
         os.makedirs(dstdir, exist_ok=True)
-        for suffix in [
-            'fastqc.html',
-            'fastqc.zip',
-            'trimming_report.txt'
-        ]:
-            self.call(f'mv {self.dstdir}/*{suffix} "{dstdir}/"')
+        for fq, trimmed_name in zip(fqs, trimmed_names):
+            for fname in [
+                f'{trimmed_name}_fastqc.html',
+                f'{trimmed_name}_fastqc.zip',
+                f'{basename(fq)}_trimming_report.txt',
+            ]:
+                self.call(f'mv "{self.dstdir}/{fname}" "{dstdir}/"')
 
 
 class TrimGalorePairedEnd(TrimGalore):
@@ -45,18 +83,32 @@ class TrimGalorePairedEnd(TrimGalore):
             fq1: str,
             fq2: str,
             clip_r1_5_prime: int,
-            clip_r2_5_prime: int) -> Tuple[str, str]:
+            clip_r2_5_prime: int,
+            trimmer: str = TRIM_GALORE) -> Tuple[str, str]:
 
         self.fq1 = fq1
         self.fq2 = fq2
         self.clip_r1_5_prime = clip_r1_5_prime
         self.clip_r2_5_prime = clip_r2_5_prime
+        self.trimmer = trimmer
+        assert self.trimmer in TRIMMERS, f'Unknown trimmer "{self.trimmer}", choose from {TRIMMERS}'
 
         self.make_dstdir()
-        self.execute()
-        self.move_fastqc_report()
         self.set_out_fq1()
         self.set_out_fq2()
+        if self.trimmer == NUMPY:
+            self.trim_reads(
+                fqs=[self.fq1, self.fq2],
+                output_fqs=[self.out_fq1, self.out_fq2],
+                clips=[self.clip_r1_5_prime, self.clip_r2_5_prime])
+        else:
+            self.execute()
+            self.move_fastqc_report(
+                fqs=[self.fq1, self.fq2],
+                trimmed_names=[
+                    f'{self.__strip_file_extension(basename(self.fq1))}_val_1',
+                    f'{self.__strip_file_extension(basename(self.fq2))}_val_2',
+                ])
 
         return self.out_fq1, self.out_fq2
 
@@ -66,13 +118,13 @@ class TrimGalorePairedEnd(TrimGalore):
             '--paired',
             f'--quality {self.QUALITY}',
             '--phred33',
-            f'--cores {self.CUTADAPT_TOTAL_CORES}',
+            f'--cores {self.cutadapt_cores()}',
             f'--fastqc_args "--threads {self.threads}"',
             '--illumina',
             f'--length {self.LENGTH}',
             f'--max_n {self.MAX_N}',
             '--trim-n',
-            '--gzip',
+            self.gzip_arg(),
             f'--output_dir {self.dstdir}'
         ]
 
@@ -95,12 +147,12 @@ class TrimGalorePairedEnd(TrimGalore):
     def set_out_fq1(self):
         f = basename(self.fq1)
         f = self.__strip_file_extension(f)
-        self.out_fq1 = f'{self.dstdir}/{f}_val_1.fq.gz'
+        self.out_fq1 = f'{self.dstdir}/{f}_val_1.fq{self.output_suffix()}'
 
     def set_out_fq2(self):
         f = basename(self.fq2)
         f = self.__strip_file_extension(f)
-        self.out_fq2 = f'{self.dstdir}/{f}_val_2.fq.gz'
+        self.out_fq2 = f'{self.dstdir}/{f}_val_2.fq{self.output_suffix()}'
 
     def __strip_file_extension(self, f):
         for suffix in [
@@ -121,14 +173,21 @@ class TrimGaloreSingleEnd(TrimGalore):
 
     out_fq: str
 
-    def main(self, fq: str, clip_5_prime: int) -> str:
+    def main(self, fq: str, clip_5_prime: int, trimmer: str = TRIM_GALORE) -> str:
         self.fq = fq
         self.clip_5_prime = clip_5_prime
+        self.trimmer = trimmer
+        assert self.trimmer in TRIMMERS, f'Unknown trimmer "{self.trimmer}", choose from {TRIMMERS}'
 
         self.make_dstdir()
-        self.execute()
-        self.move_fastqc_report()
         self.set_out_fq()
+        if self.trimmer == NUMPY:
+            self.trim_reads(fqs=[self.fq], output_fqs=[self.out_fq], clips=[self.clip_5_prime])
+        else:
+            self.execute()
+            self.move_fastqc_report(
+                fqs=[self.fq],
+                trimmed_names=[f'{self.__strip_file_extension(basename(self.fq))}_trimmed'])
 
         return self.out_fq
 
@@ -137,13 +196,13 @@ class TrimGaloreSingleEnd(TrimGalore):
             'trim_galore',
             f'--quality {self.QUALITY}',
             '--phred33',
-            f'--cores {self.CUTADAPT_TOTAL_CORES}',
+            f'--cores {self.cutadapt_cores()}',
             f'--fastqc_args "--threads {self.threads}"',
             '--illumina',
             f'--length {self.LENGTH}',
             f'--max_n {self.MAX_N}',
             '--trim-n',
-            '--gzip',
+            self.gzip_arg(),
             f'--output_dir {self.dstdir}',
         ]
 
@@ -162,7 +221,7 @@ class TrimGaloreSingleEnd(TrimGalore):
     def set_out_fq(self):
         f = basename(self.fq)
         f = self.__strip_file_extension(f)
-        self.out_fq = f'{self.dstdir}/{f}_trimmed.fq.gz'
+        self.out_fq = f'{self.dstdir}/{f}_trimmed.fq{self.output_suffix()}'
 
     def __strip_file_extension(self, f):
         for suffix in [
@@ -1,11 +1,38 @@
 import os
-from typing import Optional, Tuple
+import gzip
+import hashlib
+import numpy as np
+from abc import ABC, abstractmethod
+from itertools import islice
+from typing import Optional, Tuple, List, Iterator, BinaryIO
 
 
-class FastaParser:
+BLOCK_SIZE = 2**22
+
+
+def open_sequence_file(fpath: str) -> BinaryIO:
+    """
+    Opens plain or gzipped (including multi-member, e.g. concatenated .gz) files for binary reading,
+    gzip is detected by its magic number but not the file extension
+    """
+    with open(fpath, 'rb') as fh:
+        is_gzip = fh.read(2) == b'\x1f\x8b'
+    return gzip.open(fpath, 'rb') if is_gzip else open(fpath, 'rb')
+
+
+class SequenceParser(ABC):
+    """
+    Block-buffered reader of plain or gzipped sequence files
+
+    Iteration yields records as tuples of str, other modes:
+        headers()       header lines only, without '>' or '@'
+        count()         number of records, without building any record
+        batches(size)   bytes arrays, one array per field, `size` records at a time
+    """
 
     def __init__(self, file: str):
-        self.__fasta = open(file, 'r')
+        self.__fh = open_sequence_file(file)
+        self.__records = None
 
     def __enter__(self):
         return self
@@ -15,7 +42,8 @@ class FastaParser:
         return
 
     def __iter__(self):
-        self.__fasta.seek(0)
+        self.__rewind()
+        self.__records = self.iter_records()
         return self
 
     def __next__(self):
@@ -25,32 +53,168 @@ class FastaParser:
         else:  # r is None
             raise StopIteration
 
-    def next(self) -> Optional[Tuple[str, str]]:
+    def next(self) -> Optional[Tuple[str, ...]]:
         """
-        Returns the next read of the fasta file
+        Returns the next record of the file
         If it reaches the end of the file, return None
         """
-        header = self.__fasta.readline().rstrip()[1:]
-        if header == '':
-            return None
+        if self.__records is None:
+            self.__records = self.iter_records()
+        return next(self.__records, None)
 
-        seq_lines = []
+    def blocks(self) -> Iterator[bytes]:
+        self.__rewind()
+        for block in iter(lambda: self.__fh.read(BLOCK_SIZE), b''):
+            yield block
+
+    def batches(self, size: int) -> Iterator[Tuple[np.ndarray, ...]]:
+        """
+        Fields are not decoded but zero-padded in fixed-width bytes arrays (dtype 'S'),
+        so a batch of sequences is a uint8 matrix by `seqs.view(np.uint8).reshape(len(seqs), -1)`
+        """
+        records = self.raw_records()
         while True:
-            pos = self.__fasta.tell()
-            line = self.__fasta.readline().rstrip()
+            batch = list(islice(records, size))
+            if len(batch) == 0:
+                return
+            yield tuple(np.array(field, dtype=np.bytes_) for field in zip(*batch))
 
-            if line.startswith('>'):
-                self.__fasta.seek(pos)
-                return header, ''.join(seq_lines)
+    def iter_records(self) -> Iterator[Tuple[str, ...]]:
+        for record in self.raw_records():
+            yield tuple(field.decode() for field in record)
 
-            end_of_file = line == ''
-            if end_of_file:
-                return header, ''.join(seq_lines)
+    @abstractmethod
+    def raw_records(self) -> Iterator[Tuple[bytes, ...]]:
+        """
+        Records as tuples of bytes, headers without '>' or '@'
+        """
+        pass
 
-            seq_lines.append(line)
+    @abstractmethod
+    def headers(self) -> Iterator[str]:
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+    def __rewind(self):
+        self.__fh.seek(0)
 
     def close(self):
-        self.__fasta.close()
+        self.__fh.close()
+
+
+class FastaParser(SequenceParser):
+    """
+    Records are (header, sequence), multi-line sequences are joined
+    """
+
+    def record_texts(self) -> Iterator[List[bytes]]:
+        """
+        Lists of whole record texts without the leading '>', split at every '>' starting a line
+        """
+        rest, first = b'', True
+        for block in self.blocks():
+            if first and block.startswith(b'>'):
+                block = block[1:]
+            first = False
+            texts = (rest + block).split(b'\n>')
+            rest = texts.pop()
+            yield texts
+        if rest.strip() != b'':
+            yield [rest]
+
+    def raw_records(self) -> Iterator[Tuple[bytes, bytes]]:
+        for texts in self.record_texts():
+            for text in texts:
+                header, _, seq = text.partition(b'\n')
+                yield header.rstrip(), b''.join(seq.split())
+
+    def iter_records(self) -> Iterator[Tuple[str, str]]:
+        for header, seq in self.raw_records():  # two fields, faster than the generic decoding
+            yield header.decode(), seq.decode()
+
+    def headers(self) -> Iterator[str]:
+        """
+        Finds header lines in each block without building sequences
+        """
+        rest = b'\n'  # as if a newline precedes the file
+        for block in self.blocks():
+            buffer = rest + block
+            pos = 0
+            while True:
+                start = buffer.find(b'\n>', pos)
+                if start == -1:
+                    rest = buffer[-1:]  # a newline here may precede a '>' in the next block
+                    break
+                end = buffer.find(b'\n', start + 2)
+                if end == -1:  # header continues in the next block
+                    rest = buffer[start:]
+                    break
+                yield buffer[start + 2:end].rstrip().decode()
+                pos = end
+        if rest.startswith(b'\n>'):  # header on the last line without newline
+            yield rest[2:].rstrip().decode()
+
+    def count(self) -> int:
+        n, previous = 0, b'\n'
+        for block in self.blocks():
+            n += block.count(b'\n>') + (previous == b'\n' and block.startswith(b'>'))
+            previous = block[-1:]
+        return n
+
+
+class FastqParser(SequenceParser):
+    """
+    Records are (header, sequence, quality) of four-line fastq
+    """
+
+    def record_lines(self) -> Iterator[List[bytes]]:
+        """
+        Lists of lines of whole records, four lines per record
+        """
+        rest = b''
+        for block in self.blocks():
+            lines = (rest + block).split(b'\n')
+            n = (len(lines) - 1) // 4 * 4  # the last line is always incomplete or empty
+            rest = b'\n'.join(lines[n:])
+            yield lines[:n]
+        lines = rest.rstrip(b'\n').split(b'\n')  # last record without trailing newline
+        if len(lines) >= 4:
+            yield lines[:4]
+
+    def raw_records(self) -> Iterator[Tuple[bytes, bytes, bytes]]:
+        for lines in self.record_lines():
+            for i in range(0, len(lines), 4):
+                yield lines[i][1:].rstrip(), lines[i + 1].rstrip(), lines[i + 3].rstrip()
+
+    def iter_records(self) -> Iterator[Tuple[str, str, str]]:
+        for lines in self.record_lines():
+            for i in range(0, len(lines), 4):
+                yield lines[i][1:].rstrip().decode(), lines[i + 1].rstrip().decode(), lines[i + 3].rstrip().decode()
+
+    def headers(self) -> Iterator[str]:
+        for lines in self.record_lines():
+            for header in lines[0::4]:
+                yield header[1:].rstrip().decode()
+
+    def count(self) -> int:
+        n, previous = 0, b'\n'
+        for block in self.blocks():
+            n += block.count(b'\n')
+            previous = block[-1:]
+        if previous != b'\n':  # last line without newline
+            n += 1
+        return n // 4
+
+
+def iter_fastq_records(fastq: str) -> Iterator[Tuple[bytes, bytes, bytes]]:
+    """
+    (header without '@', sequence, quality) as bytes of FastqParser.raw_records, the file stays open until exhausted
+    """
+    with FastqParser(fastq) as parser:
+        yield from parser.raw_records()
 
 
 def get_temp_path(
@@ -80,3 +244,18 @@ def edit_fpath(
         dstdir = os.path.dirname(fpath)
 
     return f'{dstdir}/{f}'
+
+
+def get_read_stats_json(fasta: str) -> str:
+    """
+    Sidecar file written next to each query fasta by FastqToFasta
+    """
+    return edit_fpath(fpath=fasta, old_suffix='.fasta', new_suffix='.read-stats.json')
+
+
+def file_digest(fpath: str, block_size: int = 2**20) -> str:
+    sha256 = hashlib.sha256()
+    with open(fpath, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
@@ -1,6 +1,7 @@
+import random
 import pandas as pd
 
-from microtaxa.aggregate import Aggregate
+from microtaxa.aggregate import Aggregate, ReadBlastTsv
 from .setup import TestCase
 
 
@@ -35,14 +36,62 @@ class TestMicroTaxa(TestCase):
         )
 
         self.assertDataFrameEqual(
-            count_df,
+            count_df.to_dataframe(),
             pd.read_csv(f'{self.indir}/count-table.csv', index_col=0)
         )
         self.assertDataFrameEqual(
-            percent_id_mean_df,
+            percent_id_mean_df.to_dataframe(),
             pd.read_csv(f'{self.indir}/percent-identity-mean.csv', index_col=0)
         )
         self.assertDataFrameEqual(
-            percent_id_std_df,
+            percent_id_std_df.to_dataframe(),
             pd.read_csv(f'{self.indir}/percent-identity-std.csv', index_col=0)
         )
+
+
+class TestReadBlastTsv(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        tsv = f'{self.workdir}/S1.tsv'
+        with open(tsv, 'w') as fh:
+            fh.write('1\tAB01.1.1500\t99.5\t250\t1\t0\t1\t250\t1\t250\t1e-100\t450\n')
+            fh.write('1\tAB02.1.1500\t98.0\t250\t5\t0\t1\t250\t1\t250\t1e-90\t400\n')
+            fh.write('2\tAB02.1.1500\t89.0\t250\t27\t0\t1\t250\t1\t250\t1e-50\t200\n')
+            fh.write('3\tAB03.1.1500\t100.0\t8\t0\t0\t1\t8\t1\t8\t0.0\tnan\n')
+
+        df = ReadBlastTsv(self.settings).main(tsv=tsv, min_percent_identity=90.0)
+
+        df = df.sort_values(by='Query ID').reset_index(drop=True)
+        self.assertListEqual(['1', '3'], df['Query ID'].tolist())  # IDs stay strings
+        self.assertListEqual(['AB01.1.1500', 'AB03.1.1500'], df['Subject ID'].tolist())
+        self.assertListEqual([99.5, 100.0], df['Percent Identity'].tolist())
+
+    def test_empty(self):
+        tsv = f'{self.workdir}/S1.tsv'
+        open(tsv, 'w').close()
+
+        df = ReadBlastTsv(self.settings).main(tsv=tsv, min_percent_identity=90.0)
+
+        self.assertListEqual(['Query ID', 'Subject ID', 'Percent Identity'], df.columns.tolist())
+        self.assertEqual(0, len(df))
+
+    def test_ties_are_reproducible(self):
+        lines = [f'Q{q}\tAB{s:02}.1.1500\t99.0\t250\t2\t0\t1\t250\t1\t250\t1e-100\t450\n' for q in range(100) for s in range(5)]
+
+        dfs = []
+        for seed in range(2):
+            random.Random(seed).shuffle(lines)  # row order does not matter
+            tsv = f'{self.workdir}/S{seed}.tsv'
+            with open(tsv, 'w') as fh:
+                fh.writelines(lines)
+            df = ReadBlastTsv(self.settings).main(tsv=tsv, min_percent_identity=90.0)
+            dfs.append(df.sort_values(by='Query ID').reset_index(drop=True))
+
+        self.assertDataFrameEqual(dfs[0], dfs[1])
+        self.assertGreater(dfs[0]['Subject ID'].nunique(), 1)  # ties are spread over subjects
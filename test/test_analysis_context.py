@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from microtaxa.matrix import TaxonMatrix
+from microtaxa.analysis_context import AnalysisContext, shorten_silva, add_suffix_to_duplicates
+from .setup import TestCase
+
+
+class TestAnalysisContext(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.sample_sheet = f'{self.workdir}/sample-sheet.csv'
+        pd.DataFrame({'Sample': ['S1', 'S2', 'S3'], 'Group': ['A', 'B', 'A']}).to_csv(self.sample_sheet, index=False)
+        self.count_df = pd.DataFrame(
+            data=[[3., 0., 1.], [1., 4., 3.], [0., 0., 0.]],
+            index=[
+                'AB01.1.1500 Bacteria;Bacillota;Streptococcus salivarius',
+                'AB02.1.1500 Bacteria;Bacillota;Streptococcus salivarius',
+                'AB03.1.1500',
+            ],
+            columns=['S1', 'S2', 'S3'])
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_abundance_table(self):
+        context = AnalysisContext(settings=self.settings, count_df=self.count_df, sample_sheet=self.sample_sheet)
+        expected = pd.DataFrame({
+            'Group': ['A', 'B', 'A'],
+            'AB01.1.1500 Streptococcus salivarius': [75., 0., 25.],
+            'AB02.1.1500 Streptococcus salivarius': [25., 100., 75.],
+            'AB03.1.1500': [0., 0., 0.],
+        }, index=['S1', 'S2', 'S3'])
+        self.assertDataFrameEqual(expected, context.abundance_table)
+
+    def test_views_are_computed_once(self):
+        context = AnalysisContext(settings=self.settings, count_df=self.count_df, sample_sheet=self.sample_sheet)
+        self.assertIs(context.abundance_table, context.abundance_table)
+        self.assertIs(context.log_pseudocount, context.log_pseudocount)
+        self.assertIsInstance(context.log_pseudocount, TaxonMatrix)
+        self.assertListEqual([np.log10(4), 0., np.log10(2)], context.log_pseudocount.to_dataframe().iloc[0].tolist())
+
+    def test_percent_identity_tables_stay_sparse(self):
+        std_df = pd.DataFrame(data=[[0., np.nan, np.nan]], index=['AB03.1.1500'], columns=['S1', 'S2', 'S3'])
+        context = AnalysisContext(
+            settings=self.settings,
+            count_df=self.count_df,
+            sample_sheet=self.sample_sheet,
+            percent_id_std_df=std_df)
+        self.assertEqual(1, context.percent_id_std_matrix.values.nnz)
+        self.assertDataFrameEqual(std_df, context.percent_id_std_matrix.to_dataframe())
+        self.assertIsNone(context.percent_id_mean_matrix)
+
+    def test_names(self):
+        self.assertEqual('AB01.1.1500 Streptococcus salivarius', shorten_silva(self.count_df.index[0]))
+        self.assertEqual('AB03.1.1500', shorten_silva('AB03.1.1500'))
+        self.assertListEqual(['a_1', 'b', 'a_2'], add_suffix_to_duplicates(['a', 'b', 'a']))
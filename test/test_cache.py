@@ -0,0 +1,91 @@
+import os
+from microtaxa.template import Processor
+from microtaxa.cache import StageCache
+from microtaxa.codec_names import NONE
+from microtaxa.parallel import SampleScheduler
+from .setup import TestCase
+
+
+class CopyUpper(Processor):
+
+    SUFFIX = '.upper.txt'
+
+    def main(self, txt: str) -> str:
+        output = f'{self.workdir}/{os.path.basename(txt)}{self.SUFFIX}'
+        with open(txt) as reader, open(output, 'w') as writer:
+            writer.write(reader.read().upper())
+        with open(f'{self.workdir}/runs.log', 'a') as fh:
+            fh.write(f'{txt}\n')
+        return output
+
+
+class TestStageCache(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.settings.threads = 1  # run jobs in order
+        self.txts = []
+        for name in ['a', 'b']:
+            txt = f'{self.workdir}/{name}.txt'
+            with open(txt, 'w') as fh:
+                fh.write(name)
+            self.txts.append(txt)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def run_scheduler(self):
+        return SampleScheduler(self.settings).main(
+            processor=CopyUpper,
+            kwargs_list=[{'txt': txt} for txt in self.txts],
+            threads_per_job=1)
+
+    def read_runs(self):
+        with open(f'{self.workdir}/runs.log') as fh:
+            return fh.read().splitlines()
+
+    def test_resume(self):
+        first = self.run_scheduler()
+        second = self.run_scheduler()
+        self.assertListEqual(first, second)
+        self.assertListEqual(self.txts, self.read_runs())
+
+    def test_stale_input(self):
+        self.run_scheduler()
+        with open(self.txts[1], 'w') as fh:
+            fh.write('c')
+        self.run_scheduler()
+        self.assertListEqual(self.txts + [self.txts[1]], self.read_runs())
+
+    def test_missing_output(self):
+        outputs = self.run_scheduler()
+        os.remove(outputs[0])
+        self.run_scheduler()
+        self.assertListEqual(self.txts + [self.txts[0]], self.read_runs())
+
+    def test_key_changes_with_constants(self):
+        cache = StageCache(workdir=self.workdir)
+        key_1 = cache.key(CopyUpper, {'txt': self.txts[0]}, self.settings)
+        CopyUpper.SUFFIX = '.upper.text'
+        try:
+            key_2 = cache.key(CopyUpper, {'txt': self.txts[0]}, self.settings)
+        finally:
+            CopyUpper.SUFFIX = '.upper.txt'
+        self.assertNotEqual(key_1, key_2)
+
+    def test_key_of_relative_path(self):
+        cache = StageCache(workdir=self.workdir)
+        relative = os.path.relpath(self.txts[0])
+        self.assertEqual(
+            cache.key(CopyUpper, {'txt': self.txts[0]}, self.settings),
+            cache.key(CopyUpper, {'txt': f'.{os.sep}{relative}'}, self.settings))
+
+    def test_key_changes_with_settings(self):
+        cache = StageCache(workdir=self.workdir)
+        key_1 = cache.key(CopyUpper, {'txt': self.txts[0]}, self.settings)
+        self.settings.intermediate_codec = NONE
+        key_2 = cache.key(CopyUpper, {'txt': self.txts[0]}, self.settings)
+        self.settings.threads = 8  # does not change outputs
+        key_3 = cache.key(CopyUpper, {'txt': self.txts[0]}, self.settings)
+        self.assertNotEqual(key_1, key_2)
+        self.assertEqual(key_2, key_3)
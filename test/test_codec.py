@@ -0,0 +1,41 @@
+import gzip
+from unittest.mock import patch
+from microtaxa.codec import WriteIntermediate, ParallelGzipWriter, CODECS, NONE, PARALLEL_GZIP, is_gzip
+from .setup import TestCase
+
+
+class TestWriteIntermediate(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.text = b''.join(b'@r%d\nACGTACGT\n+\nIIIIIIII\n' % i for i in range(1000))
+        self.fastq = f'{self.workdir}/S1.fastq'
+        with open(self.fastq, 'wb') as fh:
+            fh.write(self.text)
+        self.fastq_gz = f'{self.workdir}/S1.fastq.gz'
+        with gzip.open(self.fastq_gz, 'wb') as fh:
+            fh.write(self.text)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_codecs(self):
+        for codec in CODECS:
+            self.settings.intermediate_codec = codec
+            for src in [self.fastq, self.fastq_gz]:
+                dst = f'{self.workdir}/out.fastq'
+                WriteIntermediate(self.settings).main(src=src, dst=dst)
+                self.assertEqual(codec != NONE, is_gzip(dst))
+                with gzip.open(dst) if is_gzip(dst) else open(dst, 'rb') as fh:
+                    self.assertEqual(self.text, fh.read())
+
+    def test_parallel_gzip_members(self):
+        self.settings.intermediate_codec = PARALLEL_GZIP
+        dst = f'{self.workdir}/out.fastq.gz'
+        with patch.object(ParallelGzipWriter, 'BLOCK_SIZE', 1000):  # many members
+            WriteIntermediate(self.settings).main(src=self.fastq, dst=dst, move=True)
+
+        with gzip.open(dst) as fh:
+            self.assertEqual(self.text, fh.read())
+        with open(dst, 'rb') as fh:
+            self.assertGreater(fh.read().count(b'\x1f\x8b\x08'), 10)
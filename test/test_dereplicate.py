@@ -0,0 +1,38 @@
+import pandas as pd
+from microtaxa.dereplicate import Dereplicate
+from .setup import TestCase
+
+
+class TestDereplicate(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        fastas = []
+        for sample_id, text in [
+            ('S01', '>r1\nACGT\n>r2\nACGT\n>r3\nGGCC\n'),
+            ('S02', '>r1\nGGCC\n>r2\nTTTT\n>r3\nGGCC\n'),
+        ]:
+            fa = f'{self.workdir}/{sample_id}.fasta'
+            with open(fa, 'w') as fh:
+                fh.write(text)
+            fastas.append(fa)
+
+        unique_fasta, abundance_tsv = Dereplicate(self.settings).main(fastas=fastas)
+
+        with open(unique_fasta) as fh:
+            self.assertEqual('>U1\nACGT\n>U2\nGGCC\n>U3\nTTTT\n', fh.read())
+
+        expected = pd.DataFrame(
+            [
+                ('U1', 'S01', 2),
+                ('U2', 'S01', 1),
+                ('U2', 'S02', 2),
+                ('U3', 'S02', 1),
+            ],
+            columns=['Query ID', 'Sample ID', 'Count'])
+        self.assertDataFrameEqual(expected, pd.read_csv(abundance_tsv, sep='\t'))
@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 
 from microtaxa.differential_abundance import DifferentialAbundance
@@ -25,3 +26,45 @@ class TestDifferentialAbundance(TestCase):
             sample_sheet=f'{self.indir}/sample-sheet.csv',
             colors=[(0.2, 0.5, 0.7, 1.0), (0.9, 0.1, 0.1, 1.0)],
         )
+
+
+class TestBoxplotOptions(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        samples = [f'S{i}' for i in range(8)]
+        pd.DataFrame({'Sample': samples, 'Group': ['A'] * 4 + ['B'] * 4}).to_csv(
+            f'{self.workdir}/sample-sheet.csv', index=False)
+        self.count_df = pd.DataFrame(
+            data=[
+                [90, 80, 95, 85, 1, 2, 3, 4],  # different
+                [10, 20, 5, 15, 9, 8, 7, 6],
+                [1, 1, 1, 1, 1, 1, 1, 1],
+            ],
+            index=['T1', 'T2', 'T3'],
+            columns=samples)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_max_p_value_pdf(self):
+        DifferentialAbundance(self.settings).main(
+            count_df=self.count_df,
+            sample_sheet=f'{self.workdir}/sample-sheet.csv',
+            colors=[(0.2, 0.5, 0.7, 1.0), (0.9, 0.1, 0.1, 1.0)],
+            boxplot_max_p_value=0.05,
+            boxplot_pdf=True)
+        dstdir = f'{self.outdir}/differential-abundance/A-B'
+        self.assertTrue(os.path.exists(f'{dstdir}/boxplots.pdf'))
+        self.assertTrue(os.path.exists(f'{dstdir}/Mann-Whitney-U.csv'))
+
+    def test_top_n(self):
+        DifferentialAbundance(self.settings).main(
+            count_df=self.count_df,
+            sample_sheet=f'{self.workdir}/sample-sheet.csv',
+            colors=[(0.2, 0.5, 0.7, 1.0), (0.9, 0.1, 0.1, 1.0)],
+            boxplot_top_n=1)
+        dstdir = f'{self.outdir}/differential-abundance/A-B'
+        top_taxon = pd.read_csv(f'{dstdir}/Mann-Whitney-U.csv')['Taxon'][0]
+        pngs = [f for f in os.listdir(dstdir) if f.endswith('.png')]
+        self.assertListEqual([f'{top_taxon}.png'], pngs)
@@ -0,0 +1,90 @@
+import random
+import pandas as pd
+from microtaxa.aggregate import ReadBlastTsv
+from microtaxa.exact_match import ExactMatch
+from microtaxa.microtaxa import Glsearch
+from .setup import TestCase
+
+
+class TestExactMatch(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.ref_fa = f'{self.workdir}/reference.fasta'
+        with open(self.ref_fa, 'w') as fh:
+            fh.write('>R1 Bacteria;A\nCCTAGGUACGUACGUAAGCAGTT\n')  # RNA, as in SILVA
+            fh.write('>R2 Bacteria;B\nCCTAGGTACGTACGTAAGCAGTT\n')  # identical to R1
+            fh.write('>R3 Bacteria;C\nCCTCGGTTTTGGGGAAGCTGAA\n')
+        self.query_fa = f'{self.workdir}/unique-sequences.fasta'
+        with open(self.query_fa, 'w') as fh:
+            fh.write('>U1\nCCTAGGTACGTACGTAAGCAGTT\n')
+            fh.write('>U2\nTACGTACGTA\n')
+            fh.write('>U3\nTTTTGGGG\n')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_full_length(self):
+        hits_tsv, unresolved_fa = ExactMatch(self.settings).main(
+            query_fa=self.query_fa,
+            ref_fa=self.ref_fa)
+
+        df = ReadBlastTsv(self.settings).main(tsv=hits_tsv, min_percent_identity=100.)
+        self.assertListEqual(['U1'], df['Query ID'].tolist())
+        self.assertIn(df.loc[0, 'Subject ID'], ['R1', 'R2'])
+
+        with open(unresolved_fa) as fh:
+            self.assertEqual('>U2\nTACGTACGTA\n>U3\nTTTTGGGG\n', fh.read())
+
+    def test_amplicon_region(self):
+        hits_tsv, unresolved_fa = ExactMatch(self.settings).main(
+            query_fa=self.query_fa,
+            ref_fa=self.ref_fa,
+            forward_primer='CCTMGG',  # M = A or C
+            reverse_primer='WCAGCTT')  # reverse complement AAGCTGW, W = A or T
+
+        with open(hits_tsv) as fh:
+            self.assertEqual('U3\tR3\t100.0\t8\t0\t0\t1\t8\t1\t8\t0.0\tnan\n', fh.read())
+
+        with open(unresolved_fa) as fh:
+            self.assertEqual('>U1\nCCTAGGTACGTACGTAAGCAGTT\n>U2\nTACGTACGTA\n', fh.read())
+
+
+class TestExactMatchVersusGlsearch(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        random.seed(0)
+        x, y, a, b, c, d, e = [''.join(random.choices('ACGT', k=k)) for k in [80, 60, 30, 30, 25, 25, 150]]
+        self.ref_fa = f'{self.workdir}/reference.fasta'
+        with open(self.ref_fa, 'w') as fh:
+            fh.write(f'>R1 Bacteria;A\n{x}\n')
+            fh.write(f'>R2 Bacteria;B\n{x}\n')  # identical to R1
+            fh.write(f'>R3 Bacteria;C\n{a}{x}{b}\n')  # contains X
+            fh.write(f'>R4 Bacteria;D\n{a}{y}{b}\n')  # contains Y
+            fh.write(f'>R5 Bacteria;E\n{c}{y}{d}\n')  # contains Y
+            fh.write(f'>R6 Bacteria;F\n{e}\n')
+        self.query_fa = f'{self.workdir}/unique-sequences.fasta'
+        with open(self.query_fa, 'w') as fh:
+            fh.write(f'>U1\n{x}\n')
+            fh.write(f'>U2\n{y}\n')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def ties(self, tsvs) -> dict:
+        df = pd.concat([pd.read_csv(tsv, sep='\t', header=None, names=ReadBlastTsv.COLUMNS) for tsv in tsvs])
+        df = df[df['Percent Identity'] == 100.]
+        return df.groupby('Query ID')['Subject ID'].apply(set).to_dict()
+
+    def test_tie_sets(self):
+        glsearch_tsv = Glsearch(self.settings).main(query_fa=self.query_fa, library_fa=self.ref_fa, e_value=10.)
+        glsearch_ties = self.ties([glsearch_tsv])
+        self.assertDictEqual({'U1': {'R1', 'R2', 'R3'}, 'U2': {'R4', 'R5'}}, glsearch_ties)
+
+        hits_tsv, unresolved_fa = ExactMatch(self.settings).main(query_fa=self.query_fa, ref_fa=self.ref_fa)
+        unresolved_tsv = Glsearch(self.settings).main(query_fa=unresolved_fa, library_fa=self.ref_fa, e_value=10.)
+        ties = self.ties([hits_tsv, unresolved_tsv])
+
+        self.assertSetEqual(glsearch_ties['U2'], ties['U2'])  # substring only, left to glsearch
+        self.assertSetEqual({'R1', 'R2'}, ties['U1'])  # identical references only, R3 contains U1 but is not a tie
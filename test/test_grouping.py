@@ -0,0 +1,46 @@
+import pandas as pd
+from microtaxa.grouping import SampleSheet, AddGroupColumn, TagGroupNamesOnSampleColumns, GetColors
+from .setup import TestCase
+
+
+class TestSampleSheet(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.sample_sheet = f'{self.workdir}/sample-sheet.csv'
+        pd.DataFrame({'Sample': ['S1', 'S2', 'S3'], 'Group': ['B', 'A', 'B']}).to_csv(self.sample_sheet, index=False)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_sample_sheet(self):
+        sheet = SampleSheet(self.sample_sheet)
+        self.assertListEqual(['S1', 'S2', 'S3'], sheet.sample_ids)
+        self.assertListEqual(['B', 'A'], list(sheet.groups))
+        self.assertListEqual(['[B] S1', 'X', '[B] S3'], sheet.tag_group_names(['S1', 'X', 'S3']))
+
+    def test_duplicated_sample_ids(self):
+        pd.DataFrame({'Sample': ['S1', 'S1'], 'Group': ['A', 'B']}).to_csv(self.sample_sheet, index=False)
+        with self.assertRaises(AssertionError):
+            SampleSheet(self.sample_sheet)
+
+    def test_add_group_column(self):
+        df = pd.DataFrame({'T1': [1, 2, 3]}, index=['S3', 'S1', 'S4'])
+        for sample_sheet in [self.sample_sheet, SampleSheet(self.sample_sheet)]:
+            actual = AddGroupColumn(self.settings).main(df=df, sample_sheet=sample_sheet)
+            expected = pd.DataFrame({'Group': ['B', 'B', 'None'], 'T1': [1, 2, 3]}, index=['S3', 'S1', 'S4'])
+            self.assertDataFrameEqual(expected, actual)
+        self.assertListEqual(['T1'], list(df.columns))  # input unchanged
+
+    def test_tag_group_names_on_sample_columns(self):
+        df = pd.DataFrame({'S2': [1], 'S1': [2]}, index=['T1'])
+        actual = TagGroupNamesOnSampleColumns(self.settings).main(df=df, sample_sheet=SampleSheet(self.sample_sheet))
+        self.assertListEqual(['[A] S2', '[B] S1'], list(actual.columns))
+        self.assertListEqual(['S2', 'S1'], list(df.columns))
+
+    def test_get_colors(self):
+        colors = GetColors(self.settings).main(
+            sample_sheet=SampleSheet(self.sample_sheet),
+            colormap='red,blue',
+            invert_colors=True)
+        self.assertListEqual([(0., 0., 1., 1.), (1., 0., 0., 1.)], colors)
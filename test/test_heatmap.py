@@ -1,5 +1,9 @@
+import os
 import pandas as pd
-from microtaxa.heatmap import PlotHeatmaps, PlotOneHeatmap
+from microtaxa.matrix import TaxonMatrix
+from microtaxa.normalization import CLR
+from microtaxa.analysis_context import AnalysisContext
+from microtaxa.heatmap import PlotHeatmaps, PlotOneHeatmap, top_taxa, select_taxa, MEAN_ABUNDANCE, PREVALENCE
 from .setup import TestCase
 
 
@@ -38,3 +42,63 @@ class TestPlotOneHeatmap(TestCase):
             normalize_by_sample_reads=False,
             output_fname='log-pseudocount',
         )
+
+
+class TestLargeMatrix(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        samples = ['S1', 'S2', 'S3']
+        pd.DataFrame({'Sample': samples, 'Group': ['A', 'A', 'B']}).to_csv(
+            f'{self.workdir}/sample-sheet.csv', index=False)
+        self.count_df = pd.DataFrame(
+            data=[[50, 0, 0], [10, 10, 10], [1, 2, 1], [39, 88, 89]],
+            index=['T1', 'T2', 'T3', 'T4'],
+            columns=samples)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_top_taxa(self):
+        self.assertListEqual(['T4', 'T1'], top_taxa(self.count_df, n=2, rank_by=MEAN_ABUNDANCE))
+        self.assertListEqual(['T4', 'T2'], top_taxa(self.count_df, n=2, rank_by=PREVALENCE))
+        matrix = TaxonMatrix.from_dataframe(self.count_df)
+        self.assertListEqual(['T4', 'T1'], top_taxa(matrix, n=2, rank_by=MEAN_ABUNDANCE))
+        self.assertListEqual(['T1', 'T4'], list(select_taxa(matrix, taxa=['T4', 'T1']).index))  # original order
+
+        others = self.count_df.rename(index={'T4': 'Others'})
+        self.assertListEqual(['T1', 'T2', 'Others'], top_taxa(others, n=2, rank_by=MEAN_ABUNDANCE))  # not ranked
+
+    def test_main(self):
+        matrix = TaxonMatrix.from_dataframe(self.count_df)
+        PlotHeatmaps(self.settings).main(
+            count_df=matrix,
+            percent_id_mean_df=matrix,
+            percent_id_std_df=matrix,
+            sample_sheet=f'{self.workdir}/sample-sheet.csv',
+            large_matrix=True,
+            top_n=3)
+        df = pd.read_csv(f'{self.outdir}/heatmap/log-pseudocount.tsv', sep='\t', index_col=0)
+        self.assertListEqual(['T1', 'T2', 'T4'], list(df.index))
+
+    def test_count_transform(self):
+        matrix = TaxonMatrix.from_dataframe(self.count_df)
+        PlotHeatmaps(self.settings).main(
+            count_df=matrix,
+            percent_id_mean_df=matrix,
+            percent_id_std_df=matrix,
+            sample_sheet=f'{self.workdir}/sample-sheet.csv',
+            large_matrix=True,
+            top_n=2,
+            count_transform=CLR)
+        df = pd.read_csv(f'{self.outdir}/heatmap/clr.tsv', sep='\t', index_col=0)
+        self.assertListEqual(['T1', 'T4'], list(df.index))
+
+    def test_without_percent_identity(self):
+        context = AnalysisContext(
+            settings=self.settings,
+            count_df=self.count_df,
+            sample_sheet=f'{self.workdir}/sample-sheet.csv')
+        PlotHeatmaps(self.settings).main(context=context, large_matrix=True, top_n=2)
+        self.assertTrue(os.path.exists(f'{self.outdir}/heatmap/log-pseudocount.tsv'))
+        self.assertFalse(os.path.exists(f'{self.outdir}/heatmap/percent-identity-mean.tsv'))
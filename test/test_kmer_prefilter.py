@@ -0,0 +1,41 @@
+import random
+from microtaxa.kmer_prefilter import sampled_kmers, KmerPrefilter
+from .setup import TestCase
+
+
+class TestKmerPrefilter(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        random.seed(0)
+        self.refs = [''.join(random.choices('ACGT', k=300)) for _ in range(5)]
+        self.ref_fa = f'{self.workdir}/reference.fasta'
+        with open(self.ref_fa, 'w') as fh:
+            for i, seq in enumerate(self.refs):
+                fh.write(f'>R{i} Bacteria;Taxon{i}\n{seq}\n')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_sampled_kmers(self):
+        codes, seq_indices = sampled_kmers(['ACGTACGTACGTNACGTACGTACGT', 'ACGTACGTACGT'], k=12, sampling=1)
+        self.assertListEqual([0, 1], seq_indices.tolist())  # no window spans N, unique per sequence
+        self.assertListEqual([0b000110110001101100011011] * 2, codes.tolist())  # ACGTACGTACGT
+
+    def test_main(self):
+        query = list(self.refs[3][20:280])
+        for i in range(0, len(query), 25):  # 4% mismatches
+            query[i] = 'A' if query[i] != 'A' else 'C'
+
+        query_fa = f'{self.workdir}/shard-001.fasta'
+        with open(query_fa, 'w') as fh:
+            fh.write(f'>U1\n{"".join(query)}\n')
+
+        library_fas, n_refs = KmerPrefilter(self.settings).main(
+            query_fas=[query_fa],
+            ref_fa=self.ref_fa,
+            top_k=1)
+
+        self.assertEqual(5, n_refs)
+        with open(library_fas[0]) as fh:
+            self.assertEqual(f'>R3 Bacteria;Taxon3\n{self.refs[3]}\n', fh.read())
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from microtaxa.matrix import TaxonMatrix
+from .setup import TestCase
+
+
+class TestTaxonMatrix(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.count_df = pd.DataFrame(
+            data=[[3., 0., 1.], [0., 0., 2.], [5., 0., 0.]],
+            index=['AB01.1.1500', 'AB02.1.1500', 'AB03.1.1500'],
+            columns=['S1', 'S2', 'S3'])
+        self.std_df = pd.DataFrame(
+            data=[[0., np.nan, np.nan], [np.nan, np.nan, 1.5]],
+            index=['AB01.1.1500', 'AB02.1.1500'],
+            columns=['S1', 'S2', 'S3'])
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_from_dataframe(self):
+        matrix = TaxonMatrix.from_dataframe(self.count_df)
+        self.assertEqual(4, matrix.values.nnz)  # zeros not stored
+        self.assertDataFrameEqual(self.count_df, matrix.to_dataframe())
+        self.assertDataFrameEqual(self.count_df.iloc[[2, 0]], matrix.to_dataframe(rows=[2, 0]))
+
+    def test_to_transposed_dataframe(self):
+        matrix = TaxonMatrix.from_dataframe(self.std_df, fill_value=np.nan)
+        self.assertDataFrameEqual(self.std_df.transpose(), matrix.to_transposed_dataframe())
+
+    def test_nan_fill_value(self):
+        matrix = TaxonMatrix.from_dataframe(self.std_df, fill_value=np.nan)
+        self.assertEqual(2, matrix.values.nnz)  # a std of 0 is stored, NaN is not
+        self.assertDataFrameEqual(self.std_df, matrix.to_dataframe())
+        self.assertListEqual([0., 0., 1.5], matrix.column_sums().tolist())
+
+    def test_normalization(self):
+        matrix = TaxonMatrix.from_dataframe(self.count_df)
+        matrix = matrix.append_row(label='Others', row=np.array([2., 0., 1.]))
+        self.assertListEqual([10., 0., 4.], matrix.column_sums().tolist())
+
+        matrix = matrix.divide_columns(np.array([10., 1., 4.])).log10_pseudocount()
+        expected = np.log10(pd.DataFrame(
+            data=[[.3, 0., .25], [0., 0., .5], [.5, 0., 0.], [.2, 0., .25]],
+            index=['AB01.1.1500', 'AB02.1.1500', 'AB03.1.1500', 'Others'],
+            columns=['S1', 'S2', 'S3']) + 1)
+        self.assertDataFrameEqual(expected, matrix.to_dataframe())
+
+    def test_to_csv(self):
+        matrix = TaxonMatrix.from_dataframe(self.count_df).rename(index={'AB02.1.1500': 'AB02.1.1500 Bacteria'})
+        matrix.ROWS_PER_CSV_CHUNK = 2
+        matrix.to_csv(f'{self.outdir}/count-table.csv')
+
+        self.count_df.rename(index={'AB02.1.1500': 'AB02.1.1500 Bacteria'}).to_csv(f'{self.outdir}/expected.csv')
+        self.assertFileEqual(f'{self.outdir}/expected.csv', f'{self.outdir}/count-table.csv')
@@ -1,4 +1,4 @@
-from microtaxa.merge import MergePairedEndReads
+from microtaxa.merge import MergePairedEndReads, NUMPY
 from .setup import TestCase
 
 
@@ -23,3 +23,11 @@ class TestMergePairedEndReads(TestCase):
             fastq_pair=(f'{self.indir}/R1.fastq.gz', f'{self.indir}/R2.fastq.gz')
         )
         self.assertFileExists(f'{self.workdir}/merged-fastq/S01.fastq.gz', merged_fq)
+
+    def test_paired_end_numpy(self):
+        merged_fq = MergePairedEndReads(self.settings).main(
+            sample_id='S01',
+            fastq_pair=(f'{self.indir}/R1.fastq.gz', f'{self.indir}/R2.fastq.gz'),
+            merger=NUMPY
+        )
+        self.assertFileExists(f'{self.workdir}/merged-fastq/S01.fastq.gz', merged_fq)
@@ -1,4 +1,7 @@
-from microtaxa.microtaxa import MicroTaxa
+import gzip
+import json
+import random
+from microtaxa.microtaxa import MicroTaxa, FastqToFasta, Glsearch
 from .setup import TestCase
 
 
@@ -24,3 +27,73 @@ class TestMicroTaxa(TestCase):
             colormap='viridis',
             invert_colors=False
         )
+
+
+class TestFastqToFasta(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        fastq = f'{self.workdir}/S01.fastq.gz'
+        with gzip.open(fastq, 'wb') as fh:  # two gzip members
+            fh.write(b'@read1 1:N\nACGTACGT\n+\nIIIIIIII\n@read2\nACG\n+\nIII\n')
+        with gzip.open(fastq, 'ab') as fh:
+            fh.write(b'@read3\nACGTA\n+\n@@@@@')  # no trailing newline
+
+        FastqToFasta.BLOCK_SIZE = 16  # records split across blocks
+        try:
+            actual = FastqToFasta(self.settings).main(fastq=fastq)
+        finally:
+            FastqToFasta.BLOCK_SIZE = 2**24
+
+        self.assertFileExists(f'{self.workdir}/fasta/S01.fasta', actual)
+        with open(actual) as fh:
+            self.assertEqual('>read1 1:N\nACGTACGT\n>read2\nACG\n>read3\nACGTA\n', fh.read())
+
+        with open(f'{self.workdir}/fasta/S01.read-stats.json') as fh:
+            stats = json.load(fh)
+        self.assertEqual(3, stats['Read Count'])
+        self.assertEqual(16, stats['Base Count'])
+        self.assertEqual(3, stats['Min Length'])
+        self.assertEqual(8, stats['Max Length'])
+
+
+class TestGlsearch(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        random.seed(0)
+        seqs = [''.join(random.choice('ACGT') for _ in range(200)) for _ in range(20)]
+        self.library_fa = f'{self.workdir}/library.fasta'
+        with open(self.library_fa, 'w') as fh:
+            for i, seq in enumerate(seqs):
+                fh.write(f'>R{i}\n{seq}\n')
+        self.query_fa = f'{self.workdir}/query.fasta'
+        with open(self.query_fa, 'w') as fh:
+            for i, seq in enumerate(seqs * 3):
+                fh.write(f'>Q{i}\n{seq[i % 50:i % 50 + 120]}\n')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_sharding_is_identical(self):
+        self.settings.threads = 1
+        unsharded_tsv = Glsearch(self.settings).main(
+            query_fa=self.query_fa,
+            library_fa=self.library_fa,
+            e_value=1e-10)
+        with open(unsharded_tsv) as fh:
+            expected = fh.read()
+
+        self.settings.threads = 4
+        sharded_tsv = Glsearch(self.settings).main(
+            query_fa=self.query_fa,
+            library_fa=self.library_fa,
+            e_value=1e-10,
+            threads_per_worker=1)
+        with open(sharded_tsv) as fh:
+            self.assertEqual(expected, fh.read())
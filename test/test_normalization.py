@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+from microtaxa.matrix import TaxonMatrix
+from microtaxa.normalization import CountNormalization, TRANSFORMS, RELATIVE_ABUNDANCE, CPM, CLR, VST, LOG_PSEUDOCOUNT
+from .setup import TestCase
+
+
+class TestCountNormalization(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.count_df = pd.DataFrame(
+            data=[[3, 0, 1], [1, 0, 3], [0, 0, 4]],
+            index=['T1', 'T2', 'T3'],
+            columns=['S1', 'S2', 'S3'])
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_flags(self):
+        actual = CountNormalization(self.settings).main(
+            df=self.count_df,
+            log_pseudocount=True,
+            by_sample_reads=True,
+            sample_reads_unit=100)
+        expected = np.log10(self.count_df / self.count_df.sum().replace(0, 1) * 100 + 1)  # S2 without reads stays 0
+        self.assertDataFrameEqual(expected, actual)
+
+    def test_transforms(self):
+        counts = self.count_df[['S1', 'S3']].to_numpy(dtype=np.float64)
+        ln = np.log(counts + 0.5)
+        expected = {
+            RELATIVE_ABUNDANCE: counts / counts.sum(axis=0),
+            CPM: counts / counts.sum(axis=0) * 1e6,
+            CLR: ln - ln.mean(axis=0),
+            VST: np.log2(counts / counts.sum(axis=0) * 1e6 + 0.5),
+            LOG_PSEUDOCOUNT: np.log10(counts + 0.5),
+        }
+        for transform in TRANSFORMS:
+            actual = CountNormalization(self.settings).main(
+                df=self.count_df[['S1', 'S3']],
+                transform=transform,
+                pseudocount=0.5)
+            np.testing.assert_allclose(expected[transform], actual.to_numpy())
+
+    def test_sparse_equals_dense(self):
+        matrix = TaxonMatrix.from_dataframe(self.count_df)
+        for transform in TRANSFORMS:
+            dense = CountNormalization(self.settings).main(df=self.count_df, transform=transform, pseudocount=0.5)
+            actual = CountNormalization(self.settings).main(df=matrix, transform=transform, pseudocount=0.5)
+            if transform != CLR:
+                self.assertIsInstance(actual, TaxonMatrix)
+                self.assertTrue(np.shares_memory(matrix.values.indices, actual.values.indices))  # sparsity structure shared
+                actual = actual.to_dataframe()
+            np.testing.assert_allclose(dense.to_numpy(), actual.to_numpy())  # S2 without reads stays 0
+
+    def test_float32_out_buffer(self):
+        values = np.array(self.count_df, dtype=np.float32)
+        actual = CountNormalization(self.settings).main(df=values, transform=CPM, out=values)
+        self.assertIs(values, actual)  # in place
+        self.assertEqual(np.float32, actual.dtype)
+        self.assertAlmostEqual(750000., float(actual[0, 0]), places=1)
+
+        matrix = CountNormalization(self.settings).main(
+            df=TaxonMatrix.from_dataframe(self.count_df),
+            transform=LOG_PSEUDOCOUNT,
+            dtype=np.float32)
+        self.assertEqual(np.float32, matrix.values.dtype)
+        self.assertEqual(np.float32, matrix.to_dataframe().dtypes.iloc[0])
+
+    def test_transform_and_flags(self):
+        with self.assertRaises(AssertionError):
+            CountNormalization(self.settings).main(df=self.count_df, log_pseudocount=True, transform=CLR)
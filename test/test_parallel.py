@@ -0,0 +1,43 @@
+from microtaxa.template import Processor
+from microtaxa.parallel import SampleScheduler
+from .setup import TestCase
+
+
+class EchoThreads(Processor):
+
+    def main(self, sample_id: str) -> str:
+        return f'{sample_id}:{self.threads}'
+
+
+class TestSampleScheduler(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_split_threads(self):
+        self.settings.threads = 8
+        actual = SampleScheduler(self.settings).main(
+            processor=EchoThreads,
+            kwargs_list=[{'sample_id': f'S{i:02}'} for i in range(10)],
+            threads_per_job=2)
+        expected = [f'S{i:02}:2' for i in range(10)]
+        self.assertListEqual(expected, actual)
+
+    def test_fewer_samples_than_jobs(self):
+        self.settings.threads = 8
+        actual = SampleScheduler(self.settings).main(
+            processor=EchoThreads,
+            kwargs_list=[{'sample_id': 'S01'}, {'sample_id': 'S02'}],
+            threads_per_job=1)
+        self.assertListEqual(['S01:4', 'S02:4'], actual)
+
+    def test_single_job(self):
+        self.settings.threads = 4
+        actual = SampleScheduler(self.settings).main(
+            processor=EchoThreads,
+            kwargs_list=[{'sample_id': 'S01'}, {'sample_id': 'S02'}],
+            threads_per_job=9)
+        self.assertListEqual(['S01:4', 'S02:4'], actual)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import mannwhitneyu
+from microtaxa.rank_tests import GroupedMannWhitneyU, dense_ranks
+from .setup import TestCase
+
+
+class TestGroupedMannWhitneyU(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_dense_ranks(self):
+        values = np.array([[0.5, 2.], [0., 2.], [0.5, np.nan], [0.1, 1.]])
+        self.assertListEqual([[2, 1], [0, 1], [2, 2], [1, 0]], dense_ranks(values).tolist())
+
+    def test_same_as_scipy(self):
+        rng = np.random.default_rng(0)
+        for n_per_group in [3, 12]:  # exact and asymptotic p values
+            groups = np.repeat(['A', 'B', 'C'], n_per_group)
+            values = np.where(rng.random((len(groups), 100)) < .5, 0, rng.integers(0, 5, (len(groups), 100)))
+            values = values.astype(np.float64)
+            values[:, :20] = rng.random((len(groups), 20))  # no ties
+            values[1, 5] = np.nan
+
+            mann_whitney_u = GroupedMannWhitneyU(values=values, groups=groups)
+            for group_1, group_2 in [('A', 'B'), ('C', 'A')]:
+                statistics, pvalues = mann_whitney_u.test(group_1=group_1, group_2=group_2)
+                for j in range(values.shape[1]):
+                    expected = mannwhitneyu(x=values[groups == group_1, j], y=values[groups == group_2, j])
+                    np.testing.assert_equal(expected.statistic, statistics[j])
+                    np.testing.assert_equal(expected.pvalue, pvalues[j])
+
+                expected_means = [pd.Series(values[groups == group_1, j]).mean() for j in range(values.shape[1])]
+                np.testing.assert_equal(expected_means, mann_whitney_u.means(group_1))
+
+    def test_empty_group(self):
+        values = np.array([[1., 2.], [3., 0.]])
+        mann_whitney_u = GroupedMannWhitneyU(values=values, groups=np.array(['A', 'A']))
+        for group_1, group_2 in [('A', 'B'), ('B', 'A')]:  # B has no rows
+            statistics, pvalues = mann_whitney_u.test(group_1=group_1, group_2=group_2)
+            self.assertTrue(np.isnan(statistics).all())
+            self.assertTrue(np.isnan(pvalues).all())
+        self.assertTrue(np.isnan(mann_whitney_u.means('B')).all())
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from microtaxa.matrix import TaxonMatrix
+from microtaxa.rarefaction import Rarefy
+from .setup import TestCase
+
+
+class TestRarefy(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.count_df = pd.DataFrame(
+            data=[[10, 5, 0], [30, 0, 40], [0, 1, 0], [60, 9, 60]],
+            index=['T1', 'T2', 'T3', 'T4'],
+            columns=['S1', 'S2', 'S3'])
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        draws = Rarefy(self.settings).main(count_df=self.count_df, depth=20, n_draws=3, seed=1)
+        self.assertEqual(3, len(draws))
+        original = self.count_df[['S1', 'S3']].to_numpy()
+        for draw in draws:
+            self.assertIsInstance(draw, TaxonMatrix)
+            self.assertListEqual(['S1', 'S3'], list(draw.columns))  # S2 with 15 reads dropped
+            self.assertListEqual([20., 20.], draw.column_sums().tolist())
+            dense = draw.to_dataframe().to_numpy()
+            self.assertTrue(np.all(dense <= original))
+            self.assertTrue(np.all(dense[original == 0] == 0))
+
+    def test_seed(self):
+        draws_1 = Rarefy(self.settings).main(count_df=self.count_df, depth=20, n_draws=2, seed=1)
+        draws_2 = Rarefy(self.settings).main(count_df=self.count_df, depth=20, n_draws=2, seed=1)
+        for draw_1, draw_2 in zip(draws_1, draws_2):
+            self.assertDataFrameEqual(draw_1.to_dataframe(), draw_2.to_dataframe())
+
+    def test_expected_counts(self):
+        draws = Rarefy(self.settings).main(count_df=self.count_df, depth=20, n_draws=2000, seed=0)
+        mean = np.mean([draw.to_dataframe()['S1'].to_numpy() for draw in draws], axis=0)
+        np.testing.assert_allclose([2., 6., 0., 12.], mean, atol=0.2)  # 20 of 100 reads
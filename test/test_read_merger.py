@@ -0,0 +1,83 @@
+import os
+import random
+from microtaxa.codec import NONE
+from microtaxa.utils import iter_fastq_records
+from microtaxa.read_merger import MergeReadPairs, CompareMergedReads
+from .setup import TestCase
+
+
+def reverse_complement(seq: str) -> str:
+    return seq[::-1].translate(str.maketrans('ACGT', 'TGCA'))
+
+
+class TestMergeReadPairs(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        random.seed(0)
+        self.amplicons = [''.join(random.choices('ACGT', k=k)) for k in [150, 180, 300]]
+        self.fq1 = f'{self.workdir}/R1.fastq'
+        self.fq2 = f'{self.workdir}/R2.fastq'
+        with open(self.fq1, 'w') as fh1, open(self.fq2, 'w') as fh2:
+            for i, amplicon in enumerate(self.amplicons):
+                fh1.write(f'@P{i} 1:N:0\n{amplicon[:100]}\n+\n{"I" * 100}\n')
+                fh2.write(f'@P{i} 2:N:0\n{reverse_complement(amplicon)[:100]}\n+\n{"5" * 100}\n')
+        self.settings.intermediate_codec = NONE
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        n_pairs, n_merged = MergeReadPairs(self.settings).main(
+            fq1=self.fq1,
+            fq2=self.fq2,
+            output_fastq=f'{self.outdir}/merged.fastq',
+            min_overlap=10)
+
+        self.assertEqual((3, 2), (n_pairs, n_merged))  # the 300-bp amplicon does not overlap
+        records = list(iter_fastq_records(f'{self.outdir}/merged.fastq'))
+        self.assertListEqual([b'P0 1:N:0', b'P1 1:N:0'], [header for header, _, _ in records])
+        self.assertListEqual([a.encode() for a in self.amplicons[:2]], [seq for _, seq, _ in records])
+        self.assertEqual(b'I' * 100 + b'5' * 50, records[0][2])  # overlap keeps the higher quality
+
+    def test_mismatch_takes_higher_quality(self):
+        seq1 = list(self.amplicons[0][:100])
+        seq1[80] = 'A' if seq1[80] != 'A' else 'C'  # in the 50-bp overlap
+        qual1 = 'I' * 80 + '#' + 'I' * 19
+        with open(self.fq1, 'w') as fh:
+            fh.write(f'@P0\n{"".join(seq1)}\n+\n{qual1}\n')
+
+        MergeReadPairs(self.settings).main(
+            fq1=self.fq1, fq2=self.fq2, output_fastq=f'{self.outdir}/merged.fastq', min_overlap=10)
+
+        _, seq, qual = next(iter_fastq_records(f'{self.outdir}/merged.fastq'))
+        self.assertEqual(self.amplicons[0].encode(), seq)
+        self.assertEqual(ord('5') - ord('#') + 33, qual[80])
+
+
+class TestCompareMergedReads(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        for name, records in [
+            ('pear', [('P0', 'ACGT'), ('P1', 'AAAA'), ('P2', 'CCCC')]),
+            ('numpy', [('P0', 'ACGT'), ('P1', 'AAAT'), ('P3', 'GGGG')]),
+        ]:
+            with open(f'{self.workdir}/{name}.fastq', 'w') as fh:
+                for header, seq in records:
+                    fh.write(f'@{header}\n{seq}\n+\nIIII\n')
+
+        df = CompareMergedReads(self.settings).main(
+            sample_id='S01',
+            pear_fastq=f'{self.workdir}/pear.fastq',
+            numpy_fastq=f'{self.workdir}/numpy.fastq')
+
+        row = df.iloc[0]
+        self.assertEqual((3, 3, 2, 1), (row['PEAR Merged'], row['NumPy Merged'], row['Both Merged'], row['Identical Merged Sequence']))
+        self.assertAlmostEqual(1 / 4, row['Agreement'])
+        self.assertTrue(os.path.exists(f'{self.outdir}/read-merger-validation/S01.csv'))
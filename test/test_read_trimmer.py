@@ -0,0 +1,83 @@
+import numpy as np
+from microtaxa.codec import NONE
+from microtaxa.utils import iter_fastq_records
+from microtaxa.read_merger import to_matrix
+from microtaxa.read_trimmer import TrimReads
+from .setup import TestCase
+
+
+def cutadapt_quality_trim_index(qual: bytes, cutoff: int) -> int:
+    s, max_s, max_i = 0, 0, len(qual)
+    for i in reversed(range(len(qual))):
+        s += cutoff - (qual[i] - 33)
+        if s < 0:
+            break
+        if s > max_s:
+            max_s, max_i = s, i
+    return max_i
+
+
+class TestTrimReads(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.settings.intermediate_codec = NONE
+        self.trimmer = TrimReads(self.settings)
+        self.trimmer.quality = 20
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_quality_trim_ends(self):
+        rng = np.random.default_rng(0)
+        quals = [bytes(rng.choice([35, 45, 55, 65, 73], size=rng.integers(0, 30)).tolist()) for _ in range(1000)]
+        width = max(map(len, quals))
+        actual = self.trimmer.quality_trim_ends(
+            qualities=to_matrix(quals, width=width, right_align=False),
+            lengths=np.array([len(q) for q in quals]))
+        expected = [cutadapt_quality_trim_index(q, cutoff=20) for q in quals]
+        self.assertListEqual(expected, actual.tolist())
+
+    def test_adapter_starts(self):
+        seqs = [
+            b'ACGTACGTAGATCGGAAGAGCTTT',  # full adapter
+            b'ACGTACGTAGATCGGTAGAGCTTT',  # 1 mismatch in 13 bp
+            b'ACGTACGTACGAGATC',  # partial at the 3' end
+            b'ACGTACGTACGTC',  # none
+        ]
+        width = max(map(len, seqs))
+        actual = self.trimmer.adapter_starts(
+            bases=to_matrix(seqs, width=width, right_align=False),
+            lengths=np.array([len(s) for s in seqs]))
+        self.assertListEqual([8, 8, 11, 13], actual.tolist())
+
+    def test_main(self):
+        with open(f'{self.workdir}/R1.fastq', 'w') as fh1, open(f'{self.workdir}/R2.fastq', 'w') as fh2:
+            fh1.write(f'@P0\nNACGTACGTACGTACGTACGTACGTAGATCGGAAGAGC\n+\n{"I" * 38}\n')
+            fh2.write('@P0\nTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT\n+\nIIIIIIIIIIIIIIIIIIIIIIIIIIIIII\n')
+            fh1.write('@P1\nACGTACGTACGTACGTACGTACGTACGT\n+\nIIIIIIIIIIIIIIIIIIIIIIIIIIII\n')
+            fh2.write('@P1\nTTTTTTTTTTTTTTTTTTTTTTTTTTTT\n+\nIIIIIIIIIIIIIII#############\n')  # too short after quality trimming
+
+        n_reads, n_kept = self.trimmer.main(
+            fqs=[f'{self.workdir}/R1.fastq', f'{self.workdir}/R2.fastq'],
+            output_fqs=[f'{self.outdir}/R1_val_1.fq', f'{self.outdir}/R2_val_2.fq'],
+            clips=[1, 0],
+            quality=20,
+            length=20,
+            max_n=0)
+
+        self.assertEqual((2, 1), (n_reads, n_kept))
+        r1 = list(iter_fastq_records(f'{self.outdir}/R1_val_1.fq'))
+        self.assertListEqual([(b'P0', b'CGTACGTACGTACGTACGTACGT', b'I' * 23)], r1)  # flanking N, adapter and 1 bp clipped
+
+    def test_malformed_record(self):
+        with open(f'{self.workdir}/R1.fastq', 'w') as fh:
+            fh.write('@P0\nACGTACGTACGTACGTACGTACGT\n+\nIIIIIIIIIIIIIIIIIIIIIII\n')  # 24 bases, 23 qualities
+        with self.assertRaises(AssertionError):
+            self.trimmer.main(
+                fqs=[f'{self.workdir}/R1.fastq'],
+                output_fqs=[f'{self.outdir}/R1_trimmed.fq'],
+                clips=[0],
+                quality=20,
+                length=20,
+                max_n=0)
@@ -0,0 +1,61 @@
+import os
+import json
+from unittest.mock import patch
+from microtaxa.reference_index import BuildReferenceIndex, ReferenceIndex, find_reference_index
+from .setup import TestCase
+
+
+class TestReferenceIndex(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.ref_fa = f'{self.workdir}/reference.fasta'
+        with open(self.ref_fa, 'w') as fh:
+            fh.write('>AY188352.1.1546 Bacteria;Bacillota;Streptococcus salivarius\nACGT\nAC\n')
+            fh.write('>KX0001.1.1400 Bacteria;Pseudomonadota;Escherichia coli\nGGGG\n')
+            fh.write('>AB0002.1.1500 Bacteria;Bacillota;Streptococcus salivarius\nTT\n')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        index_dir = BuildReferenceIndex(self.settings).main(ref_fa=self.ref_fa)
+        self.assertEqual(index_dir, find_reference_index(self.ref_fa))
+
+        index = ReferenceIndex(index_dir)
+        self.assertEqual(3, len(index))
+        self.assertListEqual([1, -1, 0], index.indices(['KX0001.1.1400', 'KX0001', 'AY188352.1.1546']).tolist())
+        self.assertEqual('AB0002.1.1500 Bacteria;Bacillota;Streptococcus salivarius', index.header(2))
+        self.assertEqual(index.taxonomy(0), index.taxonomy(2))
+        self.assertEqual('ACGTAC', index.sequence(0))
+        self.assertEqual('GGGG', index.sequence(1))
+        self.assertListEqual([6, 4, 2], index.sequence_lengths.tolist())
+        self.assertDictEqual(
+            {'KX0001.1.1400': 'KX0001.1.1400 Bacteria;Pseudomonadota;Escherichia coli'},
+            index.subject_id_to_header(['KX0001.1.1400', 'Others']))
+
+    def test_no_index(self):
+        self.assertIsNone(find_reference_index(self.ref_fa))
+
+    def test_touched_ref_fa(self):
+        index_dir = BuildReferenceIndex(self.settings).main(ref_fa=self.ref_fa)
+        os.utime(self.ref_fa, ns=(1, 1))
+        self.assertEqual(index_dir, find_reference_index(self.ref_fa))  # hashed once
+        with open(f'{index_dir}/metadata.json') as fh:
+            self.assertEqual(1, json.load(fh)['mtime_ns'])
+        with patch('microtaxa.reference_index.file_digest', side_effect=AssertionError('hashed again')):
+            self.assertEqual(index_dir, find_reference_index(self.ref_fa))
+
+    def test_old_version(self):
+        index_dir = BuildReferenceIndex(self.settings).main(ref_fa=self.ref_fa)
+        with open(f'{index_dir}/metadata.json') as fh:
+            metadata = json.load(fh)
+        metadata['version'] = 0
+        with open(f'{index_dir}/metadata.json', 'w') as fh:
+            json.dump(metadata, fh)
+        self.assertIsNone(find_reference_index(self.ref_fa))
+
+    def test_empty_index_root(self):
+        os.makedirs(f'{self.ref_fa}.index')
+        with patch('microtaxa.reference_index.file_digest', side_effect=AssertionError('hashed')):
+            self.assertIsNone(find_reference_index(self.ref_fa))
@@ -0,0 +1,35 @@
+import os
+import pandas as pd
+from microtaxa.rendering import RenderFigures
+from microtaxa.differential_abundance import Boxplot
+from .setup import TestCase
+
+
+class TestRenderFigures(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        data = pd.DataFrame({
+            'Group': ['A', 'A', 'B', 'B'],
+            'T1': [1., 2., 3., 4.],
+            'T2': [4., 3., 2., 1.],
+        })
+        jobs = [
+            (Boxplot, {
+                'data': data[['Group', taxon]],
+                'x': 'Group',
+                'y': taxon,
+                'colors': ['red', 'blue'],
+                'title': taxon,
+                'dstdir': self.outdir,
+            })
+            for taxon in ['T1', 'T2']
+        ]
+        RenderFigures(self.settings).main(jobs=jobs)  # 4 threads, 2 processes
+        for taxon in ['T1', 'T2']:
+            self.assertTrue(os.path.exists(f'{self.outdir}/{taxon}.png'))
@@ -0,0 +1,78 @@
+import os
+import unittest
+import numpy as np
+import pandas as pd
+from microtaxa import table_formats
+from microtaxa.matrix import TaxonMatrix
+from microtaxa.table_formats import WriteTaxonTables, read_taxon_table, check_output_formats
+from .setup import TestCase
+try:
+    import biom
+except ImportError:  # optional, to validate BIOM output
+    biom = None
+
+
+class TestWriteTaxonTables(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.count_df = TaxonMatrix.from_dataframe(pd.DataFrame(
+            data=[[3., 0., 1.], [0., 0., 5.], [2., 4., 0.]],
+            index=['T1', 'T2', 'T3'],
+            columns=['S1', 'S2', 'S3']))
+        self.percent_id_mean_df = TaxonMatrix.from_dataframe(pd.DataFrame(
+            data=[[99.5, np.nan, 98.], [97., 100., np.nan]],
+            index=['T1', 'T3'],
+            columns=['S1', 'S2', 'S3']), fill_value=np.nan)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def write(self, formats):
+        WriteTaxonTables(self.settings).main(
+            count_df=self.count_df,
+            percent_id_mean_df=self.percent_id_mean_df,
+            percent_id_std_df=self.percent_id_mean_df,
+            formats=formats)
+
+    def assert_read_back(self, suffix: str):
+        taxonomy = pd.read_csv(f'{self.outdir}/taxonomy.csv', index_col='Taxon').squeeze('columns')
+        for name, matrix in [('count-table', self.count_df), ('percent-identity-mean', self.percent_id_mean_df)]:
+            expected = matrix.to_dataframe()[['S3', 'S1']]
+            expected.index = pd.Index(taxonomy[expected.index].to_numpy(), name='Taxon Code')
+            actual = read_taxon_table(f'{self.outdir}/{name}{suffix}', samples=['S3', 'S1'])
+            self.assertListEqual(['S3', 'S1'], actual.columns.tolist())
+            self.assertListEqual(expected.index.tolist(), actual.index.tolist())
+            np.testing.assert_array_equal(expected.to_numpy(), actual.to_numpy())  # NaN stays NaN
+
+    @unittest.skipUnless(table_formats.pyarrow is not None, 'pyarrow not installed')
+    def test_parquet(self):
+        self.write(formats=['parquet'])
+        self.assert_read_back(suffix='.parquet')
+
+    @unittest.skipUnless(table_formats.h5py is not None, 'h5py not installed')
+    def test_hdf5(self):
+        self.write(formats=['hdf5'])
+        self.assert_read_back(suffix='.h5')
+        with self.assertRaises(AssertionError):
+            read_taxon_table(f'{self.outdir}/count-table.h5', samples=['S1', 'S1'])
+
+    @unittest.skipUnless(table_formats.h5py is not None and biom is not None, 'h5py or biom-format not installed')
+    def test_biom(self):
+        self.write(formats=['biom'])
+        table = biom.load_table(f'{self.outdir}/count-table.biom')
+        self.assertListEqual(['S1', 'S2', 'S3'], list(table.ids(axis='sample')))
+        self.assertListEqual(['0', '1', '2'], list(table.ids(axis='observation')))
+        np.testing.assert_array_equal(self.count_df.to_dataframe().to_numpy(), table.matrix_data.toarray())
+        self.assertFalse(os.path.exists(f'{self.outdir}/percent-identity-mean.biom'))  # NaN is not zero
+
+    @unittest.skipUnless(table_formats.h5py is not None, 'h5py not installed')
+    def test_taxonomy(self):
+        self.write(formats=['hdf5'])
+        actual = pd.read_csv(f'{self.outdir}/taxonomy.csv')
+        expected = pd.DataFrame({'Taxon Code': [0, 1, 2], 'Taxon': ['T1', 'T2', 'T3']})
+        self.assertDataFrameEqual(expected, actual)
+
+    def test_unknown_format(self):
+        with self.assertRaises(AssertionError):
+            check_output_formats(['xlsx'])
@@ -1,4 +1,5 @@
-from microtaxa.trimming import TrimGaloreSingleEnd, TrimGalorePairedEnd
+import os
+from microtaxa.trimming import TrimGaloreSingleEnd, TrimGalorePairedEnd, NUMPY
 from .setup import TestCase
 
 
@@ -36,3 +37,64 @@ class TestTrimGalorePairedEnd(TestCase):
         )
         self.assertFileExists(f'{self.workdir}/trimmed-fastq/EPI-001_R1_val_1.fq.gz', fq1)
         self.assertFileExists(f'{self.workdir}/trimmed-fastq/EPI-001_R2_val_2.fq.gz', fq2)
+
+
+class TestBuiltInTrimmer(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        for read in ['R1', 'R2']:
+            with open(f'{self.workdir}/EPI-001_{read}.fastq', 'w') as fh:
+                fh.write(f'@P0 {read}\n{"ACGT" * 10}\n+\n{"I" * 40}\n')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_single_end(self):
+        actual = TrimGaloreSingleEnd(self.settings).main(
+            fq=f'{self.workdir}/EPI-001_R1.fastq',
+            clip_5_prime=1,
+            trimmer=NUMPY
+        )
+        self.assertFileExists(f'{self.workdir}/trimmed-fastq/EPI-001_R1_trimmed.fq.gz', actual)
+
+    def test_paired_end(self):
+        fq1, fq2 = TrimGalorePairedEnd(self.settings).main(
+            fq1=f'{self.workdir}/EPI-001_R1.fastq',
+            fq2=f'{self.workdir}/EPI-001_R2.fastq',
+            clip_r1_5_prime=1,
+            clip_r2_5_prime=1,
+            trimmer=NUMPY
+        )
+        self.assertFileExists(f'{self.workdir}/trimmed-fastq/EPI-001_R1_val_1.fq.gz', fq1)
+        self.assertFileExists(f'{self.workdir}/trimmed-fastq/EPI-001_R2_val_2.fq.gz', fq2)
+
+
+class TestMoveFastqcReport(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_prefix_of_another_sample(self):
+        trim_galore = TrimGaloreSingleEnd(self.settings)
+        trim_galore.make_dstdir()
+        fnames = {
+            sample: [
+                f'{sample}_trimmed_fastqc.html',
+                f'{sample}_trimmed_fastqc.zip',
+                f'{sample}.fastq.gz_trimming_report.txt',
+            ] for sample in ['S1', 'S10']
+        }
+        for sample in ['S1', 'S10']:
+            for fname in fnames[sample]:
+                open(f'{trim_galore.dstdir}/{fname}', 'w').close()
+
+        trim_galore.move_fastqc_report(fqs=[f'{self.indir}/S1.fastq.gz'], trimmed_names=['S1_trimmed'])
+        self.assertListEqual(sorted(fnames['S1']), sorted(os.listdir(f'{self.outdir}/fastqc')))
+        self.assertListEqual(sorted(fnames['S10']), sorted(os.listdir(trim_galore.dstdir)))
+
+        trim_galore.move_fastqc_report(fqs=[f'{self.indir}/S10.fastq.gz'], trimmed_names=['S10_trimmed'])
+        self.assertEqual(6, len(os.listdir(f'{self.outdir}/fastqc')))
@@ -0,0 +1,77 @@
+import gzip
+import numpy as np
+from microtaxa.utils import SequenceParser, FastaParser, FastqParser, iter_fastq_records
+from .setup import TestCase
+
+
+class TestFastaParser(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.text = '>AB01.1.1500 Bacteria;A\nACGT\nAC\n>AB02.1.1500 Bacteria;B\nGGGG\n>AB03.1.1500 Bacteria;C\nTT'
+        self.records = [
+            ('AB01.1.1500 Bacteria;A', 'ACGTAC'),
+            ('AB02.1.1500 Bacteria;B', 'GGGG'),
+            ('AB03.1.1500 Bacteria;C', 'TT'),
+        ]
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_plain(self):
+        fasta = f'{self.workdir}/reference.fasta'
+        with open(fasta, 'w') as fh:
+            fh.write(self.text)
+        self.assert_modes(fasta)
+
+    def test_multi_member_gzip(self):
+        fasta = f'{self.workdir}/reference.fasta.gz'
+        with open(fasta, 'wb') as fh:
+            fh.write(gzip.compress(self.text[:30].encode()))
+            fh.write(gzip.compress(self.text[30:].encode()))
+        self.assert_modes(fasta)
+
+    def assert_modes(self, fasta: str):
+        with FastaParser(fasta) as parser:
+            self.assertListEqual(self.records, list(parser))
+            self.assertListEqual([h for h, _ in self.records], list(parser.headers()))
+            self.assertEqual(3, parser.count())
+            batches = list(parser.batches(size=2))
+            self.assertListEqual(
+                [([b'AB01.1.1500 Bacteria;A', b'AB02.1.1500 Bacteria;B'], [b'ACGTAC', b'GGGG']), ([b'AB03.1.1500 Bacteria;C'], [b'TT'])],
+                [tuple(field.tolist() for field in batch) for batch in batches])
+            seqs = batches[0][1]
+            self.assertListEqual([b'ACGTAC', b'GGGG\0\0'], [bytes(row) for row in seqs.view(np.uint8).reshape(len(seqs), -1)])
+
+    def test_incomplete_parser(self):
+        class HeaderParser(SequenceParser):
+            def headers(self):
+                yield from []
+
+        with self.assertRaises(TypeError):  # abstract raw_records and count
+            HeaderParser(f'{self.workdir}/reference.fasta')
+
+
+class TestFastqParser(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        fastq = f'{self.workdir}/S1.fq.gz'
+        with gzip.open(fastq, 'wt') as fh:
+            fh.write('@r1 1:N:0\nACGT\n+\nIIII\n@r2 1:N:0\nGG\n+\n#I')  # no trailing newline
+
+        with FastqParser(fastq) as parser:
+            self.assertListEqual([('r1 1:N:0', 'ACGT', 'IIII'), ('r2 1:N:0', 'GG', '#I')], list(parser))
+            self.assertListEqual(['r1 1:N:0', 'r2 1:N:0'], list(parser.headers()))
+            self.assertEqual(2, parser.count())
+
+    def test_crlf(self):
+        fastq = f'{self.workdir}/S1.fq'
+        with open(fastq, 'wb') as fh:
+            fh.write(b'@r1 1:N:0\r\nACGT\r\n+\r\nIIII\r\n')
+        self.assertListEqual([(b'r1 1:N:0', b'ACGT', b'IIII')], list(iter_fastq_records(fastq)))